@@ -62,6 +62,9 @@ setup(
         'jinja2'          # BSD License
     ],
     extras_require={
+        'aio': [
+            'kubernetes_asyncio'  # Apache Software License
+        ],
         'dev': [
             'build',       # MIT License
             'flake8',      # MIT License
@@ -83,6 +86,8 @@ setup(
         'Topic :: Software Development :: Libraries :: Python Modules'
     ],
     scripts=[
-        'bin/mas-devops-db2-validate-config'
+        'bin/mas-devops-db2-validate-config',
+        'bin/mas-devops-db2-watch-config',
+        'bin/mas-devops-launch-pipelines'
     ]
 )
@@ -9,3 +9,31 @@
 # *****************************************************************************
 
 __version__ = "100.0.0"
+
+# The submodules are only imported when first used (e.g. mas.devops.tekton after "import mas.devops"), most of them
+# depend on the kubernetes and openshift clients, which are slow to import
+_SUBMODULES = [
+    "aio",
+    "clusterfacts",
+    "db2",
+    "db2watch",
+    "discovery",
+    "informer",
+    "mas",
+    "multicluster",
+    "ocp",
+    "pipelinerun",
+    "session",
+    "tekton",
+]
+
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        import importlib
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list:
+    return sorted(list(globals()) + _SUBMODULES)
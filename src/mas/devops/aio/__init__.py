@@ -0,0 +1,21 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+"""
+Asyncio equivalents of the mas.devops APIs, built on kubernetes_asyncio, so that many concurrent waits and launches
+cost coroutines rather than threads.  Install with the "aio" extra:
+
+    pip install mas-devops[aio]
+"""
+
+try:
+    import kubernetes_asyncio  # noqa: F401
+except ImportError as e:
+    raise ImportError("mas.devops.aio requires kubernetes_asyncio, install it using: pip install mas-devops[aio]") from e
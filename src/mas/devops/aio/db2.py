@@ -0,0 +1,166 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import asyncio
+import logging
+
+from time import perf_counter
+
+from kubernetes_asyncio import client
+from kubernetes_asyncio.stream import WsApiClient
+
+from ..db2 import (
+    check_captured_cfg, db2_batched_cfg_commands, db2_batched_cfg_script, db2_pod_name, get_db2u_instance_cr_databases,
+    get_db2u_instance_target, new_db2_validation_result, raise_db2_validation_failures, read_batched_cfg_output,
+    record_timing, summarize_db2_validation_results
+)
+from .ocp import execInPod
+
+logger = logging.getLogger(__name__)
+
+
+async def get_db2u_instance_cr(custom_objects_api: client.CustomObjectsApi, mas_instance_id: str, mas_app_id: str) -> dict:
+    cr_name = f"db2wh-{mas_instance_id}-{mas_app_id}"
+    namespace = f"db2u-{mas_instance_id}"
+    logger.debug(f"Getting Db2uInstance CR {cr_name} in {namespace}")
+
+    return await custom_objects_api.get_namespaced_custom_object(
+        group="db2u.databases.ibm.com",
+        version="v1",
+        namespace=namespace,
+        plural="db2uinstances",
+        name=cr_name
+    )
+
+
+async def db2_pod_exec(core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str, command: list) -> str:
+    return await execInPod(core_v1_api, db2_pod_name(mas_instance_id, mas_app_id), f"db2u-{mas_instance_id}", command)
+
+
+async def db2_pod_exec_batched_cfg(core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str, db_names: list) -> dict:
+    """
+    Capture the db2 configuration using a single exec in the Db2 pod, see mas.devops.db2.db2_pod_exec_batched_cfg
+    """
+    commands = db2_batched_cfg_commands(db_names)
+    output = await db2_pod_exec(core_v1_api, mas_instance_id, mas_app_id, ["su", "-lc", db2_batched_cfg_script(commands), "db2inst1"])
+    return read_batched_cfg_output(output, commands, db_names)
+
+
+async def db2_pod_exec_cfg(core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str, db_names: list) -> dict:
+    """
+    Capture the db2 configuration (in the same form as db2_pod_exec_batched_cfg) running each db2 command in its own
+    exec, all at the same time
+    """
+    commands = [["su", "-lc", "db2 get dbm cfg", "db2inst1"], ["su", "-lc", "db2set", "db2inst1"]]
+    commands.extend(["su", "-lc", f"db2 get db cfg for {db_name}", "db2inst1"] for db_name in db_names)
+    outputs = await asyncio.gather(*[db2_pod_exec(core_v1_api, mas_instance_id, mas_app_id, command) for command in commands])
+    return {
+        "dbm": outputs[0],
+        "registry": outputs[1],
+        "db": dict(zip(db_names, outputs[2:]))
+    }
+
+
+async def run_db2_config_validation(k8s_client: client.ApiClient, mas_instance_id: str, mas_app_id: str, batch: bool = True) -> dict:
+    """
+    Run the db, dbm and registry cfg checks for a Db2uInstance without raising on failures, see
+    mas.devops.db2.run_db2_config_validation.  With batch the configuration is captured using a single exec, otherwise
+    every db2 command is run in its own exec, concurrently.
+    """
+    result = new_db2_validation_result(mas_instance_id, mas_app_id)
+    validation_start = perf_counter()
+
+    start = perf_counter()
+    db2u_instance_cr = await get_db2u_instance_cr(client.CustomObjectsApi(k8s_client), mas_instance_id, mas_app_id)
+    record_timing(result, "get", "Db2uInstance CR", start)
+
+    db_names = [cr_db["name"] for cr_db in get_db2u_instance_cr_databases(db2u_instance_cr)]
+    start = perf_counter()
+    async with WsApiClient(configuration=k8s_client.configuration) as ws_client:
+        core_v1_api = client.CoreV1Api(api_client=ws_client)
+        if batch:
+            cfg_pod = await db2_pod_exec_batched_cfg(core_v1_api, mas_instance_id, mas_app_id, db_names)
+        else:
+            cfg_pod = await db2_pod_exec_cfg(core_v1_api, mas_instance_id, mas_app_id, db_names)
+    record_timing(result, "exec", "batched db2 cfg capture" if batch else "db2 cfg capture", start)
+
+    # The configuration has already been captured, so no further execs are needed to check it
+    check_captured_cfg(db2u_instance_cr, None, mas_instance_id, mas_app_id, cfg_pod, result)
+
+    result["failures"] = [check["message"] for check in result["checks"] if check["status"] != "passed"]
+    result["status"] = "failed" if len(result["failures"]) > 0 else "passed"
+    result["duration"] = round(perf_counter() - validation_start, 6)
+    return result
+
+
+async def validate_db2_config(k8s_client: client.ApiClient, mas_instance_id: str, mas_app_id: str, batch: bool = True):
+    """
+    Check that the configuration that is active in DB2 matches the Db2uInstance CR, raising an exception listing every
+    mismatch found, see mas.devops.db2.validate_db2_config
+    """
+    result = await run_db2_config_validation(k8s_client, mas_instance_id, mas_app_id, batch=batch)
+    raise_db2_validation_failures(result)
+
+
+async def list_db2u_instances(custom_objects_api: client.CustomObjectsApi) -> list:
+    """
+    Find every MAS Db2uInstance on the cluster, see mas.devops.db2.list_db2u_instances
+    """
+    db2u_instances = await custom_objects_api.list_cluster_custom_object(
+        group="db2u.databases.ibm.com",
+        version="v1",
+        plural="db2uinstances"
+    )
+
+    targets = []
+    for db2u_instance in db2u_instances.get("items", []):
+        target = get_db2u_instance_target(db2u_instance["metadata"]["namespace"], db2u_instance["metadata"]["name"])
+        if target is not None:
+            targets.append(target)
+
+    return sorted(targets)
+
+
+async def validate_db2_configs(k8s_client: client.ApiClient, targets: list = None, max_concurrency: int = 16, batch: bool = True) -> dict:
+    """
+    Validate the Db2 configuration of many MAS instances and apps concurrently, producing a single report rather than
+    raising an exception, see mas.devops.db2.validate_db2_configs.  Incremental drift checks against a baseline are
+    only available from the synchronous API.
+
+    Parameters:
+      k8s_client (client.ApiClient): The Kubernetes API client
+      targets (list, optional): (mas_instance_id, mas_app_id) tuples to validate. Defaults to every MAS Db2uInstance
+                                on the cluster (see list_db2u_instances).
+      max_concurrency (int, optional): The maximum number of instances to validate at the same time. Defaults to 16.
+      batch (bool, optional): Capture each instance's configuration using a single exec. Defaults to True.
+
+    Returns:
+      dict: The report (see mas.devops.db2.summarize_db2_validation_results), with one result per target in the order
+            of targets.  A target that could not be validated has the status "error" and the reason in error.
+    """
+    if targets is None:
+        targets = await list_db2u_instances(client.CustomObjectsApi(k8s_client))
+    logger.info(f"Validating Db2 configuration for {len(targets)} Db2uInstances")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def validate(mas_instance_id, mas_app_id):
+        async with semaphore:
+            try:
+                return await run_db2_config_validation(k8s_client, mas_instance_id, mas_app_id, batch=batch)
+            except Exception as e:
+                logger.error(f"Unable to validate Db2 configuration for {mas_instance_id}/{mas_app_id}: {e}")
+                result = new_db2_validation_result(mas_instance_id, mas_app_id)
+                result["status"] = "error"
+                result["error"] = str(e)
+                return result
+
+    results = await asyncio.gather(*[validate(mas_instance_id, mas_app_id) for mas_instance_id, mas_app_id in targets])
+    return summarize_db2_validation_results(list(results))
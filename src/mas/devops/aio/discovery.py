@@ -0,0 +1,58 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import logging
+import threading
+
+from time import monotonic
+
+from kubernetes_asyncio.client import ApiClient
+from kubernetes_asyncio.dynamic import DynamicClient
+
+from ..discovery import RESOURCE_CACHE_TTL, _clientResourceCache, getCacheDir, getDiscoveryCacheFile
+
+logger = logging.getLogger(__name__)
+
+# Resource handles are cached on the DynamicClient that discovered them, see mas.devops.discovery
+_resourceCacheLock = threading.Lock()
+
+
+async def createDynamicClient(k8s_client: ApiClient = None, cacheFile: str = None) -> DynamicClient:
+    """
+    Create an async OpenShift client, see mas.devops.discovery.createDynamicClient.  The discovery snapshot is kept
+    separate from the one used by the synchronous client.
+    """
+    if k8s_client is None:
+        k8s_client = ApiClient()
+    if cacheFile is None:
+        try:
+            cacheFile = getDiscoveryCacheFile(k8s_client.configuration.host, getCacheDir("aio"))
+        except OSError as e:
+            # Fall back to the client's own default location for the discovery cache
+            logger.debug(f"Discovery snapshot is not available: {e}")
+    return await DynamicClient(k8s_client, cache_file=cacheFile)
+
+
+async def getResourceAPI(dynClient: DynamicClient, apiVersion: str, kind: str):
+    """
+    Look up the API resource for apiVersion/kind, re-using the result of earlier lookups made with the same client for
+    up to RESOURCE_CACHE_TTL seconds
+    """
+    key = (apiVersion, kind)
+    with _resourceCacheLock:
+        entry = _clientResourceCache(dynClient).get(key)
+        if entry is not None and entry[0] > monotonic():
+            return entry[1]
+
+    logger.debug(f"Discovering API resource {apiVersion}/{kind}")
+    resource = await dynClient.resources.get(api_version=apiVersion, kind=kind)
+    with _resourceCacheLock:
+        _clientResourceCache(dynClient)[key] = (monotonic() + RESOURCE_CACHE_TTL, resource)
+    return resource
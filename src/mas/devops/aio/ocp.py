@@ -0,0 +1,229 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import asyncio
+import json
+import logging
+
+from math import ceil
+from time import monotonic
+from typing import Callable
+
+from kubernetes_asyncio.client import CoreV1Api
+from kubernetes_asyncio.client.rest import ApiException
+from kubernetes_asyncio.dynamic import DynamicClient
+from kubernetes_asyncio.dynamic.exceptions import ForbiddenError, MethodNotAllowedError, NotFoundError
+from kubernetes_asyncio.stream.ws_client import ERROR_CHANNEL, STDERR_CHANNEL, STDOUT_CHANNEL
+
+from .. import ocp
+from ..ocp import WATCH_REQUEST_TIMEOUT, crdIsEstablished, deploymentIsReady, pvcIsBound
+from .discovery import getResourceAPI
+
+logger = logging.getLogger(__name__)
+
+
+async def connect(server: str, token: str, skipVerify: bool = False) -> bool:
+    """
+    Connect to target OCP, see mas.devops.ocp.connect.  Updating the kubeconfig is done on a worker thread.
+    """
+    return await asyncio.to_thread(ocp.connect, server, token, skipVerify)
+
+
+async def createNamespace(dynClient: DynamicClient, namespace: str) -> bool:
+    """
+    Create a namespace if it does not exist
+    """
+    namespaceAPI = await getResourceAPI(dynClient, "v1", "Namespace")
+    try:
+        await namespaceAPI.get(name=namespace)
+        logger.debug(f"Namespace {namespace} already exists")
+    except NotFoundError:
+        nsObj = {
+            "apiVersion": "v1",
+            "kind": "Namespace",
+            "metadata": {
+                "name": namespace
+            }
+        }
+        await namespaceAPI.create(body=nsObj)
+        logger.debug(f"Created namespace {namespace}")
+    return True
+
+
+async def getConsoleURL(dynClient: DynamicClient) -> str:
+    routesAPI = await getResourceAPI(dynClient, "route.openshift.io/v1", "Route")
+    consoleRoute = await routesAPI.get(name="console", namespace="openshift-console")
+    return f"https://{consoleRoute.spec.host}"
+
+
+async def waitForResource(dynClient: DynamicClient, apiVersion: str, kind: str, name: str, namespace: str = None,
+                          condition: Callable = None, timeout: int = 500, pollInterval: float = 1, maxPollInterval: float = 30) -> bool:
+    """
+    Wait for a resource to exist and satisfy a condition, see mas.devops.ocp.waitForResource
+    """
+    resourceAPI = await getResourceAPI(dynClient, apiVersion, kind)
+    if condition is None:
+        condition = _resourceExists
+    deadline = None if timeout is None else monotonic() + timeout
+
+    try:
+        return await _waitForResourceWatch(resourceAPI, name, namespace, condition, deadline)
+    except (ForbiddenError, MethodNotAllowedError) as e:
+        logger.debug(f"Unable to watch {kind} {name}, falling back to polling: {e.reason}")
+        return await _waitForResourcePoll(resourceAPI, name, namespace, condition, deadline, pollInterval, maxPollInterval)
+
+
+def _resourceExists(resource) -> bool:
+    return True
+
+
+def _remainingTime(deadline: float) -> float:
+    return None if deadline is None else deadline - monotonic()
+
+
+async def _waitForResourceWatch(resourceAPI, name: str, namespace: str, condition: Callable, deadline: float) -> bool:
+    resourceVersion = None
+    while True:
+        if resourceVersion is None:
+            # (Re)establish the current state and the resourceVersion to watch from
+            current = await resourceAPI.get(namespace=namespace, field_selector=f"metadata.name={name}")
+            for item in current.items:
+                if condition(item):
+                    return True
+            resourceVersion = current.metadata.resourceVersion
+
+        remaining = _remainingTime(deadline)
+        if remaining is not None and remaining <= 0:
+            return False
+        watchTimeout = WATCH_REQUEST_TIMEOUT if remaining is None else min(WATCH_REQUEST_TIMEOUT, ceil(remaining))
+
+        logger.debug(f"Watching {resourceAPI.kind} {name} from resourceVersion {resourceVersion} for up to {watchTimeout}s ...")
+        try:
+            async for event in resourceAPI.watch(namespace=namespace, name=name, resource_version=resourceVersion, timeout=watchTimeout):
+                resourceVersion = event["object"].metadata.resourceVersion
+                if event["type"] in ["ADDED", "MODIFIED"] and condition(event["object"]):
+                    return True
+        except ApiException as e:
+            if e.status != 410:
+                raise
+            # The resourceVersion we were watching from is too old, we need to list again
+            logger.debug(f"Watch of {resourceAPI.kind} {name} expired, listing again")
+            resourceVersion = None
+
+
+async def _waitForResourcePoll(resourceAPI, name: str, namespace: str, condition: Callable, deadline: float, pollInterval: float, maxPollInterval: float) -> bool:
+    delay = pollInterval
+    while True:
+        try:
+            if condition(await resourceAPI.get(name=name, namespace=namespace)):
+                return True
+        except NotFoundError:
+            pass
+
+        remaining = _remainingTime(deadline)
+        if remaining is not None and remaining <= 0:
+            return False
+        if remaining is not None:
+            delay = min(delay, remaining)
+        logger.debug(f"Waiting {delay:.0f}s for {resourceAPI.kind} {name} before checking again ...")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, maxPollInterval)
+
+
+async def waitForCRD(dynClient: DynamicClient, crdName: str, timeout: int = 500) -> bool:
+    logger.debug(f"Waiting for {crdName} CRD to be established ...")
+    return await waitForResource(
+        dynClient,
+        apiVersion="apiextensions.k8s.io/v1",
+        kind="CustomResourceDefinition",
+        name=crdName,
+        condition=crdIsEstablished,
+        timeout=timeout
+    )
+
+
+async def waitForDeployment(dynClient: DynamicClient, namespace: str, deploymentName: str, timeout: int = 500) -> bool:
+    logger.debug(f"Waiting for deployment {deploymentName} to be ready ...")
+    return await waitForResource(
+        dynClient,
+        apiVersion="apps/v1",
+        kind="Deployment",
+        name=deploymentName,
+        namespace=namespace,
+        condition=deploymentIsReady,
+        timeout=timeout
+    )
+
+
+async def waitForPVC(dynClient: DynamicClient, namespace: str, pvcName: str, timeout: int = None) -> bool:
+    logger.debug(f"Waiting for PVC {pvcName} to be bound ...")
+    return await waitForResource(
+        dynClient,
+        apiVersion="v1",
+        kind="PersistentVolumeClaim",
+        name=pvcName,
+        namespace=namespace,
+        condition=pvcIsBound,
+        timeout=timeout
+    )
+
+
+async def execInPod(core_v1_api: CoreV1Api, pod_name: str, namespace, command: list, timeout: int = 60) -> str:
+    """
+    Executes a command in a Kubernetes pod and returns the standard output, see mas.devops.ocp.execInPod.
+
+    The core_v1_api must be created using a kubernetes_asyncio.stream.WsApiClient, e.g.
+    CoreV1Api(api_client=WsApiClient(configuration))
+
+    Raises:
+      Exception: If the command execution fails
+      asyncio.TimeoutError: If the command does not finish within timeout seconds
+    """
+    logger.debug(f"Executing command {command} on pod {pod_name} in {namespace}")
+    stdout, stderr, err = await asyncio.wait_for(_execInPod(core_v1_api, pod_name, namespace, command), timeout)
+
+    if err.get("status") == "Failure":
+        raise Exception(f"Failed to execute {command} on {pod_name} in namespace {namespace}: {err.get('message')}. stdout: {stdout}, stderr: {stderr}")
+
+    logger.debug(f"stdout: \n----------------------------------------------------------------\n{stdout}\n----------------------------------------------------------------\n")
+
+    return stdout
+
+
+async def _execInPod(core_v1_api: CoreV1Api, pod_name: str, namespace, command: list) -> tuple:
+    """
+    Run the command, returning (stdout, stderr, the status reported on the error channel)
+    """
+    stdout = []
+    stderr = []
+    err = ""
+    ws = await core_v1_api.connect_get_namespaced_pod_exec(
+        pod_name,
+        namespace,
+        command=command,
+        stderr=True,
+        stdin=False,
+        stdout=True,
+        tty=False,
+        _preload_content=False,
+    )
+    async with ws as connection:
+        async for message in connection:
+            data = message.data.decode("utf-8") if isinstance(message.data, bytes) else message.data
+            if len(data) < 2:
+                continue
+            channel = ord(data[0])
+            if channel == STDOUT_CHANNEL:
+                stdout.append(data[1:])
+            elif channel == STDERR_CHANNEL:
+                stderr.append(data[1:])
+            elif channel == ERROR_CHANNEL:
+                err += data[1:]
+    return "".join(stdout), "".join(stderr), json.loads(err) if err else {}
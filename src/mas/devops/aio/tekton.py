@@ -0,0 +1,127 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import logging
+
+from datetime import datetime
+
+from kubernetes_asyncio.dynamic import DynamicClient
+from kubernetes_asyncio.dynamic.exceptions import NotFoundError
+from openshift.dynamic.apply import annotate, apply_patch, dict_merge
+
+from ..clusterfacts import getClusterFacts
+from ..tekton import buildPipelineRun, uninstallPipelineParams, upgradePipelineParams
+from .discovery import getResourceAPI
+from .ocp import getConsoleURL
+
+logger = logging.getLogger(__name__)
+
+
+async def _apply(resourceAPI, body: dict, namespace: str):
+    """
+    Client-side apply, as done by the synchronous DynamicClient.apply (which kubernetes_asyncio does not provide): the
+    resource is created if it does not exist, otherwise patched with the changes since the configuration last applied
+    """
+    body = dict(body, metadata=dict(body["metadata"], namespace=namespace))
+    name = body["metadata"]["name"]
+    try:
+        actual = await resourceAPI.get(name=name, namespace=namespace)
+    except NotFoundError:
+        return await resourceAPI.create(body=dict_merge(body, annotate(body)), namespace=namespace)
+    existing, desired = apply_patch(actual.to_dict(), body)
+    if existing == desired:
+        return actual
+    return await resourceAPI.patch(body=desired, name=name, namespace=namespace, content_type="application/merge-patch+json")
+
+
+async def getClusterConsoleURL(dynClient: DynamicClient) -> str:
+    """
+    Get the console URL, sharing the ClusterFacts cache (see mas.devops.clusterfacts) with the synchronous client
+    """
+    facts = getClusterFacts(dynClient)
+    consoleURL = facts.cached("consoleURL")
+    if consoleURL is None:
+        consoleURL = await getConsoleURL(dynClient)
+        facts.remember("consoleURL", consoleURL)
+    return consoleURL
+
+
+async def launchPipelineRun(dynClient: DynamicClient, namespace: str, templateName: str, params: dict, useTemplate: bool = False) -> str:
+    """
+    Create a PipelineRun (see mas.devops.tekton.buildPipelineRun) in the same way as mas.devops.tekton.launchPipelineRun,
+    returning its timestamp
+    """
+    pipelineRunsAPI = await getResourceAPI(dynClient, "tekton.dev/v1beta1", "PipelineRun")
+    timestamp = datetime.now().strftime("%y%m%d-%H%M")
+    # Create the PipelineRun
+    pipelineRun = buildPipelineRun(templateName, params, timestamp, useTemplate=useTemplate)
+    await _apply(pipelineRunsAPI, pipelineRun, namespace)
+    return timestamp
+
+
+async def launchInstallPipeline(dynClient: DynamicClient, params: dict) -> str:
+    """
+    Create a PipelineRun to install the chosen MAS instance (and selected dependencies)
+    """
+    instanceId = params["mas_instance_id"]
+    namespace = f"mas-{instanceId}-pipelines"
+    timestamp = await launchPipelineRun(dynClient, namespace, "pipelinerun-install", params)
+
+    pipelineURL = f"{await getClusterConsoleURL(dynClient)}/k8s/ns/mas-{instanceId}-pipelines/tekton.dev~v1beta1~PipelineRun/{instanceId}-install-{timestamp}"
+    return pipelineURL
+
+
+async def launchUpdatePipeline(dynClient: DynamicClient, params: dict) -> str:
+    """
+    Create a PipelineRun to update the Maximo Operator Catalog
+    """
+    namespace = "mas-pipelines"
+    timestamp = await launchPipelineRun(dynClient, namespace, "pipelinerun-update", params)
+
+    pipelineURL = f"{await getClusterConsoleURL(dynClient)}/k8s/ns/mas-pipelines/tekton.dev~v1beta1~PipelineRun/mas-update-{timestamp}"
+    return pipelineURL
+
+
+async def launchUpgradePipeline(dynClient: DynamicClient,
+                                instanceId: str,
+                                skipPreCheck: bool = False,
+                                masChannel: str = "") -> str:
+    """
+    Create a PipelineRun to upgrade the chosen MAS instance
+    """
+    namespace = f"mas-{instanceId}-pipelines"
+    timestamp = await launchPipelineRun(dynClient, namespace, "pipelinerun-upgrade", upgradePipelineParams(instanceId, skipPreCheck, masChannel))
+
+    pipelineURL = f"{await getClusterConsoleURL(dynClient)}/k8s/ns/mas-{instanceId}-pipelines/tekton.dev~v1beta1~PipelineRun/{instanceId}-upgrade-{timestamp}"
+    return pipelineURL
+
+
+async def launchUninstallPipeline(dynClient: DynamicClient,
+                                  instanceId: str,
+                                  droNamespace: str,
+                                  certManagerProvider: str = "redhat",
+                                  uninstallCertManager: bool = False,
+                                  uninstallGrafana: bool = False,
+                                  uninstallCatalog: bool = False,
+                                  uninstallCommonServices: bool = False,
+                                  uninstallUDS: bool = False,
+                                  uninstallMongoDb: bool = False,
+                                  uninstallSLS: bool = False) -> str:
+    """
+    Create a PipelineRun to uninstall the chosen MAS instance (and selected dependencies)
+    """
+    namespace = f"mas-{instanceId}-pipelines"
+    timestamp = await launchPipelineRun(dynClient, namespace, "pipelinerun-uninstall", uninstallPipelineParams(
+        instanceId, droNamespace, certManagerProvider, uninstallCertManager, uninstallGrafana, uninstallCatalog,
+        uninstallCommonServices, uninstallUDS, uninstallMongoDb, uninstallSLS
+    ))
+
+    pipelineURL = f"{await getClusterConsoleURL(dynClient)}/k8s/ns/mas-{instanceId}-pipelines/tekton.dev~v1beta1~PipelineRun/{instanceId}-uninstall-{timestamp}"
+    return pipelineURL
@@ -0,0 +1,189 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from time import time
+
+from openshift.dynamic import DynamicClient
+
+from .discovery import getCacheDir
+from .mas import isAirgapInstall
+from .ocp import getConsoleURL, getDefaultStorageClasses, getOCPVersion, isSNO
+
+logger = logging.getLogger(__name__)
+
+# How long a fact about the cluster is trusted before we look it up again
+CLUSTER_FACTS_TTL = 3600
+CLUSTER_FACTS_VERSION = 1
+
+# How each fact is looked up
+FACTS = {
+    "consoleURL": getConsoleURL,
+    "isSNO": isSNO,
+    "isAirgap": isAirgapInstall,
+    "defaultStorageClasses": getDefaultStorageClasses,
+    "ocpVersion": getOCPVersion,
+}
+
+# ClusterFacts are shared per DynamicClient (see getClusterFacts) by keeping them on the client, as they hold a
+# reference to it; a module level cache keyed by client would therefore keep every client alive
+_CLUSTER_FACTS_ATTR = "_masDevopsClusterFacts"
+_clusterFactsLock = threading.Lock()
+
+
+def getClusterFactsFile(host: str, cacheDir: str = None) -> str:
+    """
+    Get the path of the on-disk cluster facts cache for a cluster, by default in the directory given by getCacheDir
+    """
+    if cacheDir is None:
+        cacheDir = getCacheDir()
+    return os.path.join(cacheDir, f"cluster-facts-{hashlib.sha256(host.encode('utf-8')).hexdigest()[:16]}.json")
+
+
+class ClusterFacts:
+    """
+    Facts about a cluster that rarely change (the console URL, whether it is a single node cluster, whether MAS is
+    installed in airgap mode, the default storage classes and the OpenShift version).  Each fact is only looked up the
+    first time it is needed, and is then remembered for ttl seconds.  Unless cacheFile is None the facts are also saved
+    to disk, so later processes talking to the same cluster can use them without any API calls.
+    """
+
+    def __init__(self, dynClient: DynamicClient, ttl: int = CLUSTER_FACTS_TTL, cacheFile: str = ""):
+        self.dynClient = dynClient
+        self.ttl = ttl
+        if cacheFile == "":
+            try:
+                cacheFile = getClusterFactsFile(dynClient.client.configuration.host)
+            except OSError as e:
+                # The cache is only an optimisation, so without somewhere to save it the facts are only kept in memory
+                logger.debug(f"Cluster facts cache is not available: {e}")
+                cacheFile = None
+        self.cacheFile = cacheFile
+        self._lock = threading.RLock()
+        self._facts = self._load()
+
+    def get(self, fact: str):
+        """
+        Get a fact about the cluster, looking it up only if we don't already know it or it has expired
+        """
+        with self._lock:
+            entry = self._entry(fact)
+            if entry is not None:
+                return entry["value"]
+
+            logger.debug(f"Looking up cluster fact {fact}")
+            value = FACTS[fact](self.dynClient)
+            self.remember(fact, value)
+            return value
+
+    def cached(self, fact: str):
+        """
+        Get a fact we already know (and that has not expired) without looking it up, None otherwise.  Together with
+        remember this lets callers that look facts up themselves (e.g. using an async client) share the cache.
+        """
+        entry = self._entry(fact)
+        return None if entry is None else entry["value"]
+
+    def _entry(self, fact: str) -> dict:
+        if fact not in FACTS:
+            raise KeyError(f"Unknown cluster fact: {fact}")
+        with self._lock:
+            entry = self._facts.get(fact)
+            return entry if entry is not None and entry["expires"] > time() else None
+
+    def remember(self, fact: str, value) -> None:
+        """
+        Record a fact that has been looked up, it is trusted for ttl seconds
+        """
+        if fact not in FACTS:
+            raise KeyError(f"Unknown cluster fact: {fact}")
+        with self._lock:
+            self._facts[fact] = dict(value=value, expires=time() + self.ttl)
+            self._save()
+
+    def invalidate(self, fact: str = None) -> None:
+        """
+        Forget a fact (by default all of them), so it is looked up again next time it is needed
+        """
+        with self._lock:
+            if fact is None:
+                self._facts.clear()
+            else:
+                self._facts.pop(fact, None)
+            self._save()
+
+    def consoleURL(self) -> str:
+        return self.get("consoleURL")
+
+    def isSNO(self) -> bool:
+        return self.get("isSNO")
+
+    def isAirgap(self) -> bool:
+        return self.get("isAirgap")
+
+    def defaultStorageClasses(self) -> list:
+        return self.get("defaultStorageClasses")
+
+    def ocpVersion(self) -> str:
+        return self.get("ocpVersion")
+
+    def _load(self) -> dict:
+        if self.cacheFile is None:
+            return {}
+        try:
+            with open(self.cacheFile, "r") as f:
+                content = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.debug(f"Ignoring unreadable cluster facts file {self.cacheFile}: {e}")
+            return {}
+        if not isinstance(content, dict) or content.get("version") != CLUSTER_FACTS_VERSION:
+            return {}
+        return {fact: entry for fact, entry in content.get("facts", {}).items() if fact in FACTS}
+
+    def _save(self) -> None:
+        """
+        Save the facts, replacing the file atomically.  The cache is only an optimisation, so failing to save it is not
+        an error.
+        """
+        if self.cacheFile is None:
+            return
+        try:
+            cacheDir = os.path.dirname(os.path.abspath(self.cacheFile))
+            os.makedirs(cacheDir, exist_ok=True)
+            fd, tmpFile = tempfile.mkstemp(dir=cacheDir, prefix=".cluster-facts-")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(dict(version=CLUSTER_FACTS_VERSION, facts=self._facts), f)
+                os.replace(tmpFile, self.cacheFile)
+            except BaseException:
+                os.unlink(tmpFile)
+                raise
+        except OSError as e:
+            logger.debug(f"Unable to save cluster facts to {self.cacheFile}: {e}")
+
+
+def getClusterFacts(dynClient: DynamicClient) -> ClusterFacts:
+    """
+    Get the ClusterFacts for a client, so that every caller using the same client shares the facts already looked up
+    """
+    with _clusterFactsLock:
+        facts = vars(dynClient).get(_CLUSTER_FACTS_ATTR)
+        if facts is None:
+            facts = ClusterFacts(dynClient)
+            setattr(dynClient, _CLUSTER_FACTS_ATTR, facts)
+        return facts
@@ -9,7 +9,17 @@
 # *****************************************************************************
 
 
+from __future__ import annotations
+
+import hashlib
+import json
+import os
 import re
+import shlex
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, time
+from xml.etree import ElementTree
 from kubernetes import client
 from .ocp import execInPod
 import logging
@@ -18,6 +28,19 @@ import yaml
 H1_BREAK = "================================================================"
 H2_BREAK = "----------------------------------------------------------------"
 
+# e.g. " Default application heap (4KB)             (APPLHEAPSZ) = AUTOMATIC(8192)"
+DB2_CFG_LINE = re.compile(r"^\s*(.*?)\s*\(([^()\s]+)\)\s=\s(.*)$")
+# e.g. "DB2_FMP_COMM_HEAPSZ=65536 [O]" (the trailing [O] indicates the value has been overridden)
+DB2SET_LINE = re.compile(r"^\s*([^=\s]+)=(.*?)(\s\[O\])?$")
+
+# Marks the start and end of each command's output when several db2 commands are captured in a single exec
+BATCH_SECTION_MARKER = "### MAS-DEVOPS-DB2-SECTION"
+
+# How long (in seconds) a drift baseline is trusted before the configuration is captured again, even when neither
+# the Db2uInstance CR nor the Db2 pod appear to have changed
+DB2_BASELINE_MAX_AGE = 3600
+DB2_BASELINE_VERSION = 1
+
 logger = logging.getLogger(__name__)
 
 
@@ -37,12 +60,28 @@ def get_db2u_instance_cr(custom_objects_api: client.CustomObjectsApi, mas_instan
     return db2u_instance_cr
 
 
+def db2_pod_name(mas_instance_id: str, mas_app_id: str) -> str:
+    return f"c-db2wh-{mas_instance_id}-{mas_app_id}-db2u-0"
+
+
 def db2_pod_exec(core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str, command: list) -> str:
-    pod_name = f"c-db2wh-{mas_instance_id}-{mas_app_id}-db2u-0"
+    pod_name = db2_pod_name(mas_instance_id, mas_app_id)
     namespace = f"db2u-{mas_instance_id}"
     return execInPod(core_v1_api, pod_name, namespace, command)
 
 
+def get_db2_pod_fingerprint(core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str) -> dict:
+    """
+    Identify the running Db2 pod, so we can tell if it has been replaced or restarted since the configuration was captured
+
+    Returns:
+      dict: {"uid": str, "restarts": int (the total restart count of the pod's containers)}
+    """
+    pod = core_v1_api.read_namespaced_pod(name=db2_pod_name(mas_instance_id, mas_app_id), namespace=f"db2u-{mas_instance_id}")
+    container_statuses = pod.status.container_statuses or []
+    return dict(uid=pod.metadata.uid, restarts=sum(cs.restart_count or 0 for cs in container_statuses))
+
+
 def db2_pod_exec_db2_get_db_cfg(core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str, db_name: str) -> str:
     command = ["su", "-lc", f"db2 get db cfg for {db_name}", "db2inst1"]
     return db2_pod_exec(core_v1_api, mas_instance_id, mas_app_id, command)
@@ -58,6 +97,144 @@ def db2_pod_exec_db2set(core_v1_api: client.CoreV1Api, mas_instance_id: str, mas
     return db2_pod_exec(core_v1_api, mas_instance_id, mas_app_id, command)
 
 
+def db2_pod_exec_batched_cfg(core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str, db_names: list) -> dict:
+    """
+    Capture the output of db2 get dbm cfg, db2set and db2 get db cfg for each of the named databases using a single
+    exec (and a single login shell) in the Db2 pod, rather than one exec per command.
+
+    Parameters:
+      core_v1_api (client.CoreV1Api): The Kubernetes API client
+      mas_instance_id (str): The ID of the MAS instance.
+      mas_app_id (str): The ID of the MAS app the DB2 database is for (e.g. "manage", "iot")
+      db_names (list): The names of the databases to capture the db cfg of
+
+    Returns:
+      dict: {"dbm": <db2 get dbm cfg output>, "registry": <db2set output>, "db": {<db_name>: <db2 get db cfg output>}}
+
+    Raises:
+      Exception: If any of the db2 commands fails
+    """
+    commands = db2_batched_cfg_commands(db_names)
+    output = db2_pod_exec(core_v1_api, mas_instance_id, mas_app_id, ["su", "-lc", db2_batched_cfg_script(commands), "db2inst1"])
+    return read_batched_cfg_output(output, commands, db_names)
+
+
+def db2_batched_cfg_commands(db_names: list) -> dict:
+    """
+    The db2 commands run by db2_pod_exec_batched_cfg, keyed by the section of the output they produce
+    """
+    commands = {
+        "dbm": "db2 get dbm cfg",
+        "registry": "db2set",
+    }
+    for db_name in db_names:
+        commands[f"db {db_name}"] = f"db2 get db cfg for {shlex.quote(db_name)}"
+    return commands
+
+
+def db2_batched_cfg_script(commands: dict) -> str:
+    script = []
+    for section, command in commands.items():
+        begin = shlex.quote(f"{BATCH_SECTION_MARKER} BEGIN {section}")
+        end = shlex.quote(f"{BATCH_SECTION_MARKER} END {section}")
+        script.append(f"echo {begin}; {command}; echo {end} $?")
+    # The exit code of each command is reported in its END marker, so the script itself always succeeds
+    script.append("exit 0")
+    return "\n".join(script)
+
+
+def read_batched_cfg_output(output: str, commands: dict, db_names: list) -> dict:
+    """
+    Check and split up the output of the script built by db2_batched_cfg_script (see db2_pod_exec_batched_cfg)
+    """
+    sections = split_batched_cfg_output(output)
+
+    for section, command in commands.items():
+        if section not in sections:
+            raise Exception(f"No output was captured for {command}")
+        if sections[section]["rc"] != 0:
+            raise Exception(f"Failed to execute {command} (rc={sections[section]['rc']}): {sections[section]['output']}")
+
+    return {
+        "dbm": sections["dbm"]["output"],
+        "registry": sections["registry"]["output"],
+        "db": {db_name: sections[f"db {db_name}"]["output"] for db_name in db_names}
+    }
+
+
+def split_batched_cfg_output(output: str) -> dict:
+    """
+    Split the output of the script run by db2_pod_exec_batched_cfg back into the output of each command
+
+    Returns:
+      dict: {<section>: {"output": <command output>, "rc": <command exit code, or None if the END marker is missing>}}
+    """
+    sections = {}
+    current = None
+    for line in output.splitlines(keepends=True):
+        marker = line.find(BATCH_SECTION_MARKER)
+        if marker > 0 and current is not None:
+            # The command output did not end with a newline, so the marker was echoed onto its last line
+            sections[current]["lines"].append(line[:marker])
+        if marker >= 0:
+            tokens = line[marker + len(BATCH_SECTION_MARKER):].split()
+            if tokens[0] == "BEGIN":
+                current = " ".join(tokens[1:])
+                sections[current] = {"lines": [], "rc": None}
+            elif tokens[0] == "END" and current is not None:
+                sections[current]["rc"] = int(tokens[-1])
+                current = None
+        elif current is not None:
+            sections[current]["lines"].append(line)
+
+    return {
+        section: {"output": "".join(captured["lines"]), "rc": captured["rc"]}
+        for section, captured in sections.items()
+    }
+
+
+def parse_db2_cfg(output: str) -> dict:
+    """
+    Index the output of db2 get db cfg or db2 get dbm cfg by parameter name in a single pass.
+    Lines that do not name a parameter (e.g. "Database territory = US") are not indexed.
+
+    Returns:
+      dict: {<PARAM>: {"description": <the human readable description>, "param": <PARAM>, "value": <the active value>}}
+            If a parameter appears more than once the first occurrence is used.
+    """
+    index = {}
+    for line in output.split("\n"):
+        matches = DB2_CFG_LINE.match(line)
+        if matches is not None and matches.group(2) not in index:
+            index[matches.group(2)] = {
+                "description": matches.group(1),
+                "param": matches.group(2),
+                "value": matches.group(3)
+            }
+    return index
+
+
+def parse_db2set(output: str) -> dict:
+    """
+    Index the output of db2set by registry variable name in a single pass.
+
+    Returns:
+      dict: {<VARIABLE>: {"description": None, "param": <VARIABLE>, "value": <the active value>, "overridden": <bool>}}
+            If a variable appears more than once the first occurrence is used.
+    """
+    index = {}
+    for line in output.split("\n"):
+        matches = DB2SET_LINE.match(line)
+        if matches is not None and matches.group(1) not in index:
+            index[matches.group(1)] = {
+                "description": None,
+                "param": matches.group(1),
+                "value": matches.group(2),
+                "overridden": matches.group(3) is not None
+            }
+    return index
+
+
 def cr_pod_v_matches(cr_k: str, cr_v: str, pod_v: str) -> bool:
 
     logger.debug(f"[{cr_k}] '{cr_v}' ~= '{pod_v}'")
@@ -79,7 +256,72 @@ def cr_pod_v_matches(cr_k: str, cr_v: str, pod_v: str) -> bool:
     return pod_v == cr_v
 
 
-def check_db_cfgs(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str) -> list:
+def compare_cfg(section: str, cfg_cr: dict, cfg_index: dict, command: str, database: str = None) -> list:
+    """
+    Compare the settings from the Db2uInstance CR with the parsed output of a db2 command (see parse_db2_cfg and
+    parse_db2set)
+
+    Parameters:
+      section (str): The section of configuration being checked ("db cfg", "dbm cfg" or "registry cfg")
+      cfg_cr (dict): The settings for this section from the Db2uInstance CR
+      cfg_index (dict): The parsed output of the db2 command
+      command (str): The db2 command the output came from
+      database (str, optional): The database being checked (db cfg only)
+
+    Returns:
+      list: One dict per setting in the CR: {"section": str, "database": str, "parameter": str, "expected": <CR value>,
+            "actual": <active value, None if not found>, "status": "passed"|"failed"|"missing", "message": str}.
+            The message describes the mismatch (None if the check passed).
+    """
+    label = f"[{section} for {database}]" if database is not None else f"[{section}]"
+    checks = []
+    for cr_k, cr_v in cfg_cr.items():
+        check = dict(section=section, database=database, parameter=cr_k, expected=cr_v, actual=None, status="passed", message=None)
+        if cr_k not in cfg_index:
+            check["status"] = "missing"
+            check["message"] = f"{label} {cr_k} not found in output of {command} command"
+        else:
+            check["actual"] = cfg_index[cr_k]["value"]
+            if not cr_pod_v_matches(cr_k, cr_v, check["actual"]):
+                check["status"] = "failed"
+                check["message"] = f"{label} {cr_k}: {cr_v} != {check['actual']}"
+        checks.append(check)
+    return checks
+
+
+def record_timing(result: dict, phase: str, target: str, start: float) -> None:
+    """
+    Record how long a phase of the validation (that began at perf_counter() value start) took, if a result is being collected
+    """
+    if result is not None:
+        result["timings"].append(dict(phase=phase, target=target, seconds=round(perf_counter() - start, 6)))
+
+
+def merge_results(result: dict, partial_results: list) -> None:
+    if result is not None:
+        for partial_result in partial_results:
+            result["checks"].extend(partial_result["checks"])
+            result["timings"].extend(partial_result["timings"])
+
+
+def isolated_core_v1_api(core_v1_api: client.CoreV1Api) -> client.CoreV1Api:
+    """
+    kubernetes.stream temporarily patches the ApiClient it is given for the duration of each exec call, so execs
+    that run concurrently must each use a CoreV1Api with its own ApiClient (sharing the same configuration).
+    """
+    if core_v1_api is None:
+        return None
+    return client.CoreV1Api(client.ApiClient(configuration=core_v1_api.api_client.configuration))
+
+
+def get_db2u_instance_cr_databases(db2u_instance_cr: dict) -> list:
+    db2u_instance_cr_databases = db2u_instance_cr.get("spec", {}).get("environment", {}).get("databases", {})
+    if len(db2u_instance_cr_databases) == 0:
+        raise Exception("spec.environment.databases not found or empty")
+    return db2u_instance_cr_databases
+
+
+def check_db_cfgs(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str, max_workers: int = 1, result: dict = None) -> list:
     """
     Runs check_db_cfg for each database in the provided Db2uInstance CR
 
@@ -88,24 +330,35 @@ def check_db_cfgs(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_ins
       core_v1_api (client.CoreV1Api): The Kubernetes API client
       mas_instance_id (str): The ID of the MAS instance.
       mas_app_id (str): The ID of the MAS app the DB2 database is for (e.g. "manage", "iot")
+      max_workers (int, optional): The maximum number of databases to check concurrently. Defaults to 1 (serial).
+      result (dict, optional): A validation result to record the checks and timings in (see run_db2_config_validation)
 
     Returns:
-      list: The outputs of each call to check_db_cfg concatenated together
+      list: The outputs of each call to check_db_cfg concatenated together, in the order the databases appear in the CR
     """
     failures = []
 
-    db2u_instance_cr_databases = db2u_instance_cr.get("spec", {}).get("environment", {}).get("databases", {})
-    if len(db2u_instance_cr_databases) == 0:
-        raise Exception("spec.environment.databases not found or empty")
+    db2u_instance_cr_databases = get_db2u_instance_cr_databases(db2u_instance_cr)
 
     # Check each db cfg
-    for cr_db in db2u_instance_cr_databases:
-        failures = [*failures, *check_db_cfg(cr_db, core_v1_api, mas_instance_id, mas_app_id)]
+    if max_workers > 1:
+        partial_results = [dict(checks=[], timings=[]) for cr_db in db2u_instance_cr_databases]
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db2-validate") as executor:
+            futures = [
+                executor.submit(check_db_cfg, cr_db, isolated_core_v1_api(core_v1_api), mas_instance_id, mas_app_id, result=partial_result)
+                for cr_db, partial_result in zip(db2u_instance_cr_databases, partial_results)
+            ]
+            for future in futures:
+                failures = [*failures, *future.result()]
+        merge_results(result, partial_results)
+    else:
+        for cr_db in db2u_instance_cr_databases:
+            failures = [*failures, *check_db_cfg(cr_db, core_v1_api, mas_instance_id, mas_app_id, result=result)]
 
     return failures
 
 
-def check_db_cfg(db_dr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str) -> list:
+def check_db_cfg(db_dr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str, db_cfg_pod: str = None, result: dict = None) -> list:
     """
     Check that the parameters in the provided db dict taken from the Db2uInstance CR align with those in the output of the
     db2 get db cfg command (i.e. the configuration that is actually active in DB2).
@@ -115,15 +368,18 @@ def check_db_cfg(db_dr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: st
       core_v1_api (client.CoreV1Api): The Kubernetes API client
       mas_instance_id (str): The ID of the MAS instance.
       mas_app_id (str): The ID of the MAS app the DB2 database is for (e.g. "manage", "iot")
+      db_cfg_pod (str, optional): Previously captured output of db2 get db cfg, if not provided the command is run in the Db2 pod
+      result (dict, optional): A validation result to record the checks and timings in (see run_db2_config_validation)
 
     Returns:
       list: A list of strings describing any mismatches found between the CR and active DB2 configuration.
             Any empty list implies all configuration matches.
     """
-    failures = []
-
     db_name = db_dr["name"]
-    db_cfg_pod = db2_pod_exec_db2_get_db_cfg(core_v1_api, mas_instance_id, mas_app_id, db_name)
+    if db_cfg_pod is None:
+        start = perf_counter()
+        db_cfg_pod = db2_pod_exec_db2_get_db_cfg(core_v1_api, mas_instance_id, mas_app_id, db_name)
+        record_timing(result, "exec", f"db2 get db cfg for {db_name}", start)
 
     logger.info(f"Checking db cfg for {db_name}\n{H1_BREAK}")
 
@@ -135,18 +391,20 @@ def check_db_cfg(db_dr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: st
     logger.debug(f"db2 db {db_name} cfg output:\n{H2_BREAK}{db_cfg_pod}{H2_BREAK}")
     logger.debug(f"db2 db {db_name} cr settings:\n{H2_BREAK}\n{yaml.dump(db_cfg_cr, sort_keys=False, default_flow_style=False)}{H2_BREAK}")
 
+    start = perf_counter()
+    db_cfg_index = parse_db2_cfg(db_cfg_pod)
+    record_timing(result, "parse", f"db cfg for {db_name}", start)
+
     logger.debug(f"Running checks\n{H2_BREAK}")
-    for cr_k, cr_v in db_cfg_cr.items():
-        matches = re.search(fr"\({cr_k}\)\s=\s(.*)$", db_cfg_pod, re.MULTILINE)
-        if matches is None:
-            failures.append(f"[db cfg for {db_name}] {cr_k} not found in output of db2 get db cfg command")
-            continue
-        pod_v = matches.group(1)
-
-        if not cr_pod_v_matches(cr_k, cr_v, pod_v):
-            failures.append(f"[db cfg for {db_name}] {cr_k}: {cr_v} != {pod_v}")
+    start = perf_counter()
+    checks = compare_cfg("db cfg", db_cfg_cr, db_cfg_index, "db2 get db cfg", database=db_name)
+    record_timing(result, "compare", f"db cfg for {db_name}", start)
     logger.debug(f"\n{H2_BREAK}")
 
+    if result is not None:
+        result["checks"].extend(checks)
+    failures = [check["message"] for check in checks if check["status"] != "passed"]
+
     if len(failures) > 0:
         logger.warning(f"{len(failures)} checks failed for db cfg {db_name}\n")
     else:
@@ -154,7 +412,7 @@ def check_db_cfg(db_dr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: st
     return failures
 
 
-def check_dbm_cfg(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str) -> list:
+def check_dbm_cfg(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str, dbm_cfg_pod: str = None, result: dict = None) -> list:
     """
     Check that the database manager (dbmConfig) parameters from the Db2uInstance CR align with those in the output of the
     db2 get dbm cfg command (i.e. the configuration that is actually active in DB2).
@@ -164,13 +422,13 @@ def check_dbm_cfg(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_ins
       core_v1_api (client.CoreV1Api): The Kubernetes API client
       mas_instance_id (str): The ID of the MAS instance.
       mas_app_id (str): The ID of the MAS app the DB2 database is for (e.g. "manage", "iot")
+      dbm_cfg_pod (str, optional): Previously captured output of db2 get dbm cfg, if not provided the command is run in the Db2 pod
+      result (dict, optional): A validation result to record the checks and timings in (see run_db2_config_validation)
 
     Returns:
       list: A list of strings describing any mismatches found between the CR and active DB2 configuration.
             Any empty list implies all configuration matches.
     """
-    failures = []
-
     # Check dbm config
     logger.info(f"Checking dbm cfg\n{H1_BREAK}")
     dbm_cfg_cr = db2u_instance_cr.get("spec", {}).get("environment", {}).get("instance", {}).get("dbmConfig", {})
@@ -178,23 +436,28 @@ def check_dbm_cfg(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_ins
         logger.info("spec.environment.instance.dbmConfig not found or empty, skipping dbm cfg checks\n")
         return []
 
-    dbm_cfg_pod = db2_pod_exec_db2_get_dbm_cfg(core_v1_api, mas_instance_id, mas_app_id)
+    if dbm_cfg_pod is None:
+        start = perf_counter()
+        dbm_cfg_pod = db2_pod_exec_db2_get_dbm_cfg(core_v1_api, mas_instance_id, mas_app_id)
+        record_timing(result, "exec", "db2 get dbm cfg", start)
 
     logger.debug(f"db2 dbm cfg output:\n{H2_BREAK}{dbm_cfg_pod}{H2_BREAK}")
     logger.debug(f"db2 dbm cr settings:\n{H2_BREAK}\n{yaml.dump(dbm_cfg_cr, sort_keys=False, default_flow_style=False)}{H2_BREAK}")
 
+    start = perf_counter()
+    dbm_cfg_index = parse_db2_cfg(dbm_cfg_pod)
+    record_timing(result, "parse", "dbm cfg", start)
+
     logger.debug(f"Running checks\n{H2_BREAK}")
-    for cr_k, cr_v in dbm_cfg_cr.items():
-        matches = re.search(fr"\({cr_k}\)\s=\s(.*)$", dbm_cfg_pod, re.MULTILINE)
-        if matches is None:
-            failures.append(f"[dbm cfg] {cr_k} not found in output of db2 get dbm cfg command")
-            continue
-        pod_v = matches.group(1)
-
-        if not cr_pod_v_matches(cr_k, cr_v, pod_v):
-            failures.append(f"[dbm cfg] {cr_k}: {cr_v} != {pod_v}")
+    start = perf_counter()
+    checks = compare_cfg("dbm cfg", dbm_cfg_cr, dbm_cfg_index, "db2 get dbm cfg")
+    record_timing(result, "compare", "dbm cfg", start)
     logger.debug(f"\n{H2_BREAK}")
 
+    if result is not None:
+        result["checks"].extend(checks)
+    failures = [check["message"] for check in checks if check["status"] != "passed"]
+
     if len(failures) > 0:
         logger.warning(f"{len(failures)} checks failed for dbm cfg\n")
     else:
@@ -203,7 +466,7 @@ def check_dbm_cfg(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_ins
     return failures
 
 
-def check_reg_cfg(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str) -> list:
+def check_reg_cfg(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str, reg_cfg_pod: str = None, result: dict = None) -> list:
     """
     Check that the registry parameters from the Db2uInstance CR align with those in the output of the
     db2set command (i.e. the configuration that is actually active in DB2).
@@ -213,13 +476,13 @@ def check_reg_cfg(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_ins
       core_v1_api (client.CoreV1Api): The Kubernetes API client
       mas_instance_id (str): The ID of the MAS instance.
       mas_app_id (str): The ID of the MAS app the DB2 database is for (e.g. "manage", "iot")
+      reg_cfg_pod (str, optional): Previously captured output of db2set, if not provided the command is run in the Db2 pod
+      result (dict, optional): A validation result to record the checks and timings in (see run_db2_config_validation)
 
     Returns:
       list: A list of strings describing any mismatches found between the CR and active DB2 configuration.
             Any empty list implies all configuration matches.
     """
-    failures = []
-
     # Check registry cfg
     logger.info(f"Checking registry cfg\n{H1_BREAK}")
 
@@ -228,24 +491,28 @@ def check_reg_cfg(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_ins
         logger.info("spec.environment.instance.registry not found or empty, skipping registry cfg checks\n")
         return []
 
-    reg_cfg_pod = db2_pod_exec_db2set(core_v1_api, mas_instance_id, mas_app_id)
+    if reg_cfg_pod is None:
+        start = perf_counter()
+        reg_cfg_pod = db2_pod_exec_db2set(core_v1_api, mas_instance_id, mas_app_id)
+        record_timing(result, "exec", "db2set", start)
 
     logger.debug(f"db2set output:\n{H2_BREAK}{reg_cfg_pod}{H2_BREAK}")
     logger.debug(f"db2 cr registry settings:\n{H2_BREAK}\n{yaml.dump(reg_cfg_cr, sort_keys=False, default_flow_style=False)}{H2_BREAK}")
 
+    start = perf_counter()
+    reg_cfg_index = parse_db2set(reg_cfg_pod)
+    record_timing(result, "parse", "registry cfg", start)
+
     logger.debug(f"Running checks\n{H2_BREAK}")
-    for cr_k, cr_v in reg_cfg_cr.items():
-        # regex ignores any trailing [O] (which indicates the param has been overridden I think)
-        matches = re.search(fr"{cr_k}=(.*?)(?:\s\[O\])?$", reg_cfg_pod, re.MULTILINE)
-        if matches is None:
-            failures.append(f"[registry cfg] {cr_k} not found in output of db2set command")
-            continue
-        pod_v = matches.group(1)
-
-        if not cr_pod_v_matches(cr_k, cr_v, pod_v):
-            failures.append(f"[registry cfg] {cr_k}: {cr_v} != {pod_v}")
+    start = perf_counter()
+    checks = compare_cfg("registry cfg", reg_cfg_cr, reg_cfg_index, "db2set")
+    record_timing(result, "compare", "registry cfg", start)
     logger.debug(f"\n{H2_BREAK}")
 
+    if result is not None:
+        result["checks"].extend(checks)
+    failures = [check["message"] for check in checks if check["status"] != "passed"]
+
     if len(failures) > 0:
         logger.warning(f"{len(failures)} registry cfg checks failed\n")
     else:
@@ -254,17 +521,116 @@ def check_reg_cfg(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_ins
     return failures
 
 
-def validate_db2_config(k8s_client: client.api_client.ApiClient, mas_instance_id: str, mas_app_id: str):
+def check_captured_cfg(db2u_instance_cr: dict, core_v1_api: client.CoreV1Api, mas_instance_id: str, mas_app_id: str, cfg_pod: dict, result: dict = None) -> list:
+    """
+    Run the db, dbm and registry cfg checks against configuration previously captured using db2_pod_exec_batched_cfg
+    """
+    failures = []
+    for cr_db in get_db2u_instance_cr_databases(db2u_instance_cr):
+        failures = [*failures, *check_db_cfg(cr_db, core_v1_api, mas_instance_id, mas_app_id, db_cfg_pod=cfg_pod["db"][cr_db["name"]], result=result)]
+    failures = [*failures, *check_dbm_cfg(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id, dbm_cfg_pod=cfg_pod["dbm"], result=result)]
+    failures = [*failures, *check_reg_cfg(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id, reg_cfg_pod=cfg_pod["registry"], result=result)]
+    return failures
+
+
+def new_db2_validation_result(mas_instance_id: str, mas_app_id: str) -> dict:
+    """
+    Create an empty validation result (see run_db2_config_validation)
+    """
+    return dict(
+        mas_instance_id=mas_instance_id,
+        mas_app_id=mas_app_id,
+        status=None,
+        failures=[],
+        error=None,
+        duration=None,
+        checks=[],
+        timings=[]
+    )
+
+
+def run_db2_config_validation(k8s_client: client.api_client.ApiClient, mas_instance_id: str, mas_app_id: str, max_workers: int = 1, batch: bool = False) -> dict:
+    """
+    Run the db, dbm and registry cfg checks for a Db2uInstance (see validate_db2_config) without raising on failures.
+
+    Returns:
+      dict: The validation result:
+            - mas_instance_id, mas_app_id (str)
+            - status (str): "passed" or "failed"
+            - failures (list): strings describing each mismatch, in the same order as validate_db2_config reports them
+            - checks (list): the result of every check performed (see compare_cfg)
+            - timings (list): {"phase": "get"|"exec"|"parse"|"compare", "target": str, "seconds": float} for each phase
+            - duration (float): the total time taken in seconds
+            - error (str): always None, errors are raised
+    """
+    result = new_db2_validation_result(mas_instance_id, mas_app_id)
+    validation_start = perf_counter()
 
     core_v1_api = client.CoreV1Api(k8s_client)
     custom_objects_api = client.CustomObjectsApi(k8s_client)
 
+    start = perf_counter()
     db2u_instance_cr = get_db2u_instance_cr(custom_objects_api, mas_instance_id, mas_app_id)
-    db_failures = check_db_cfgs(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id)
-    dbm_failures = check_dbm_cfg(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id)
-    reg_failures = check_reg_cfg(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id)
+    record_timing(result, "get", "Db2uInstance CR", start)
+
+    if batch:
+        db2u_instance_cr_databases = get_db2u_instance_cr_databases(db2u_instance_cr)
+        start = perf_counter()
+        cfg_pod = db2_pod_exec_batched_cfg(core_v1_api, mas_instance_id, mas_app_id, [cr_db["name"] for cr_db in db2u_instance_cr_databases])
+        record_timing(result, "exec", "batched db2 cfg capture", start)
+
+        check_captured_cfg(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id, cfg_pod, result)
+    elif max_workers > 1:
+        db2u_instance_cr_databases = get_db2u_instance_cr_databases(db2u_instance_cr)
+        partial_results = [dict(checks=[], timings=[]) for i in range(len(db2u_instance_cr_databases) + 2)]
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db2-validate") as executor:
+            futures = [
+                executor.submit(check_db_cfg, cr_db, isolated_core_v1_api(core_v1_api), mas_instance_id, mas_app_id, result=partial_result)
+                for cr_db, partial_result in zip(db2u_instance_cr_databases, partial_results)
+            ]
+            futures.append(executor.submit(check_dbm_cfg, db2u_instance_cr, isolated_core_v1_api(core_v1_api), mas_instance_id, mas_app_id, result=partial_results[-2]))
+            futures.append(executor.submit(check_reg_cfg, db2u_instance_cr, isolated_core_v1_api(core_v1_api), mas_instance_id, mas_app_id, result=partial_results[-1]))
+            for future in futures:
+                future.result()
+        merge_results(result, partial_results)
+    else:
+        check_db_cfgs(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id, result=result)
+        check_dbm_cfg(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id, result=result)
+        check_reg_cfg(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id, result=result)
+
+    result["failures"] = [check["message"] for check in result["checks"] if check["status"] != "passed"]
+    result["status"] = "failed" if len(result["failures"]) > 0 else "passed"
+    result["duration"] = round(perf_counter() - validation_start, 6)
+    return result
+
+
+def validate_db2_config(k8s_client: client.api_client.ApiClient, mas_instance_id: str, mas_app_id: str, max_workers: int = 1, batch: bool = False):
+    """
+    Check that the db, dbm and registry configuration that is active in DB2 matches the Db2uInstance CR, raising an
+    exception listing every mismatch found.
+
+    With batch the output of every db2 command needed is captured using a single exec in the Db2 pod
+    (see db2_pod_exec_batched_cfg). Otherwise each command is run in its own exec, and with max_workers > 1 those
+    execs are run concurrently (up to max_workers at a time). The failures are always reported in the same order.
+    """
+
+    result = run_db2_config_validation(k8s_client, mas_instance_id, mas_app_id, max_workers=max_workers, batch=batch)
+    raise_db2_validation_failures(result)
+
+
+def raise_db2_validation_failures(result: dict) -> None:
+    """
+    Log the outcome of a validation (see run_db2_config_validation), raising an exception listing every mismatch found
+    """
+
+    def section_failures(section):
+        return [check["message"] for check in result["checks"] if check["section"] == section and check["status"] != "passed"]
 
-    all_failures = [*db_failures, *dbm_failures, *reg_failures]
+    db_failures = section_failures("db cfg")
+    dbm_failures = section_failures("dbm cfg")
+    reg_failures = section_failures("registry cfg")
+
+    all_failures = result["failures"]
 
     logger.info(f"Results\n{H1_BREAK}")
     if len(all_failures) > 0:
@@ -290,3 +656,340 @@ def validate_db2_config(k8s_client: client.api_client.ApiClient, mas_instance_id
         ))
     else:
         logger.info("All checks passed")
+
+
+def get_db2u_instance_cr_fingerprint(db2u_instance_cr: dict) -> dict:
+    metadata = db2u_instance_cr.get("metadata", {})
+    return dict(generation=metadata.get("generation"), resourceVersion=metadata.get("resourceVersion"))
+
+
+def db2u_instance_cr_changed(previous: dict, current: dict) -> bool:
+    """
+    Compare two CR fingerprints (see get_db2u_instance_cr_fingerprint). The generation only changes when the spec
+    does, so it is preferred to the resourceVersion (which also changes on every status update) when available
+    """
+    if current["generation"] is not None:
+        return previous.get("generation") != current["generation"]
+    return previous.get("resourceVersion") != current["resourceVersion"]
+
+
+def db2_baseline_refresh_reason(baseline: dict, cr_fingerprint: dict, pod_fingerprint: dict, max_age: int) -> str:
+    """
+    Returns:
+      str: Why the configuration needs to be captured again, or None if the baseline is still current
+    """
+    if baseline is None:
+        return "no baseline"
+    if db2u_instance_cr_changed(baseline["cr"], cr_fingerprint):
+        return "Db2uInstance CR changed"
+    if baseline["pod"]["uid"] != pod_fingerprint["uid"]:
+        return "Db2 pod replaced"
+    if baseline["pod"]["restarts"] != pod_fingerprint["restarts"]:
+        return "Db2 pod restarted"
+    if time() - baseline["capturedAt"] >= max_age:
+        return "baseline expired"
+    return None
+
+
+def diff_db2_checks(previous_checks: list, current_checks: list) -> list:
+    """
+    Compare the checks (see compare_cfg) from two runs
+
+    Returns:
+      list: {"section", "database", "parameter", "change": "added"|"removed"|"changed", "previous", "current"} for
+            each setting whose expected value, actual value or status differs, where previous and current are
+            {"status", "expected", "actual"} (None if the setting was not checked in that run)
+    """
+    def key(check):
+        return (check["section"], check["database"], check["parameter"])
+
+    def state(check):
+        return None if check is None else dict(status=check["status"], expected=check["expected"], actual=check["actual"])
+
+    def change(check, change_type, previous, current):
+        return dict(section=check["section"], database=check["database"], parameter=check["parameter"], change=change_type, previous=state(previous), current=state(current))
+
+    previous_by_key = {key(check): check for check in previous_checks}
+    current_keys = set()
+    changes = []
+    for check in current_checks:
+        current_keys.add(key(check))
+        previous = previous_by_key.get(key(check))
+        if previous is None:
+            changes.append(change(check, "added", None, check))
+        elif state(previous) != state(check):
+            changes.append(change(check, "changed", previous, check))
+    for check in previous_checks:
+        if key(check) not in current_keys:
+            changes.append(change(check, "removed", check, None))
+    return changes
+
+
+def run_db2_config_drift_check(k8s_client: client.api_client.ApiClient, mas_instance_id: str, mas_app_id: str, baseline: dict = None, max_age: int = DB2_BASELINE_MAX_AGE) -> tuple:
+    """
+    Incrementally validate the Db2 configuration against a baseline recorded by a previous run.
+
+    The exec in the Db2 pod is skipped entirely when the Db2uInstance CR has not changed, the Db2 pod has not been
+    replaced or restarted, and the baseline is less than max_age seconds old; the checks from the baseline are
+    reported as-is. Otherwise the configuration is captured (using a single exec, see db2_pod_exec_batched_cfg), and
+    is only parsed and compared again if the CR or the captured output differ from the baseline.
+
+    Returns:
+      tuple: (result, baseline). The result is as described in run_db2_config_validation, with the addition of
+             drift: {"captured": bool, "reason": str, "changes": list (see diff_db2_checks, empty on the first run)}.
+             The baseline should be passed to the next run.
+    """
+    result = new_db2_validation_result(mas_instance_id, mas_app_id)
+    validation_start = perf_counter()
+
+    core_v1_api = client.CoreV1Api(k8s_client)
+    custom_objects_api = client.CustomObjectsApi(k8s_client)
+
+    start = perf_counter()
+    db2u_instance_cr = get_db2u_instance_cr(custom_objects_api, mas_instance_id, mas_app_id)
+    record_timing(result, "get", "Db2uInstance CR", start)
+
+    start = perf_counter()
+    pod_fingerprint = get_db2_pod_fingerprint(core_v1_api, mas_instance_id, mas_app_id)
+    record_timing(result, "get", "Db2 pod", start)
+
+    cr_fingerprint = get_db2u_instance_cr_fingerprint(db2u_instance_cr)
+    reason = db2_baseline_refresh_reason(baseline, cr_fingerprint, pod_fingerprint, max_age)
+
+    if reason is None:
+        logger.debug(f"Db2uInstance CR and Db2 pod for {mas_instance_id}/{mas_app_id} are unchanged, using the baseline")
+        result["checks"] = baseline["checks"]
+        result["drift"] = dict(captured=False, reason="unchanged", changes=[])
+    else:
+        logger.debug(f"Capturing Db2 configuration for {mas_instance_id}/{mas_app_id}: {reason}")
+        db2u_instance_cr_databases = get_db2u_instance_cr_databases(db2u_instance_cr)
+        start = perf_counter()
+        cfg_pod = db2_pod_exec_batched_cfg(core_v1_api, mas_instance_id, mas_app_id, [cr_db["name"] for cr_db in db2u_instance_cr_databases])
+        record_timing(result, "exec", "batched db2 cfg capture", start)
+        outputs_hash = hashlib.sha256(json.dumps(cfg_pod, sort_keys=True).encode("utf-8")).hexdigest()
+
+        if baseline is not None and baseline["outputsHash"] == outputs_hash and not db2u_instance_cr_changed(baseline["cr"], cr_fingerprint):
+            result["checks"] = baseline["checks"]
+        else:
+            check_captured_cfg(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id, cfg_pod, result)
+
+        result["drift"] = dict(captured=True, reason=reason, changes=[] if baseline is None else diff_db2_checks(baseline["checks"], result["checks"]))
+        baseline = dict(cr=cr_fingerprint, pod=pod_fingerprint, outputsHash=outputs_hash, capturedAt=time(), checks=result["checks"])
+
+    result["failures"] = [check["message"] for check in result["checks"] if check["status"] != "passed"]
+    result["status"] = "failed" if len(result["failures"]) > 0 else "passed"
+    result["duration"] = round(perf_counter() - validation_start, 6)
+    return result, baseline
+
+
+def load_db2_baselines(baseline_file: str) -> dict:
+    """
+    Load the drift baselines saved by save_db2_baselines, keyed by "{mas_instance_id}/{mas_app_id}". A missing,
+    unreadable or incompatible file is treated as having no baselines.
+    """
+    try:
+        with open(baseline_file, "r") as f:
+            content = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable Db2 baseline file {baseline_file}: {e}")
+        return {}
+    if not isinstance(content, dict) or content.get("version") != DB2_BASELINE_VERSION:
+        logger.warning(f"Ignoring Db2 baseline file {baseline_file} from an incompatible version")
+        return {}
+    return content.get("baselines", {})
+
+
+def save_db2_baselines(baseline_file: str, baselines: dict) -> None:
+    """
+    Save drift baselines, replacing the file atomically so a concurrent reader never sees a partial write
+    """
+    baseline_dir = os.path.dirname(os.path.abspath(baseline_file))
+    os.makedirs(baseline_dir, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=baseline_dir, prefix=".db2-baseline-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(dict(version=DB2_BASELINE_VERSION, baselines=baselines), f)
+        os.replace(tmp_file, baseline_file)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
+
+
+def list_db2u_instances(custom_objects_api: client.CustomObjectsApi) -> list:
+    """
+    Find every MAS Db2uInstance on the cluster, i.e. those named db2wh-{mas_instance_id}-{mas_app_id} in the
+    db2u-{mas_instance_id} namespace.  Any other Db2uInstances are ignored.
+
+    Returns:
+      list: (mas_instance_id, mas_app_id) tuples, sorted
+    """
+    db2u_instances = custom_objects_api.list_cluster_custom_object(
+        group="db2u.databases.ibm.com",
+        version="v1",
+        plural="db2uinstances"
+    )
+
+    targets = []
+    for db2u_instance in db2u_instances.get("items", []):
+        target = get_db2u_instance_target(db2u_instance["metadata"]["namespace"], db2u_instance["metadata"]["name"])
+        if target is not None:
+            targets.append(target)
+
+    return sorted(targets)
+
+
+def get_db2u_instance_target(namespace: str, cr_name: str) -> tuple:
+    """
+    Work out which MAS instance and app a Db2uInstance belongs to from its name and namespace
+
+    Returns:
+      tuple: (mas_instance_id, mas_app_id), or None if the Db2uInstance does not follow the MAS naming convention
+    """
+    mas_instance_id = namespace[len("db2u-"):]
+    cr_name_prefix = f"db2wh-{mas_instance_id}-"
+    if not namespace.startswith("db2u-") or not cr_name.startswith(cr_name_prefix) or len(cr_name) == len(cr_name_prefix):
+        logger.debug(f"Ignoring Db2uInstance {cr_name} in {namespace}, it does not follow the MAS naming convention")
+        return None
+    return (mas_instance_id, cr_name[len(cr_name_prefix):])
+
+
+def get_db2_pod_target(namespace: str, pod_name: str) -> tuple:
+    """
+    The inverse of db2_pod_name
+
+    Returns:
+      tuple: (mas_instance_id, mas_app_id), or None if the pod is not the Db2 pod of a MAS Db2uInstance
+    """
+    if not pod_name.startswith("c-") or not pod_name.endswith("-db2u-0"):
+        return None
+    return get_db2u_instance_target(namespace, pod_name[len("c-"):-len("-db2u-0")])
+
+
+def validate_db2_configs(k8s_client: client.api_client.ApiClient, targets: list = None, max_workers: int = 4, batch: bool = True, exec_max_workers: int = 1,
+                         baseline_file: str = None, max_age: int = DB2_BASELINE_MAX_AGE) -> dict:
+    """
+    Validate the Db2 configuration of many MAS instances and apps concurrently (see run_db2_config_validation),
+    producing a single report rather than raising an exception.
+
+    Parameters:
+      k8s_client (client.api_client.ApiClient): The Kubernetes API client
+      targets (list, optional): (mas_instance_id, mas_app_id) tuples to validate. Defaults to every MAS Db2uInstance
+                                on the cluster (see list_db2u_instances).
+      max_workers (int, optional): The maximum number of instances to validate concurrently. Defaults to 4.
+      batch (bool, optional): Capture each instance's configuration using a single exec. Defaults to True.
+      exec_max_workers (int, optional): The maximum number of execs to run concurrently for each instance when not
+                                        using batch. Defaults to 1.
+      baseline_file (str, optional): Run incremental drift checks (see run_db2_config_drift_check) using the baselines
+                                     in this file, which is updated once every target has been checked.
+      max_age (int, optional): The age in seconds after which a baseline is no longer trusted. Defaults to DB2_BASELINE_MAX_AGE.
+
+    Returns:
+      dict: The report (see summarize_db2_validation_results), with one result per target in the order of targets.
+            A target that could not be validated has the status "error" and the reason in error.
+    """
+    if targets is None:
+        targets = list_db2u_instances(client.CustomObjectsApi(k8s_client))
+    logger.info(f"Validating Db2 configuration for {len(targets)} Db2uInstances")
+
+    baselines = load_db2_baselines(baseline_file) if baseline_file is not None else {}
+    updated_baselines = dict(baselines)
+
+    def validate(mas_instance_id, mas_app_id):
+        try:
+            # Each validation needs its own ApiClient, as kubernetes.stream patches the ApiClient it is given.  It is
+            # closed once the validation is done, so we don't hold a connection pool open for every target
+            with client.ApiClient(configuration=k8s_client.configuration) as isolated_k8s_client:
+                if baseline_file is not None:
+                    key = f"{mas_instance_id}/{mas_app_id}"
+                    result, updated_baselines[key] = run_db2_config_drift_check(
+                        isolated_k8s_client, mas_instance_id, mas_app_id, baseline=baselines.get(key), max_age=max_age
+                    )
+                    return result
+                return run_db2_config_validation(
+                    isolated_k8s_client, mas_instance_id, mas_app_id, max_workers=exec_max_workers, batch=batch
+                )
+        except Exception as e:
+            logger.error(f"Unable to validate Db2 configuration for {mas_instance_id}/{mas_app_id}: {e}")
+            result = new_db2_validation_result(mas_instance_id, mas_app_id)
+            result["status"] = "error"
+            result["error"] = str(e)
+            return result
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db2-validate") as executor:
+        futures = [executor.submit(validate, mas_instance_id, mas_app_id) for mas_instance_id, mas_app_id in targets]
+        results = [future.result() for future in futures]
+
+    if baseline_file is not None:
+        save_db2_baselines(baseline_file, updated_baselines)
+    return summarize_db2_validation_results(results)
+
+
+def summarize_db2_validation_results(results: list) -> dict:
+    """
+    Returns:
+      dict: {"summary": {"total": int, "passed": int, "failed": int, "error": int}, "results": results}
+    """
+    return dict(
+        summary=dict(
+            total=len(results),
+            passed=len([r for r in results if r["status"] == "passed"]),
+            failed=len([r for r in results if r["status"] == "failed"]),
+            error=len([r for r in results if r["status"] == "error"])
+        ),
+        results=results
+    )
+
+
+def format_db2_validation_report(report: dict, output_format: str) -> str:
+    """
+    Format a report (see summarize_db2_validation_results) as "json", "yaml" or "junit" (XML)
+    """
+    if output_format == "json":
+        return json.dumps(report, indent=2)
+    elif output_format == "yaml":
+        return yaml.dump(report, sort_keys=False, default_flow_style=False)
+    elif output_format == "junit":
+        return format_db2_validation_report_junit(report)
+    raise ValueError(f"Unsupported output format: {output_format}")
+
+
+def format_db2_validation_report_junit(report: dict) -> str:
+    """
+    Each Db2uInstance becomes a testsuite and each check a testcase, with the timing of each phase of the validation
+    recorded as properties of the testsuite.  A Db2uInstance with no checks (e.g. nothing has changed since the
+    baseline) is reported as a single "validate" testcase.
+    """
+    testsuites = ElementTree.Element("testsuites", dict(name="db2-config"))
+
+    for result in report["results"]:
+        suite_name = f"{result['mas_instance_id']}/{result['mas_app_id']}"
+        testsuite = ElementTree.SubElement(testsuites, "testsuite", dict(name=suite_name, time=str(result["duration"] or 0)))
+
+        properties = ElementTree.SubElement(testsuite, "properties")
+        for timing in result["timings"]:
+            ElementTree.SubElement(properties, "property", dict(name=f"{timing['phase']}: {timing['target']}", value=str(timing["seconds"])))
+
+        if result["status"] == "error":
+            testcase = ElementTree.SubElement(testsuite, "testcase", dict(classname=suite_name, name="validate"))
+            ElementTree.SubElement(testcase, "error", dict(message=result["error"]))
+
+        for check in result["checks"]:
+            classname = f"{suite_name}.{check['section']}" + (f".{check['database']}" if check["database"] is not None else "")
+            testcase = ElementTree.SubElement(testsuite, "testcase", dict(classname=classname, name=check["parameter"]))
+            if check["status"] != "passed":
+                failure = ElementTree.SubElement(testcase, "failure", dict(message=check["message"], type=check["status"]))
+                failure.text = f"expected: {check['expected']}\nactual: {check['actual']}"
+
+        if testsuite.find("testcase") is None:
+            ElementTree.SubElement(testsuite, "testcase", dict(classname=suite_name, name="validate"))
+
+    # The counts are taken from the testcases written, so they always agree with the body of the report
+    for element in [testsuites] + testsuites.findall("testsuite"):
+        element.set("tests", str(len(element.findall(".//testcase"))))
+        element.set("failures", str(len(element.findall(".//testcase/failure"))))
+        element.set("errors", str(len(element.findall(".//testcase/error"))))
+
+    ElementTree.indent(testsuites)
+    return ElementTree.tostring(testsuites, encoding="unicode", xml_declaration=True)
@@ -0,0 +1,502 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+from __future__ import annotations
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, perf_counter, time
+
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+
+from . import db2
+from .informer import closeWatch
+from .ocp import WATCH_REQUEST_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Sections are identified by (section, database), e.g. ("db cfg", "BLUDB") or ("dbm cfg", None).  ALL_SECTIONS
+# requests a full check of every section using a single exec in the Db2 pod
+ALL_SECTIONS = "all"
+
+# The longest we will wait before retrying a watch that failed for any reason other than an expired resourceVersion
+MAX_WATCH_RETRY_INTERVAL = 30
+
+# Selects the Db2u engine pods (c-db2wh-<instance>-<app>-db2u-0), so the pod watches ignore every other pod
+DB2_ENGINE_POD_LABEL_SELECTOR = "type=engine"
+
+
+def get_db2_cfg_sections(db2u_instance_cr: dict) -> dict:
+    """
+    Returns:
+      dict: The settings from the Db2uInstance CR for each section of configuration checked by the validator, keyed by
+            (section, database)
+    """
+    environment = db2u_instance_cr.get("spec", {}).get("environment", {})
+    sections = {}
+    for cr_db in environment.get("databases", None) or []:
+        sections[("db cfg", cr_db["name"])] = cr_db.get("dbConfig", None)
+    sections[("dbm cfg", None)] = environment.get("instance", {}).get("dbmConfig", None)
+    sections[("registry cfg", None)] = environment.get("instance", {}).get("registry", None)
+    return sections
+
+
+def changed_db2_cfg_sections(previous_cr: dict, current_cr: dict) -> set:
+    """
+    Returns:
+      set: The (section, database) keys whose settings differ between two versions of a Db2uInstance CR, including
+           databases which have been added or removed
+    """
+    previous_sections = get_db2_cfg_sections(previous_cr)
+    current_sections = get_db2_cfg_sections(current_cr)
+    return {key for key in {*previous_sections, *current_sections} if previous_sections.get(key) != current_sections.get(key)}
+
+
+def get_pod_state(pod: client.V1Pod) -> dict:
+    container_statuses = (pod.status.container_statuses or []) if pod.status is not None else []
+    return dict(
+        uid=pod.metadata.uid,
+        restarts=sum(cs.restart_count or 0 for cs in container_statuses),
+        ready=len(container_statuses) > 0 and all(cs.ready for cs in container_statuses)
+    )
+
+
+def get_object_key(item) -> tuple:
+    """
+    Returns:
+      tuple: (namespace, name) of an object from a watch, either a dict (custom objects) or a model (e.g. V1Pod)
+    """
+    if isinstance(item, dict):
+        return (item["metadata"]["namespace"], item["metadata"]["name"])
+    return (item.metadata.namespace, item.metadata.name)
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Db2ConfigDriftMetrics:
+    """
+    The current drift state of every Db2uInstance being watched, rendered in the Prometheus text exposition format
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._targets = {}
+        self._validations = {}
+
+    def update(self, target: tuple, checks_by_section: dict, duration: float, trigger: str, replace_all: bool = False) -> None:
+        """
+        Record the checks for the sections of configuration that were (re-)validated, keeping the checks for every other
+        section from previous validations unless replace_all is set
+        """
+        with self._lock:
+            state = self._targets.setdefault(target, dict(sections={}))
+            if replace_all:
+                state["sections"] = {}
+            for key, checks in checks_by_section.items():
+                if len(checks) == 0:
+                    state["sections"].pop(key, None)
+                else:
+                    state["sections"][key] = checks
+            state.update(error=None, timestamp=time(), duration=duration)
+            self._count(target, trigger)
+
+    def set_error(self, target: tuple, error: str, trigger: str) -> None:
+        with self._lock:
+            self._targets.setdefault(target, dict(sections={}, duration=None)).update(error=error, timestamp=time())
+            self._count(target, trigger)
+
+    def remove(self, target: tuple) -> None:
+        with self._lock:
+            self._targets.pop(target, None)
+            for key in [key for key in self._validations if key[:2] == target]:
+                del self._validations[key]
+
+    def _count(self, target: tuple, trigger: str) -> None:
+        key = (*target, trigger)
+        self._validations[key] = self._validations.get(key, 0) + 1
+
+    def get_state(self, target: tuple) -> dict:
+        """
+        Returns:
+          dict: {"status": "passed"|"failed"|"error", "failures": list, "error": str} or None if the target is unknown
+        """
+        with self._lock:
+            state = self._targets.get(target)
+            if state is None:
+                return None
+            failures = [check["message"] for checks in state["sections"].values() for check in checks if check["status"] != "passed"]
+            status = "error" if state["error"] is not None else ("failed" if len(failures) > 0 else "passed")
+            return dict(status=status, failures=failures, error=state["error"])
+
+    def render(self) -> str:
+        def labels(**kwargs):
+            return "{" + ",".join(f'{k}="{escape_label_value(v)}"' for k, v in kwargs.items() if v is not None) + "}"
+
+        drift, checks, errors, timestamps, durations, validations = [], [], [], [], [], []
+        with self._lock:
+            for (mas_instance_id, mas_app_id), state in sorted(self._targets.items()):
+                target_labels = labels(mas_instance_id=mas_instance_id, mas_app_id=mas_app_id)
+                counts = {}
+                for (section, database), section_checks in state["sections"].items():
+                    for check in section_checks:
+                        key = (section, database or "", check["status"])
+                        counts[key] = counts.get(key, 0) + 1
+                failed = sum(count for (section, database, status), count in counts.items() if status != "passed")
+
+                drift.append(f"mas_db2_config_drift{target_labels} {1 if failed > 0 else 0}")
+                for (section, database, status), count in sorted(counts.items()):
+                    check_labels = labels(mas_instance_id=mas_instance_id, mas_app_id=mas_app_id, section=section, database=database or None, status=status)
+                    checks.append(f"mas_db2_config_checks{check_labels} {count}")
+                errors.append(f"mas_db2_config_validation_error{target_labels} {0 if state['error'] is None else 1}")
+                timestamps.append(f"mas_db2_config_last_validation_timestamp_seconds{target_labels} {state['timestamp']}")
+                if state["duration"] is not None:
+                    durations.append(f"mas_db2_config_validation_duration_seconds{target_labels} {state['duration']}")
+
+            for (mas_instance_id, mas_app_id, trigger), count in sorted(self._validations.items()):
+                validations.append(f"mas_db2_config_validations_total{labels(mas_instance_id=mas_instance_id, mas_app_id=mas_app_id, trigger=trigger)} {count}")
+
+        lines = []
+        for name, metric_type, help_text, samples in [
+            ("mas_db2_config_drift", "gauge", "Whether the active Db2 configuration differs from the Db2uInstance CR", drift),
+            ("mas_db2_config_checks", "gauge", "Number of Db2 configuration settings checked, by section and status", checks),
+            ("mas_db2_config_validation_error", "gauge", "Whether the last validation failed to run", errors),
+            ("mas_db2_config_last_validation_timestamp_seconds", "gauge", "When the Db2 configuration was last validated", timestamps),
+            ("mas_db2_config_validation_duration_seconds", "gauge", "How long the last validation took", durations),
+            ("mas_db2_config_validations_total", "counter", "Number of validations run, by what triggered them", validations),
+        ]:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(metrics: Db2ConfigDriftMetrics, address: str = "", port: int = 9090) -> ThreadingHTTPServer:
+    """
+    Serve the metrics on /metrics (and a liveness check on /healthz) from a background thread.  Call shutdown() on
+    the returned server to stop it.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._respond(200, metrics.render(), "text/plain; version=0.0.4; charset=utf-8")
+            elif self.path == "/healthz":
+                self._respond(200, "ok\n", "text/plain; charset=utf-8")
+            else:
+                self._respond(404, "not found\n", "text/plain; charset=utf-8")
+
+        def _respond(self, code, body, content_type):
+            content = body.encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} {format % args}")
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="db2-watch-metrics", daemon=True).start()
+    logger.info(f"Serving Db2 configuration drift metrics on {server.server_address[0]}:{server.server_address[1]}/metrics")
+    return server
+
+
+class _WatchHandle:
+    """
+    Stops a watch (see Db2ConfigWatcher._watch) running in another thread, interrupting the request in progress
+    """
+
+    def __init__(self):
+        self.stopped = threading.Event()
+        self.watch = None
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.watch is not None:
+            closeWatch(self.watch)
+
+
+class Db2ConfigWatcher:
+    """
+    Watch every MAS Db2uInstance CR and Db2 pod on the cluster, and re-validate the Db2 configuration as soon as
+    either changes:
+
+    - A new Db2uInstance, or a Db2 pod that has been replaced, restarted or become ready, gets a full check (using
+      a single exec, see db2.db2_pod_exec_batched_cfg)
+    - A change to the spec of a Db2uInstance re-runs the checks for only the sections of configuration that changed
+    - Every Db2uInstance gets a full check at least every max_age seconds, in case the configuration was changed
+      inside Db2 directly
+
+    Changes arriving within debounce seconds of each other are validated together.
+    """
+
+    def __init__(self, k8s_client: client.api_client.ApiClient, metrics: Db2ConfigDriftMetrics = None,
+                 max_age: int = db2.DB2_BASELINE_MAX_AGE, debounce: float = 2):
+        self.k8s_client = k8s_client
+        self.metrics = metrics if metrics is not None else Db2ConfigDriftMetrics()
+        self.max_age = max_age
+        self.debounce = debounce
+
+        self._crs = {}
+        self._pods = {}
+        self._last_full_check = {}
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._cr_watch = _WatchHandle()
+        self._pod_watches = {}
+        self._running = False
+        self._exec_core_v1_api = None
+
+    def start(self) -> None:
+        self._running = True
+        custom_objects_api = client.CustomObjectsApi(self.k8s_client)
+        self._start_thread(
+            "db2-watch-db2uinstances", self._watch, self._cr_watch, custom_objects_api.list_cluster_custom_object, self.handle_cr_event,
+            group="db2u.databases.ibm.com", version="v1", plural="db2uinstances"
+        )
+        self._start_thread("db2-watch-validate", self._validate_loop)
+
+    def stop(self, timeout: float = None) -> None:
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+            watches = [self._cr_watch, *self._pod_watches.values()]
+            self._pod_watches = {}
+        for handle in watches:
+            handle.stop()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wait(self) -> None:
+        """
+        Block until stop() is called (e.g. from a signal handler)
+        """
+        while not self._stop.wait(1):
+            pass
+
+    def _start_thread(self, name, target, *args, **kwargs) -> None:
+        thread = threading.Thread(target=target, name=name, args=args, kwargs=kwargs, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _ensure_pod_watch(self, namespace: str) -> None:
+        with self._condition:
+            if not self._running or namespace in self._pod_watches:
+                return
+            handle = self._pod_watches[namespace] = _WatchHandle()
+        self._start_thread(
+            f"db2-watch-pods-{namespace}", self._watch, handle, client.CoreV1Api(self.k8s_client).list_namespaced_pod, self.handle_pod_event,
+            namespace=namespace, label_selector=DB2_ENGINE_POD_LABEL_SELECTOR
+        )
+
+    def _stop_pod_watch(self, namespace: str) -> None:
+        """
+        Stop watching the pods in a namespace, unless a Db2uInstance we are watching is still there
+        """
+        with self._condition:
+            if any(cr["metadata"]["namespace"] == namespace for cr in self._crs.values()):
+                return
+            handle = self._pod_watches.pop(namespace, None)
+        if handle is not None:
+            logger.debug(f"No Db2uInstances remain in {namespace}, no longer watching its pods")
+            handle.stop()
+
+    def handle_cr_event(self, event_type: str, db2u_instance_cr: dict) -> None:
+        metadata = db2u_instance_cr["metadata"]
+        target = db2.get_db2u_instance_target(metadata["namespace"], metadata["name"])
+        if target is None:
+            return
+
+        if event_type == "DELETED":
+            logger.info(f"Db2uInstance for {target[0]}/{target[1]} was deleted")
+            with self._condition:
+                self._crs.pop(target, None)
+                self._pods.pop(target, None)
+                self._pending.pop(target, None)
+                self._last_full_check.pop(target, None)
+            self.metrics.remove(target)
+            self._stop_pod_watch(metadata["namespace"])
+            return
+
+        with self._condition:
+            previous_cr = self._crs.get(target)
+            self._crs[target] = db2u_instance_cr
+        self._ensure_pod_watch(metadata["namespace"])
+
+        if previous_cr is None:
+            self.schedule(target, ALL_SECTIONS, "discovered")
+        else:
+            sections = changed_db2_cfg_sections(previous_cr, db2u_instance_cr)
+            if len(sections) > 0:
+                self.schedule(target, sections, "cr-changed")
+
+    def handle_pod_event(self, event_type: str, pod: client.V1Pod) -> None:
+        target = db2.get_db2_pod_target(pod.metadata.namespace, pod.metadata.name)
+        if target is None:
+            return
+
+        if event_type == "DELETED":
+            self._pods.pop(target, None)
+            return
+
+        state = get_pod_state(pod)
+        previous = self._pods.get(target)
+        self._pods[target] = state
+        if previous is None or not state["ready"]:
+            # Newly discovered pods are covered by the full check scheduled when their Db2uInstance was discovered
+            return
+        if previous["uid"] != state["uid"]:
+            self.schedule(target, ALL_SECTIONS, "pod-replaced")
+        elif previous["restarts"] != state["restarts"]:
+            self.schedule(target, ALL_SECTIONS, "pod-restarted")
+        elif not previous["ready"]:
+            self.schedule(target, ALL_SECTIONS, "pod-ready")
+
+    def schedule(self, target: tuple, sections, trigger: str) -> None:
+        """
+        Queue a validation of either ALL_SECTIONS or a set of (section, database) keys, merging it with any validation
+        already queued for the target
+        """
+        with self._condition:
+            pending = self._pending.get(target)
+            if pending is not None:
+                if pending[0] == ALL_SECTIONS or sections == ALL_SECTIONS:
+                    sections = ALL_SECTIONS
+                else:
+                    sections = {*pending[0], *sections}
+            self._pending[target] = (sections, trigger)
+            self._condition.notify_all()
+
+    def schedule_expired(self) -> None:
+        now = monotonic()
+        with self._condition:
+            expired = [target for target, last_full_check in self._last_full_check.items() if now - last_full_check >= self.max_age]
+        for target in expired:
+            self.schedule(target, ALL_SECTIONS, "resync")
+
+    def run_pending(self) -> None:
+        with self._condition:
+            pending = self._pending
+            self._pending = {}
+        for target, (sections, trigger) in pending.items():
+            self.validate(target, sections, trigger)
+
+    def validate(self, target: tuple, sections, trigger: str) -> None:
+        """
+        Re-validate some (or ALL_SECTIONS) of the configuration of a Db2uInstance, and record the results in the metrics
+        """
+        mas_instance_id, mas_app_id = target
+        with self._condition:
+            db2u_instance_cr = self._crs.get(target)
+        if db2u_instance_cr is None:
+            return
+
+        logger.info(f"Validating Db2 configuration for {mas_instance_id}/{mas_app_id} ({trigger})")
+        if self._exec_core_v1_api is None:
+            # Execs patch the ApiClient they use, so they must not share it with the watches running in other threads
+            self._exec_core_v1_api = client.CoreV1Api(client.ApiClient(configuration=self.k8s_client.configuration))
+        core_v1_api = self._exec_core_v1_api
+        result = dict(checks=[], timings=[])
+        start = perf_counter()
+        try:
+            if sections == ALL_SECTIONS:
+                db_names = [cr_db["name"] for cr_db in db2.get_db2u_instance_cr_databases(db2u_instance_cr)]
+                cfg_pod = db2.db2_pod_exec_batched_cfg(core_v1_api, mas_instance_id, mas_app_id, db_names)
+                db2.check_captured_cfg(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id, cfg_pod, result)
+                with self._condition:
+                    self._last_full_check[target] = monotonic()
+            else:
+                cr_databases = {cr_db["name"]: cr_db for cr_db in db2u_instance_cr.get("spec", {}).get("environment", {}).get("databases", None) or []}
+                for section, database in sorted(sections, key=lambda key: (key[0], key[1] or "")):
+                    if section == "db cfg" and database in cr_databases:
+                        db2.check_db_cfg(cr_databases[database], core_v1_api, mas_instance_id, mas_app_id, result=result)
+                    elif section == "dbm cfg":
+                        db2.check_dbm_cfg(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id, result=result)
+                    elif section == "registry cfg":
+                        db2.check_reg_cfg(db2u_instance_cr, core_v1_api, mas_instance_id, mas_app_id, result=result)
+        except Exception as e:
+            logger.error(f"Unable to validate Db2 configuration for {mas_instance_id}/{mas_app_id}: {e}")
+            self.metrics.set_error(target, str(e), trigger)
+            return
+
+        checks_by_section = {} if sections == ALL_SECTIONS else {key: [] for key in sections}
+        for check in result["checks"]:
+            checks_by_section.setdefault((check["section"], check["database"]), []).append(check)
+        self.metrics.update(target, checks_by_section, round(perf_counter() - start, 6), trigger, replace_all=sections == ALL_SECTIONS)
+
+    def _validate_loop(self) -> None:
+        while not self._stop.is_set():
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) > 0 or self._stop.is_set(), timeout=min(self.max_age, 60))
+            # Give any related changes (e.g. the pod restarting after a CR update) a chance to arrive
+            if self._stop.wait(self.debounce):
+                return
+            self.schedule_expired()
+            self.run_pending()
+
+    def _watch(self, handle: _WatchHandle, list_func, handler, **kwargs) -> None:
+        """
+        List and then watch a type of resource until the handle is stopped, passing every event to handler.  The list is
+        repeated (synthesizing DELETED events for anything that disappeared) whenever the watch cannot be resumed.
+        """
+        known = {}
+        retry_interval = 1
+        while not handle.stopped.is_set():
+            try:
+                listing = list_func(**kwargs)
+                if isinstance(listing, dict):
+                    items, resource_version = listing.get("items", []), listing["metadata"]["resourceVersion"]
+                else:
+                    items, resource_version = listing.items, listing.metadata.resource_version
+
+                listed = {}
+                for item in items:
+                    listed[get_object_key(item)] = item
+                    handler("ADDED", item)
+                for key in set(known) - set(listed):
+                    handler("DELETED", known[key])
+                known = listed
+                retry_interval = 1
+
+                while not handle.stopped.is_set():
+                    w = handle.watch = watch.Watch()
+                    if handle.stopped.is_set():
+                        return
+                    for event in w.stream(list_func, resource_version=resource_version, timeout_seconds=WATCH_REQUEST_TIMEOUT, **kwargs):
+                        if handle.stopped.is_set():
+                            w.stop()
+                            return
+                        item = event["object"]
+                        if event["type"] in ["ADDED", "MODIFIED", "DELETED"]:
+                            if event["type"] == "DELETED":
+                                known.pop(get_object_key(item), None)
+                            else:
+                                known[get_object_key(item)] = item
+                            handler(event["type"], item)
+                    resource_version = w.resource_version
+            except ApiException as e:
+                if e.status == 410:
+                    logger.debug(f"Watch expired ({e.reason}), listing again")
+                    continue
+                logger.warning(f"Watch failed, retrying in {retry_interval}s: {e}")
+            except Exception as e:
+                if handle.stopped.is_set():
+                    # The watch was closed by _WatchHandle.stop
+                    return
+                logger.warning(f"Watch failed, retrying in {retry_interval}s: {e}")
+            if handle.stopped.wait(retry_interval):
+                return
+            retry_interval = min(retry_interval * 2, MAX_WATCH_RETRY_INTERVAL)
@@ -0,0 +1,161 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from time import monotonic
+
+from kubernetes.client import api_client
+from openshift.dynamic import DynamicClient
+from openshift.dynamic.exceptions import NotFoundError
+
+logger = logging.getLogger(__name__)
+
+# How long a discovered resource handle is trusted before we look it up again
+RESOURCE_CACHE_TTL = 600
+
+# Resource handles are cached on the DynamicClient that discovered them, because each handle is bound to (and holds a
+# reference to) that client; a module level cache keyed by client would therefore keep every client alive
+_RESOURCE_CACHE_ATTR = "_masDevopsResourceCache"
+_resourceCacheLock = threading.Lock()
+
+
+def _clientResourceCache(dynClient: DynamicClient, create: bool = True) -> dict:
+    """
+    Get the resource cache of a client (the caller must hold _resourceCacheLock), None if it has none and create is False
+    """
+    clientCache = vars(dynClient).get(_RESOURCE_CACHE_ATTR)
+    if clientCache is None and create:
+        clientCache = {}
+        setattr(dynClient, _RESOURCE_CACHE_ATTR, clientCache)
+    return clientCache
+
+
+def getResourceAPI(dynClient: DynamicClient, apiVersion: str, kind: str):
+    """
+    Look up the API resource for apiVersion/kind, re-using the result of earlier lookups made with the same client.
+
+    Handles expire after RESOURCE_CACHE_TTL seconds, and are evicted as soon as the API server reports that the
+    resource type no longer exists (e.g. a CRD has been deleted), so the next lookup will run discovery again.
+    """
+    key = (apiVersion, kind)
+    with _resourceCacheLock:
+        clientCache = _clientResourceCache(dynClient)
+        entry = clientCache.get(key)
+        if entry is not None and entry[0] > monotonic():
+            return entry[1]
+
+    logger.debug(f"Discovering API resource {apiVersion}/{kind}")
+    resource = CachedResource(dynClient, apiVersion, kind, dynClient.resources.get(api_version=apiVersion, kind=kind))
+    with _resourceCacheLock:
+        _clientResourceCache(dynClient)[key] = (monotonic() + RESOURCE_CACHE_TTL, resource)
+    return resource
+
+
+def invalidateResourceAPI(dynClient: DynamicClient, apiVersion: str = None, kind: str = None) -> None:
+    """
+    Evict cached resource handles for a client, either a single apiVersion/kind or (by default) all of them
+    """
+    with _resourceCacheLock:
+        clientCache = _clientResourceCache(dynClient, create=False)
+        if clientCache is None:
+            return
+        if apiVersion is None and kind is None:
+            clientCache.clear()
+        else:
+            clientCache.pop((apiVersion, kind), None)
+
+
+def isResourceTypeNotFound(e: NotFoundError) -> bool:
+    """
+    Distinguish a 404 caused by the resource type itself being unknown to the API server from a 404 for a
+    single named object.  The latter always carries the name of the missing object in the Status details.
+    """
+    try:
+        status = json.loads(e.body)
+    except (TypeError, ValueError):
+        return True
+    return not isinstance(status, dict) or "name" not in (status.get("details") or {})
+
+
+class CachedResource:
+    """
+    A discovered API resource, which evicts itself from the resource cache if the API server reports that its
+    type no longer exists.  All other attributes and methods are those of the wrapped resource.
+    """
+
+    def __init__(self, dynClient: DynamicClient, apiVersion: str, kind: str, resource):
+        self._dynClient = dynClient
+        self._apiVersion = apiVersion
+        self._kind = kind
+        self._resource = resource
+
+    def __getattr__(self, name):
+        attr = getattr(self._resource, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            try:
+                return attr(*args, **kwargs)
+            except NotFoundError as e:
+                if isResourceTypeNotFound(e):
+                    logger.debug(f"API resource {self._apiVersion}/{self._kind} was not found, evicting it from the cache")
+                    invalidateResourceAPI(self._dynClient, self._apiVersion, self._kind)
+                raise
+        return call
+
+    def __repr__(self):
+        return repr(self._resource)
+
+
+def getCacheDir(*subdirs: str) -> str:
+    """
+    Get (creating it if necessary) the directory used to cache data between runs.  The location can be set using the
+    MAS_DEVOPS_CACHE_DIR environment variable, and defaults to ~/.cache/mas-devops.
+
+    Raises OSError if the directory can not be created (e.g. HOME is read-only), the caches are only an optimisation so
+    callers should carry on without them.
+    """
+    cacheDir = os.path.join(os.environ.get("MAS_DEVOPS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mas-devops")), *subdirs)
+    os.makedirs(cacheDir, exist_ok=True)
+    return cacheDir
+
+
+def getDiscoveryCacheFile(host: str, cacheDir: str = None) -> str:
+    """
+    Get the path of the on-disk discovery snapshot for a cluster, by default in the directory given by getCacheDir
+    """
+    if cacheDir is None:
+        cacheDir = getCacheDir()
+    os.makedirs(cacheDir, exist_ok=True)
+    return os.path.join(cacheDir, f"discovery-{hashlib.sha256(host.encode('utf-8')).hexdigest()[:16]}.json")
+
+
+def createDynamicClient(k8s_client: api_client.ApiClient = None, cacheFile: str = None) -> DynamicClient:
+    """
+    Create an OpenShift client.  The results of API discovery are saved in a snapshot on disk (by default in the
+    location given by getDiscoveryCacheFile) so that short-lived processes talking to the same cluster can skip
+    discovery on a warm start.  Resources missing from the snapshot (e.g. a CRD installed since it was taken) are
+    discovered on demand and the snapshot is updated.
+    """
+    if k8s_client is None:
+        k8s_client = api_client.ApiClient()
+    if cacheFile is None:
+        try:
+            cacheFile = getDiscoveryCacheFile(k8s_client.configuration.host)
+        except OSError as e:
+            # Fall back to the client's own default location for the discovery cache
+            logger.debug(f"Discovery snapshot is not available: {e}")
+    return DynamicClient(k8s_client, cache_file=cacheFile)
@@ -0,0 +1,261 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import logging
+import socket
+import threading
+
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from kubernetes.dynamic.resource import ResourceInstance
+from openshift.dynamic import DynamicClient
+from openshift.dynamic.exceptions import NotFoundError, ResourceNotFoundError
+
+from .discovery import getResourceAPI
+
+logger = logging.getLogger(__name__)
+
+# The kinds looked up repeatedly during an install (by crdExists, verifyMasInstance, getStorageClass, createNamespace
+# and isAirgapInstall), which are cached by startInformers unless told otherwise
+INFORMER_KINDS = [
+    ("apiextensions.k8s.io/v1", "CustomResourceDefinition"),
+    ("core.mas.ibm.com/v1", "Suite"),
+    ("storage.k8s.io/v1", "StorageClass"),
+    ("v1", "Namespace"),
+    ("operator.openshift.io/v1alpha1", "ImageContentSourcePolicy"),
+]
+
+INFORMER_PAGE_SIZE = 500
+INFORMER_WATCH_TIMEOUT = 300
+
+# How long to wait before listing again after the watch fails for any reason other than an expired resourceVersion
+INFORMER_RETRY_INTERVAL = 5
+
+# Informers are shared per DynamicClient, see startInformers.  Their threads keep the client in use, so the client (and
+# its informers) are only released by stopInformers
+_informers = {}
+_informersLock = threading.Lock()
+
+
+def closeWatch(watcher: watch.Watch) -> None:
+    """
+    End a watch that is being streamed in another thread.  The thread is usually blocked waiting for the next event,
+    which shutting down the connection interrupts (rather than leaving the thread running until the server ends the
+    watch).
+    """
+    watcher.stop()
+    sock = getattr(getattr(getattr(watcher, "_resp", None), "connection", None), "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class Informer:
+    """
+    An in-memory copy of every resource of one kind, kept up to date by a background thread.
+
+    The store is filled with a (paginated) LIST, then kept current by watching from the resourceVersion of that list,
+    resuming the watch from the last resourceVersion we saw whenever the server closes it and listing again only if
+    that version has expired.  Should the watch fail for any other reason the informer reports itself as not synced
+    (so callers go back to the API server) until it has listed successfully again.
+
+    Changes are seen as soon as the API server reports them, but a change made by this process may not be in the store
+    the moment the API call that made it returns.
+    """
+
+    def __init__(self, dynClient: DynamicClient, apiVersion: str, kind: str):
+        self.dynClient = dynClient
+        self.apiVersion = apiVersion
+        self.kind = kind
+        self.resourceAPI = getResourceAPI(dynClient, apiVersion, kind)
+        self._store = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stop = threading.Event()
+        self._resourceVersion = None
+        self._thread = None
+        self._watcher = None
+
+    @property
+    def synced(self) -> bool:
+        return self._synced.is_set()
+
+    def start(self) -> "Informer":
+        """
+        Fill the store, then start watching for changes in the background.  Errors from the initial LIST (e.g. if we
+        are not permitted to list the kind) are raised to the caller.
+        """
+        self._list()
+        self._thread = threading.Thread(target=self._run, name=f"informer-{self.kind}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop watching for changes, the store will no longer be used
+        """
+        self._stop.set()
+        self._synced.clear()
+        self._closeWatch()
+
+    def _closeWatch(self) -> None:
+        if self._watcher is not None:
+            closeWatch(self._watcher)
+
+    def get(self, name: str, namespace: str = None):
+        """
+        Get a resource from the store, None if it does not exist
+        """
+        with self._lock:
+            obj = self._store.get((namespace, name))
+        return None if obj is None else ResourceInstance(self.dynClient, obj)
+
+    def list(self, namespace: str = None) -> list:
+        """
+        Get all the resources in the store, optionally only those in one namespace
+        """
+        with self._lock:
+            objs = [obj for (objNamespace, name), obj in self._store.items() if namespace is None or objNamespace == namespace]
+        return [ResourceInstance(self.dynClient, obj) for obj in objs]
+
+    def _key(self, obj: dict) -> tuple:
+        return (obj["metadata"].get("namespace"), obj["metadata"]["name"])
+
+    def _list(self) -> None:
+        store = {}
+        continueToken = None
+        while True:
+            page = self.resourceAPI.get(limit=INFORMER_PAGE_SIZE, _continue=continueToken).to_dict()
+            for item in page.get("items") or []:
+                item.setdefault("apiVersion", self.apiVersion)
+                item.setdefault("kind", self.kind)
+                store[self._key(item)] = item
+            continueToken = page["metadata"].get("continue")
+            if not continueToken:
+                break
+        with self._lock:
+            self._store = store
+            self._resourceVersion = page["metadata"]["resourceVersion"]
+        self._synced.set()
+        logger.debug(f"Informer for {self.kind} synced {len(store)} resources at resourceVersion {self._resourceVersion}")
+
+    def _watch(self) -> None:
+        self._watcher = watch.Watch()
+        if self._stop.is_set():
+            return
+        for event in self.resourceAPI.watch(resource_version=self._resourceVersion, timeout=INFORMER_WATCH_TIMEOUT, watcher=self._watcher):
+            if self._stop.is_set():
+                return
+            obj = event["raw_object"]
+            obj.setdefault("apiVersion", self.apiVersion)
+            obj.setdefault("kind", self.kind)
+            with self._lock:
+                if event["type"] == "DELETED":
+                    self._store.pop(self._key(obj), None)
+                elif event["type"] in ["ADDED", "MODIFIED"]:
+                    self._store[self._key(obj)] = obj
+                self._resourceVersion = obj["metadata"]["resourceVersion"]
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._resourceVersion is None:
+                    self._list()
+                self._watch()
+            except ApiException as e:
+                if e.status == 410:
+                    logger.debug(f"Watch of {self.kind} expired, listing again")
+                else:
+                    logger.warning(f"Informer for {self.kind} failed, falling back to the API server until it recovers: {e.reason}")
+                    self._synced.clear()
+                    self._stop.wait(INFORMER_RETRY_INTERVAL)
+                self._resourceVersion = None
+            except Exception as e:
+                if self._stop.is_set():
+                    # The watch was closed by stop()
+                    break
+                logger.warning(f"Informer for {self.kind} failed, falling back to the API server until it recovers: {e}")
+                self._synced.clear()
+                self._resourceVersion = None
+                self._stop.wait(INFORMER_RETRY_INTERVAL)
+
+
+def startInformers(dynClient: DynamicClient, kinds: list = None) -> list:
+    """
+    Start caching the given (apiVersion, kind)s (by default INFORMER_KINDS) for a client, so that lookupResource, and
+    the helpers built on it, answer from memory instead of making an API call.  Kinds that are not installed on the
+    cluster, or that we are not permitted to list, are skipped and will continue to be looked up on the API server.
+
+    The informers keep running (and keep the client alive) until stopInformers is called for the client.
+
+    Returns:
+      list: The Informers for the kinds being cached
+    """
+    if kinds is None:
+        kinds = INFORMER_KINDS
+    started = []
+    for apiVersion, kind in kinds:
+        with _informersLock:
+            informer = _informers.setdefault(dynClient, {}).get((apiVersion, kind))
+        if informer is None:
+            try:
+                informer = Informer(dynClient, apiVersion, kind).start()
+            except ResourceNotFoundError:
+                logger.debug(f"Not caching {apiVersion}/{kind}, the resource type is not installed")
+                continue
+            except ApiException as e:
+                logger.warning(f"Not caching {apiVersion}/{kind}, unable to list: {e.reason}")
+                continue
+            with _informersLock:
+                existing = _informers.setdefault(dynClient, {}).setdefault((apiVersion, kind), informer)
+            if existing is not informer:
+                # Another thread started caching this kind at the same time
+                informer.stop()
+                informer = existing
+        started.append(informer)
+    return started
+
+
+def stopInformers(dynClient: DynamicClient) -> None:
+    """
+    Stop caching resources for a client, lookups go back to the API server.  This must be called once the client is no
+    longer needed, otherwise its informers (and the client) are kept for the life of the process.
+    """
+    with _informersLock:
+        informers = _informers.pop(dynClient, {})
+    for informer in informers.values():
+        informer.stop()
+
+
+def getInformer(dynClient: DynamicClient, apiVersion: str, kind: str) -> Informer:
+    """
+    Get the Informer for a kind, None if the kind is not being cached or the cache is not currently in sync
+    """
+    with _informersLock:
+        informer = _informers.get(dynClient, {}).get((apiVersion, kind))
+    if informer is None or not informer.synced:
+        return None
+    return informer
+
+
+def lookupResource(dynClient: DynamicClient, apiVersion: str, kind: str, name: str, namespace: str = None):
+    """
+    Get a resource, None if it does not exist.  If the kind is being cached (see startInformers) the answer comes from
+    memory, otherwise from a GET on the API server.
+    """
+    informer = getInformer(dynClient, apiVersion, kind)
+    if informer is not None:
+        return informer.get(name, namespace)
+    try:
+        return getResourceAPI(dynClient, apiVersion, kind).get(name=name, namespace=namespace)
+    except NotFoundError:
+        return None
@@ -11,27 +11,23 @@
 import logging
 
 from openshift.dynamic import DynamicClient
-from openshift.dynamic.exceptions import NotFoundError, UnauthorizedError
+from openshift.dynamic.exceptions import UnauthorizedError
+
+from .informer import lookupResource
+from .ocp import listResources
 
 logger = logging.getLogger(__name__)
 
 
 def isAirgapInstall(dynClient: DynamicClient) -> bool:
-    try:
-        ICSPApi = dynClient.resources.get(api_version="operator.openshift.io/v1alpha1", kind="ImageContentSourcePolicy")
-        ICSPApi.get(name="ibm-mas-and-dependencies")
-        return True
-    except NotFoundError:
-        return False
+    return lookupResource(dynClient, "operator.openshift.io/v1alpha1", "ImageContentSourcePolicy", "ibm-mas-and-dependencies") is not None
 
 
 def listMasInstances(dynClient: DynamicClient) -> list:
     """
     Get a list of MAS instances on the cluster
     """
-    suitesAPI = dynClient.resources.get(api_version="core.mas.ibm.com/v1", kind="Suite")
-
-    suites = suitesAPI.get().to_dict()['items']
+    suites = [suite.to_dict() for suite in listResources(dynClient, "core.mas.ibm.com/v1", "Suite")]
     if len(suites) > 0:
         logger.info(f"There are {len(suites)} MAS instances installed on this cluster:")
         for suite in suites:
@@ -46,11 +42,7 @@ def verifyMasInstance(dynClient: DynamicClient, instanceId: str) -> bool:
     Validate that the chosen MAS instance exists
     """
     try:
-        suitesAPI = dynClient.resources.get(api_version="core.mas.ibm.com/v1", kind="Suite")
-        suitesAPI.get(name=instanceId, namespace=f"mas-{instanceId}-core")
-        return True
-    except NotFoundError:
-        return False
+        return lookupResource(dynClient, "core.mas.ibm.com/v1", "Suite", instanceId, namespace=f"mas-{instanceId}-core") is not None
     except UnauthorizedError:
         logger.error("Error: Unable to verify MAS instance due to failed authorization: {e}")
         return False
@@ -0,0 +1,193 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import json
+import logging
+import threading
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic
+from typing import Callable
+
+from .session import ClusterSession
+
+logger = logging.getLogger(__name__)
+
+# The views of a ClusterSession that can be passed as the first argument to the function being run
+CLUSTER_VIEWS = ["dynClient", "apiClient", "coreV1Api", "customObjectsApi", "session"]
+
+# How often we check for clusters that have run out of time while waiting for the others to finish
+CLUSTER_TIMEOUT_CHECK_INTERVAL = 1
+
+
+def _clusterSession(target) -> tuple:
+    """
+    Get (name, session, whether we created the session) for a target, which is either a ClusterSession, a
+    (server, token) tuple, or a dict of ClusterSession arguments with an optional name
+    """
+    if isinstance(target, ClusterSession):
+        return target.host, target, False
+    if isinstance(target, (tuple, list)):
+        server, token = target
+        return server, ClusterSession(server, token), True
+    if isinstance(target, dict):
+        sessionArgs = dict(target)
+        name = sessionArgs.pop("name", None)
+        clusterSession = ClusterSession(**sessionArgs)
+        return name or clusterSession.host, clusterSession, True
+    raise ValueError(f"Unsupported cluster target: {target!r}")
+
+
+def _targetName(target) -> str:
+    if isinstance(target, ClusterSession):
+        return target.host
+    if isinstance(target, (tuple, list)) and len(target) > 0:
+        return target[0]
+    if isinstance(target, dict):
+        return target.get("name") or target.get("server") or target.get("context")
+    return repr(target)
+
+
+def streamOnClusters(targets: list, func: Callable, *args, view: str = "dynClient", maxWorkers: int = 8, timeout: float = None, **kwargs):
+    """
+    Run a function against many clusters in parallel, yielding the result for each cluster as soon as it is available.
+
+    Each cluster gets its own ClusterSession (unless the target already is one), so clusters never share a client or
+    depend on the current kubeconfig context.  The function is called as func(client, *args, **kwargs), where client
+    is the view of the session given by view, e.g. the DynamicClient for mas.devops.mas.listMasInstances or
+    mas.devops.ocp.getStorageClasses, or the ApiClient for mas.devops.db2.validate_db2_configs.
+
+    Parameters:
+      targets (list): The clusters, each either a ClusterSession, a (server, token) tuple, or a dict of
+                      ClusterSession arguments (e.g. server, token, skipVerify or context) with an optional name
+      func (Callable): The function to run
+      view (str, optional): The client passed to func, one of CLUSTER_VIEWS. Defaults to "dynClient".
+      maxWorkers (int, optional): The maximum number of clusters to query concurrently. Defaults to 8.
+      timeout (float, optional): How long (in seconds) each cluster is given, from the time its query starts. A
+                                 cluster that runs out of time is reported as failed; its query can not be
+                                 interrupted so it carries on in the background, but its result is discarded.
+
+    Yields:
+      dict: {"cluster", "result", "error", "duration"} for each cluster, in the order they finish.  If the function
+            raised an exception (or timed out) error describes the problem and result is None.
+    """
+    for index, result in _runOnClusters(targets, func, args, kwargs, view, maxWorkers, timeout):
+        yield result
+
+
+def _runOnClusters(targets: list, func: Callable, args: tuple, kwargs: dict, view: str, maxWorkers: int, timeout: float):
+    """
+    Yields (the index of the target, the result) for each cluster as it finishes
+    """
+    if view not in CLUSTER_VIEWS:
+        raise ValueError(f"Unsupported view: {view}")
+
+    started = {}
+    startedLock = threading.Lock()
+
+    def run(index, target):
+        with startedLock:
+            started[index] = monotonic()
+        result = dict(cluster=_targetName(target), result=None, error=None, duration=None)
+        clusterSession = None
+        created = False
+        try:
+            result["cluster"], clusterSession, created = _clusterSession(target)
+            result["result"] = func(getattr(clusterSession, view) if view != "session" else clusterSession, *args, **kwargs)
+        except Exception as e:
+            logger.warning(f"{getattr(func, '__name__', func)} failed on {result['cluster']}: {e}")
+            result["error"] = str(e) or type(e).__name__
+        finally:
+            if created:
+                clusterSession.close()
+        result["duration"] = round(monotonic() - started[index], 3)
+        return result
+
+    executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="cluster")
+    futures = {executor.submit(run, index, target): index for index, target in enumerate(targets)}
+    pending = set(futures)
+    try:
+        while pending:
+            waitTimeout = None
+            if timeout is not None:
+                now = monotonic()
+                with startedLock:
+                    startTimes = {future: started.get(futures[future]) for future in pending}
+                for future, startTime in startTimes.items():
+                    if startTime is not None and now - startTime >= timeout and not future.done():
+                        pending.discard(future)
+                        yield futures[future], dict(cluster=_targetName(targets[futures[future]]), result=None, error=f"Timed out after {timeout} seconds", duration=timeout)
+                deadlines = [startTime + timeout - now for future, startTime in startTimes.items() if startTime is not None and future in pending]
+                waitTimeout = max(0, min(deadlines, default=CLUSTER_TIMEOUT_CHECK_INTERVAL))
+
+            done, pending = wait(pending, timeout=waitTimeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield futures[future], future.result()
+    finally:
+        # Don't wait for queries that have timed out, or that have not started because the caller stopped iterating
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def runOnClusters(targets: list, func: Callable, *args, view: str = "dynClient", maxWorkers: int = 8, timeout: float = None, **kwargs) -> list:
+    """
+    Run a function against many clusters in parallel, see streamOnClusters.
+
+    Returns:
+      list: {"cluster", "result", "error", "duration"} for each cluster, in the same order as targets
+    """
+    results = [None] * len(targets)
+    for index, result in _runOnClusters(targets, func, args, kwargs, view, maxWorkers, timeout):
+        results[index] = result
+    return results
+
+
+def _summarise(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return ", ".join(_summarise(item) for item in value) if len(value) > 0 else "-"
+    name = _resourceName(value)
+    if name is not None:
+        return name
+    return str(value)
+
+
+def _resourceName(value) -> str:
+    try:
+        return value["metadata"]["name"]
+    except (KeyError, TypeError, IndexError):
+        pass
+    metadata = getattr(value, "metadata", None)
+    return getattr(metadata, "name", None)
+
+
+def _toJSON(value):
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    return str(value)
+
+
+def formatClusterResults(results: list, output: str = "table") -> str:
+    """
+    Format the results of runOnClusters as a table (one row per cluster, listing the names of any resources
+    returned) or as JSON
+    """
+    if output == "json":
+        return json.dumps(results, indent=2, default=_toJSON)
+    if output != "table":
+        raise ValueError(f"Unsupported output format: {output}")
+
+    rows = [("CLUSTER", "DURATION", "RESULT")]
+    for result in results:
+        rows.append((
+            str(result["cluster"]),
+            f"{result['duration']}s" if result["duration"] is not None else "-",
+            f"ERROR: {result['error']}" if result["error"] is not None else _summarise(result["result"])
+        ))
+    widths = [max(len(row[i]) for row in rows) for i in range(2)]
+    return "\n".join(f"{row[0]:<{widths[0]}}  {row[1]:<{widths[1]}}  {row[2]}" for row in rows)
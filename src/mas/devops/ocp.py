@@ -8,29 +8,46 @@
 #
 # *****************************************************************************
 
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
 import logging
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from math import ceil
+from os import path
+from time import monotonic, sleep
+from typing import Callable
 
-from kubeconfig import KubeConfig
-from kubeconfig.exceptions import KubectlNotFoundError
 from openshift.dynamic import DynamicClient
-from openshift.dynamic.exceptions import NotFoundError
+from openshift.dynamic.exceptions import NotFoundError, ForbiddenError, MethodNotAllowedError, ConflictError
 
 from kubernetes import client
+from kubernetes.client.rest import ApiException
 from kubernetes.stream import stream
 from kubernetes.stream.ws_client import ERROR_CHANNEL
 
 import yaml
 
+from .discovery import getResourceAPI
+from .informer import lookupResource
+
 logger = logging.getLogger(__name__)
 
 
 def connect(server: str, token: str, skipVerify: bool = False) -> bool:
     """
-    Connect to target OCP
+    Connect to target OCP by updating the current context of the kubeconfig file (using kubectl).  To work with a
+    cluster without modifying the kubeconfig file use mas.devops.session.ClusterSession instead.
     """
     logger.info(f"Connect(server={server}, token=***)")
 
+    # kubeconfig is slow to import and only needed here
+    from kubeconfig import KubeConfig
+    from kubeconfig.exceptions import KubectlNotFoundError
+
     try:
         conf = KubeConfig()
     except KubectlNotFoundError:
@@ -65,120 +82,691 @@ def createNamespace(dynClient: DynamicClient, namespace: str) -> bool:
     """
     Create a namespace if it does not exist
     """
-    namespaceAPI = dynClient.resources.get(api_version="v1", kind="Namespace")
-    try:
-        namespaceAPI.get(name=namespace)
+    if lookupResource(dynClient, "v1", "Namespace", namespace) is not None:
         logger.debug(f"Namespace {namespace} already exists")
-    except NotFoundError:
-        nsObj = {
-            "apiVersion": "v1",
-            "kind": "Namespace",
-            "metadata": {
-                "name": namespace
-            }
+        return True
+
+    nsObj = {
+        "apiVersion": "v1",
+        "kind": "Namespace",
+        "metadata": {
+            "name": namespace
         }
-        namespaceAPI.create(body=nsObj)
+    }
+    try:
+        getResourceAPI(dynClient, "v1", "Namespace").create(body=nsObj)
         logger.debug(f"Created namespace {namespace}")
+    except ConflictError:
+        # Created since we looked (or since the cached copy of the namespaces was last updated)
+        logger.debug(f"Namespace {namespace} already exists")
     return True
 
 
-def waitForCRD(dynClient: DynamicClient, crdName: str) -> bool:
-    crdAPI = dynClient.resources.get(api_version="apiextensions.k8s.io/v1", kind="CustomResourceDefinition")
-    maxRetries = 100
-    foundReadyCRD = False
-    retries = 0
-    while not foundReadyCRD and retries < maxRetries:
-        retries += 1
+def createResources(dynClient: DynamicClient, resources: list, maxWorkers: int = 8) -> dict:
+    """
+    Create many resources concurrently, leaving any that already exist untouched (create-or-ignore-conflict).  Every
+    resource is attempted before any failures are reported.
+
+    Parameters:
+      dynClient (DynamicClient): The OpenShift client
+      resources (list): The resources to create, each including apiVersion, kind and metadata (with the namespace
+                        for namespaced resources)
+      maxWorkers (int, optional): The maximum number of resources to create concurrently. Defaults to 8.
+
+    Returns:
+      dict: {"created": [...], "existing": [...]}, identifying each resource as kind/name or kind/namespace/name
+    """
+    def resourceId(resource):
+        metadata = resource["metadata"]
+        return "/".join(part for part in [resource["kind"], metadata.get("namespace"), metadata["name"]] if part)
+
+    def create(resource):
+        resourceAPI = getResourceAPI(dynClient, resource["apiVersion"], resource["kind"])
         try:
-            crd = crdAPI.get(name=crdName)
-            conditions = crd.status.conditions
-            for condition in conditions:
-                if condition.type == "Established":
-                    if condition.status == "True":
-                        foundReadyCRD = True
-                    else:
-                        logger.debug(f"Waiting 5s for {crdName} CRD to be ready before checking again ...")
-                        sleep(5)
-                        continue
-        except NotFoundError:
-            logger.debug(f"Waiting 5s for {crdName} CRD to be installed before checking again ...")
-            sleep(5)
-    return foundReadyCRD
-
-
-def waitForDeployment(dynClient: DynamicClient, namespace: str, deploymentName: str) -> bool:
-    deploymentAPI = dynClient.resources.get(api_version="apps/v1", kind="Deployment")
-    maxRetries = 100
-    foundReadyDeployment = False
-    retries = 0
-    while not foundReadyDeployment and retries < maxRetries:
-        retries += 1
+            resourceAPI.create(body=resource, namespace=resource["metadata"].get("namespace"))
+            logger.debug(f"Created {resourceId(resource)}")
+            return "created"
+        except ConflictError:
+            logger.debug(f"{resourceId(resource)} already exists")
+            return "existing"
+
+    results = dict(created=[], existing=[])
+    failures = []
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        futures = [(resource, executor.submit(create, resource)) for resource in resources]
+        for resource, future in futures:
+            try:
+                results[future.result()].append(resourceId(resource))
+            except Exception as e:
+                logger.warning(f"Unable to create {resourceId(resource)}: {e}")
+                failures.append(resourceId(resource))
+
+    if len(failures) > 0:
+        raise Exception(f"Failed to create {len(failures)} resources: {', '.join(failures)}")
+    return results
+
+
+def createNamespaces(dynClient: DynamicClient, namespaces: list, maxWorkers: int = 8) -> dict:
+    """
+    Create many namespaces concurrently, ignoring any that already exist, see createResources
+    """
+    return createResources(dynClient, [{"apiVersion": "v1", "kind": "Namespace", "metadata": {"name": namespace}} for namespace in namespaces], maxWorkers=maxWorkers)
+
+
+# Files are base64 encoded a chunk at a time, the chunk size must be a multiple of 3 so the chunks encode independently
+SECRET_FILE_CHUNK_SIZE = 3 * 64 * 1024
+
+
+def buildFileSecret(name: str, fileNames: list) -> dict:
+    """
+    Build a Secret containing the content of one or more files, keyed by file name, equivalent to
+    kubectl create secret generic {name} --from-file {fileName}
+
+    The files are read and base64 encoded a chunk at a time, rather than being loaded into memory in one go.
+    """
+    data = {}
+    for fileName in fileNames:
+        encoded = []
+        with open(fileName, "rb") as f:
+            for chunk in iter(lambda: f.read(SECRET_FILE_CHUNK_SIZE), b""):
+                encoded.append(base64.b64encode(chunk).decode("ascii"))
+        data[path.basename(fileName)] = "".join(encoded)
+
+    return {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "type": "Opaque",
+        "metadata": {
+            "name": name
+        },
+        "data": data
+    }
+
+
+def syncSecrets(dynClient: DynamicClient, namespace: str, secrets: list, maxWorkers: int = 4) -> dict:
+    """
+    Make sure each Secret exists in namespace with exactly the type and data given, creating it if it does not exist and
+    replacing it if its content differs (or deleting and re-creating it if its type differs, as the type of a secret is
+    immutable).  Secrets whose content already matches are not written at all.  The secrets are synced concurrently,
+    using at most maxWorkers threads.
+
+    Parameters:
+      dynClient (DynamicClient): The OpenShift client
+      namespace (str): The namespace of the secrets
+      secrets (list): The Secret bodies, the content may be given in data (base64 encoded) and/or stringData
+      maxWorkers (int, optional): The maximum number of secrets to write concurrently. Defaults to 4.
+
+    Returns:
+      dict: The number of secrets that were "created", "updated" and "unchanged"
+
+    Throws:
+    - Exception if any of the secrets could not be synced, after attempting all of them
+    """
+    secretsAPI = getResourceAPI(dynClient, "v1", "Secret")
+    counts = dict(created=0, updated=0, unchanged=0)
+    failures = []
+    with ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="secret-sync") as executor:
+        futures = [executor.submit(_syncSecret, secretsAPI, namespace, secret) for secret in secrets]
+        for secret, future in zip(secrets, futures):
+            try:
+                counts[future.result()] += 1
+            except Exception as e:
+                logger.error(f"Unable to sync Secret {secret['metadata']['name']} in {namespace}: {e}")
+                failures.append(secret["metadata"]["name"])
+
+    if len(failures) > 0:
+        raise Exception(f"Failed to sync {len(failures)} secrets in {namespace}: {', '.join(failures)}")
+    return counts
+
+
+def _secretContentHash(secretType: str, data: dict) -> str:
+    return hashlib.sha256(json.dumps(dict(type=secretType or "Opaque", data=data or {}), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _syncSecret(secretsAPI, namespace: str, secret: dict) -> str:
+    name = secret["metadata"]["name"]
+    # The API server folds stringData into data, so we do the same to be able to compare with the existing secret
+    data = dict(secret.get("data") or {})
+    for key, value in (secret.get("stringData") or {}).items():
+        data[key] = base64.b64encode(value.encode("utf-8")).decode("ascii")
+    body = {key: value for key, value in secret.items() if key != "stringData"}
+    body["metadata"] = dict(secret["metadata"], namespace=namespace)
+    body["data"] = data
+
+    try:
+        existing = secretsAPI.get(name=name, namespace=namespace)
+    except NotFoundError:
+        secretsAPI.create(body=body, namespace=namespace)
+        logger.debug(f"Created Secret {name} in {namespace}")
+        return "created"
+
+    existingData = existing.data.to_dict() if existing.data is not None else {}
+    if _secretContentHash(existing.type, existingData) == _secretContentHash(body.get("type"), data):
+        logger.debug(f"Secret {name} in {namespace} is unchanged")
+        return "unchanged"
+
+    if (existing.type or "Opaque") != (body.get("type") or "Opaque"):
+        # The type of a secret is immutable, so it can only be changed by deleting and re-creating the secret
+        secretsAPI.delete(name=name, namespace=namespace)
+        secretsAPI.create(body=body, namespace=namespace)
+        logger.debug(f"Re-created Secret {name} in {namespace} to change its type from {existing.type} to {body.get('type')}")
+        return "updated"
+
+    body["metadata"]["resourceVersion"] = existing.metadata.resourceVersion
+    secretsAPI.replace(body=body, namespace=namespace)
+    logger.debug(f"Replaced Secret {name} in {namespace}")
+    return "updated"
+
+
+# The longest we will hold a single watch request open before resuming from the last resourceVersion we saw
+WATCH_REQUEST_TIMEOUT = 300
+
+
+def waitForResource(dynClient: DynamicClient, apiVersion: str, kind: str, name: str, namespace: str = None,
+                    condition: Callable = None, timeout: int = 500, pollInterval: float = 1, maxPollInterval: float = 30) -> bool:
+    """
+    Wait for a resource to exist and satisfy a condition.
+
+    The current state is established with a single LIST call, after which we watch the resource from that
+    resourceVersion so that a change of state is detected as soon as the API server reports it.  When the server
+    closes the watch we resume from the last resourceVersion we saw, re-listing only if that version has expired.
+    If we are not permitted to list or watch the resource we fall back to polling it with exponential backoff.
+
+    Parameters:
+      dynClient (DynamicClient): The OpenShift client
+      apiVersion (str): The apiVersion of the resource (e.g. "apps/v1")
+      kind (str): The kind of the resource (e.g. "Deployment")
+      name (str): The name of the resource
+      namespace (str, optional): The namespace of the resource, omit for cluster scoped resources
+      condition (Callable, optional): Predicate called with the resource, the wait ends when it returns True.
+                                      Defaults to waiting for the resource to exist.
+      timeout (int, optional): Overall deadline in seconds, None to wait indefinitely. Defaults to 500.
+      pollInterval (float, optional): Initial delay between polls when we are unable to watch. Defaults to 1.
+      maxPollInterval (float, optional): Maximum delay between polls when we are unable to watch. Defaults to 30.
+
+    Returns:
+      bool: True if the condition was met before the deadline, False otherwise
+    """
+    resourceAPI = getResourceAPI(dynClient, apiVersion, kind)
+    if condition is None:
+        condition = _resourceExists
+    deadline = None if timeout is None else monotonic() + timeout
+
+    try:
+        return _waitForResourceWatch(resourceAPI, name, namespace, condition, deadline)
+    except (ForbiddenError, MethodNotAllowedError) as e:
+        logger.debug(f"Unable to watch {kind} {name}, falling back to polling: {e.reason}")
+        return _waitForResourcePoll(resourceAPI, name, namespace, condition, deadline, pollInterval, maxPollInterval)
+
+
+def _resourceExists(resource) -> bool:
+    return True
+
+
+def _remainingTime(deadline: float) -> float:
+    return None if deadline is None else deadline - monotonic()
+
+
+def _waitForResourceWatch(resourceAPI, name: str, namespace: str, condition: Callable, deadline: float) -> bool:
+    resourceVersion = None
+    while True:
+        if resourceVersion is None:
+            # (Re)establish the current state and the resourceVersion to watch from
+            current = resourceAPI.get(namespace=namespace, field_selector=f"metadata.name={name}")
+            for item in current.items:
+                if condition(item):
+                    return True
+            resourceVersion = current.metadata.resourceVersion
+
+        remaining = _remainingTime(deadline)
+        if remaining is not None and remaining <= 0:
+            return False
+        watchTimeout = WATCH_REQUEST_TIMEOUT if remaining is None else min(WATCH_REQUEST_TIMEOUT, ceil(remaining))
+
+        logger.debug(f"Watching {resourceAPI.kind} {name} from resourceVersion {resourceVersion} for up to {watchTimeout}s ...")
+        try:
+            for event in resourceAPI.watch(namespace=namespace, name=name, resource_version=resourceVersion, timeout=watchTimeout):
+                resourceVersion = event["object"].metadata.resourceVersion
+                if event["type"] in ["ADDED", "MODIFIED"] and condition(event["object"]):
+                    return True
+        except ApiException as e:
+            if e.status != 410:
+                raise
+            # The resourceVersion we were watching from is too old, we need to list again
+            logger.debug(f"Watch of {resourceAPI.kind} {name} expired, listing again")
+            resourceVersion = None
+
+
+def _waitForResourcePoll(resourceAPI, name: str, namespace: str, condition: Callable, deadline: float, pollInterval: float, maxPollInterval: float) -> bool:
+    delay = pollInterval
+    while True:
         try:
-            deployment = deploymentAPI.get(name=deploymentName, namespace=namespace)
-            if deployment.status.readyReplicas is not None and deployment.status.readyReplicas > 0:
-                # Depending on how early we are checking the deployment the status subresource may not
-                # have even been initialized yet, hence the check for "is not None" to avoid a
-                # NoneType and int comparison TypeError
-                foundReadyDeployment = True
-            else:
-                logger.debug("Waiting 5s for deployment {deploymentName} to be ready before checking again ...")
-                sleep(5)
+            if condition(resourceAPI.get(name=name, namespace=namespace)):
+                return True
         except NotFoundError:
-            logger.debug("Waiting 5s for deployment {deploymentName} to be created before checking again ...")
-            sleep(5)
-    return foundReadyDeployment
+            pass
+
+        remaining = _remainingTime(deadline)
+        if remaining is not None and remaining <= 0:
+            return False
+        if remaining is not None:
+            delay = min(delay, remaining)
+        logger.debug(f"Waiting {delay:.0f}s for {resourceAPI.kind} {name} before checking again ...")
+        sleep(delay)
+        delay = min(delay * 2, maxPollInterval)
+
+
+def waitForResources(dynClient: DynamicClient, apiVersion: str, kind: str, resources: list, condition: Callable = None,
+                     timeout: int = 500, pollInterval: float = 1, maxPollInterval: float = 30) -> list:
+    """
+    Wait for many resources of the same kind, given as (namespace, name) tuples, to exist and satisfy a condition.
+
+    Rather than watching each resource separately, the resources are listed once and then watched with a single
+    request (across all namespaces unless they share one, and restricted to their name if they all share one).  As
+    with waitForResource, we fall back to polling if we are not permitted to list or watch.
+
+    Returns:
+      list: The (namespace, name) of each resource that did not satisfy the condition before the deadline
+    """
+    resourceAPI = getResourceAPI(dynClient, apiVersion, kind)
+    if condition is None:
+        condition = _resourceExists
+    deadline = None if timeout is None else monotonic() + timeout
+    pending = set(resources)
+
+    namespaces = set(namespace for namespace, name in pending)
+    names = set(name for namespace, name in pending)
+    namespace = namespaces.pop() if len(namespaces) == 1 else None
+    fieldSelector = f"metadata.name={names.pop()}" if len(names) == 1 else None
+
+    try:
+        _waitForResourcesWatch(resourceAPI, pending, namespace, fieldSelector, condition, deadline)
+    except (ForbiddenError, MethodNotAllowedError) as e:
+        logger.debug(f"Unable to watch {kind}, falling back to polling: {e.reason}")
+        _waitForResourcesPoll(resourceAPI, pending, condition, deadline, pollInterval, maxPollInterval)
+    return sorted(pending, key=lambda resource: (resource[0] or "", resource[1]))
+
+
+def _waitForResourcesWatch(resourceAPI, pending: set, namespace: str, fieldSelector: str, condition: Callable, deadline: float) -> None:
+    def check(resource):
+        key = (resource.metadata.namespace, resource.metadata.name)
+        if key in pending and condition(resource):
+            pending.discard(key)
+
+    resourceVersion = None
+    while len(pending) > 0:
+        if resourceVersion is None:
+            # (Re)establish the current state and the resourceVersion to watch from
+            current = resourceAPI.get(namespace=namespace, field_selector=fieldSelector)
+            for item in current.items:
+                check(item)
+            resourceVersion = current.metadata.resourceVersion
+            if len(pending) == 0:
+                return
+
+        remaining = _remainingTime(deadline)
+        if remaining is not None and remaining <= 0:
+            return
+        watchTimeout = WATCH_REQUEST_TIMEOUT if remaining is None else min(WATCH_REQUEST_TIMEOUT, ceil(remaining))
+
+        logger.debug(f"Watching {len(pending)} {resourceAPI.kind}s from resourceVersion {resourceVersion} for up to {watchTimeout}s ...")
+        try:
+            for event in resourceAPI.watch(namespace=namespace, field_selector=fieldSelector, resource_version=resourceVersion, timeout=watchTimeout):
+                resourceVersion = event["object"].metadata.resourceVersion
+                if event["type"] in ["ADDED", "MODIFIED"]:
+                    check(event["object"])
+                    if len(pending) == 0:
+                        return
+        except ApiException as e:
+            if e.status != 410:
+                raise
+            # The resourceVersion we were watching from is too old, we need to list again
+            logger.debug(f"Watch of {resourceAPI.kind}s expired, listing again")
+            resourceVersion = None
+
+
+def _waitForResourcesPoll(resourceAPI, pending: set, condition: Callable, deadline: float, pollInterval: float, maxPollInterval: float) -> None:
+    delay = pollInterval
+    while True:
+        for namespace, name in list(pending):
+            try:
+                if condition(resourceAPI.get(name=name, namespace=namespace)):
+                    pending.discard((namespace, name))
+            except NotFoundError:
+                pass
+        if len(pending) == 0:
+            return
+
+        remaining = _remainingTime(deadline)
+        if remaining is not None and remaining <= 0:
+            return
+        if remaining is not None:
+            delay = min(delay, remaining)
+        logger.debug(f"Waiting {delay:.0f}s for {len(pending)} {resourceAPI.kind}s before checking again ...")
+        sleep(delay)
+        delay = min(delay * 2, maxPollInterval)
+
+
+def crdIsEstablished(crd) -> bool:
+    conditions = crd.status.conditions if crd.status is not None else None
+    if conditions is None:
+        return False
+    for condition in conditions:
+        if condition.type == "Established" and condition.status == "True":
+            return True
+    return False
+
+
+def deploymentIsReady(deployment) -> bool:
+    # Depending on how early we are checking the deployment the status subresource may not
+    # have even been initialized yet, hence the check for "is not None" to avoid a
+    # NoneType and int comparison TypeError
+    return deployment.status is not None and deployment.status.readyReplicas is not None and deployment.status.readyReplicas > 0
+
+
+def pvcIsBound(pvc) -> bool:
+    return pvc.status is not None and pvc.status.phase == "Bound"
+
+
+def waitForCRD(dynClient: DynamicClient, crdName: str, timeout: int = 500) -> bool:
+    logger.debug(f"Waiting for {crdName} CRD to be established ...")
+    return waitForResource(
+        dynClient,
+        apiVersion="apiextensions.k8s.io/v1",
+        kind="CustomResourceDefinition",
+        name=crdName,
+        condition=crdIsEstablished,
+        timeout=timeout
+    )
+
+
+def waitForDeployment(dynClient: DynamicClient, namespace: str, deploymentName: str, timeout: int = 500) -> bool:
+    logger.debug(f"Waiting for deployment {deploymentName} to be ready ...")
+    return waitForResource(
+        dynClient,
+        apiVersion="apps/v1",
+        kind="Deployment",
+        name=deploymentName,
+        namespace=namespace,
+        condition=deploymentIsReady,
+        timeout=timeout
+    )
+
+
+def waitForPVC(dynClient: DynamicClient, namespace: str, pvcName: str, timeout: int = None) -> bool:
+    logger.debug(f"Waiting for PVC {pvcName} to be bound ...")
+    return waitForResource(
+        dynClient,
+        apiVersion="v1",
+        kind="PersistentVolumeClaim",
+        name=pvcName,
+        namespace=namespace,
+        condition=pvcIsBound,
+        timeout=timeout
+    )
+
+
+def waitForPVCs(dynClient: DynamicClient, pvcs: list, timeout: int = None) -> list:
+    """
+    Wait for many PVCs, given as (namespace, name) tuples, to be bound, using a single watch.
+
+    Returns:
+      list: The (namespace, name) of each PVC that was not bound before the timeout
+    """
+    logger.debug(f"Waiting for {len(pvcs)} PVCs to be bound ...")
+    return waitForResources(dynClient, "v1", "PersistentVolumeClaim", pvcs, condition=pvcIsBound, timeout=timeout)
 
 
 def getConsoleURL(dynClient: DynamicClient) -> str:
-    routesAPI = dynClient.resources.get(api_version="route.openshift.io/v1", kind="Route")
+    routesAPI = getResourceAPI(dynClient, "route.openshift.io/v1", "Route")
     consoleRoute = routesAPI.get(name="console", namespace="openshift-console")
     return f"https://{consoleRoute.spec.host}"
 
 
+# The number of objects to fetch per request when listing resources
+LIST_PAGE_SIZE = 500
+
+# Ask for PartialObjectMetadata rather than full objects, accepting full objects from an API server that can't do that
+METADATA_ONLY_ACCEPT = "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1,application/json"
+
+
+def listResources(dynClient: DynamicClient, apiVersion: str, kind: str, namespace: str = None, labelSelector: str = None,
+                  fieldSelector: str = None, metadataOnly: bool = False, pageSize: int = LIST_PAGE_SIZE):
+    """
+    List resources a page at a time, yielding each one as it arrives rather than fetching every object in a single
+    response.  Stop iterating early and the remaining pages are never requested.
+
+    Parameters:
+      dynClient (DynamicClient): The OpenShift client
+      apiVersion (str): The apiVersion of the resource (e.g. "v1")
+      kind (str): The kind of the resource (e.g. "Node")
+      namespace (str, optional): Only list resources in this namespace. Defaults to all namespaces.
+      labelSelector (str, optional): Only list resources matching this label selector
+      fieldSelector (str, optional): Only list resources matching this field selector
+      metadataOnly (bool, optional): Only fetch the metadata of each resource (PartialObjectMetadata), which is far
+                                     smaller than e.g. a full Node. Defaults to False.
+      pageSize (int, optional): The number of resources to fetch per request. Defaults to LIST_PAGE_SIZE.
+
+    Yields:
+      ResourceField: Each resource, or just its apiVersion, kind and metadata if metadataOnly is set
+    """
+    resourceAPI = getResourceAPI(dynClient, apiVersion, kind)
+    continueToken = None
+    while True:
+        kwargs = dict(namespace=namespace, label_selector=labelSelector, field_selector=fieldSelector, limit=pageSize, _continue=continueToken)
+        if metadataOnly:
+            kwargs["header_params"] = {"Accept": METADATA_ONLY_ACCEPT}
+        page = resourceAPI.get(**kwargs)
+        yield from page.items
+        continueToken = page.metadata["continue"]
+        if not continueToken:
+            return
+
+
 def getNodes(dynClient: DynamicClient) -> str:
     try:
-        nodesAPI = dynClient.resources.get(api_version="v1", kind="Node")
-        nodes = nodesAPI.get().to_dict()['items']
-        return nodes
+        return [node.to_dict() for node in listResources(dynClient, "v1", "Node")]
     except Exception as e:
         logger.error(f"Error: Unable to get nodes: {e}")
         return []
 
 
 def getStorageClass(dynClient: DynamicClient, name: str) -> str:
-    try:
-        storageClassAPI = dynClient.resources.get(api_version="storage.k8s.io/v1", kind="StorageClass")
-        storageclass = storageClassAPI.get(name=name)
-        return storageclass
-    except NotFoundError:
-        return None
+    return lookupResource(dynClient, "storage.k8s.io/v1", "StorageClass", name)
 
 
 def getStorageClasses(dynClient: DynamicClient) -> list:
-    storageClassAPI = dynClient.resources.get(api_version="storage.k8s.io/v1", kind="StorageClass")
-    storageClasses = storageClassAPI.get().items
-    return storageClasses
+    return list(listResources(dynClient, "storage.k8s.io/v1", "StorageClass"))
+
+
+def getDefaultStorageClasses(dynClient: DynamicClient) -> list:
+    """
+    Get the names of the storage classes marked as the default for the cluster
+    """
+    defaultStorageClasses = []
+    for storageClass in listResources(dynClient, "storage.k8s.io/v1", "StorageClass", metadataOnly=True):
+        annotations = storageClass.metadata.annotations or {}
+        if annotations.get("storageclass.kubernetes.io/is-default-class") == "true":
+            defaultStorageClasses.append(storageClass.metadata.name)
+    return defaultStorageClasses
+
+
+def getOCPVersion(dynClient: DynamicClient) -> str:
+    """
+    Get the version of OpenShift the cluster is running (or upgrading to)
+    """
+    clusterVersionAPI = getResourceAPI(dynClient, "config.openshift.io/v1", "ClusterVersion")
+    clusterVersion = clusterVersionAPI.get(name="version")
+    return clusterVersion.status.desired.version
 
 
 def isSNO(dynClient: DynamicClient) -> bool:
-    return len(getNodes(dynClient)) == 1
+    # We only need to know whether there is more than one node, so we only fetch the metadata of the first two
+    return len(list(islice(listResources(dynClient, "v1", "Node", metadataOnly=True, pageSize=2), 2))) == 1
 
 
 def crdExists(dynClient: DynamicClient, crdName: str) -> bool:
-    crdAPI = dynClient.resources.get(api_version="apiextensions.k8s.io/v1", kind="CustomResourceDefinition")
-    try:
-        crdAPI.get(name=crdName)
+    if lookupResource(dynClient, "apiextensions.k8s.io/v1", "CustomResourceDefinition", crdName) is not None:
         logger.debug(f"CRD does exist: {crdName}")
         return True
-    except NotFoundError:
-        logger.debug(f"CRD does not exist: {crdName}")
-        return False
+    logger.debug(f"CRD does not exist: {crdName}")
+    return False
+
+
+# How often (in seconds) we check for output, and whether the timeout has passed, while a command runs in a pod
+EXEC_UPDATE_INTERVAL = 1
+
+# Only the tail of stderr is retained (for error reporting) when streaming command output
+EXEC_STDERR_LIMIT = 64 * 1024
+
+
+class PodExecError(Exception):
+    """
+    A command run in a pod finished unsuccessfully, exitCode is None if the failure was not a non-zero exit code
+    """
+    def __init__(self, message: str, exitCode: int = None, stderr: str = "", status: dict = None):
+        super().__init__(message)
+        self.exitCode = exitCode
+        self.stderr = stderr
+        self.status = status if status is not None else {}
+
+
+class PodExecTimeoutError(Exception):
+    """
+    A command run in a pod did not finish within the timeout
+    """
+
+
+class PodExecOutputLimitError(Exception):
+    """
+    A command run in a pod wrote more than the permitted number of bytes to stdout
+    """
+
+
+def execExitCode(status: dict) -> int:
+    """
+    Get the exit code of a command from the status reported on the exec error channel, None if the
+    command did not run to completion (e.g. the executable was not found in the container)
+    """
+    if status.get("status") == "Success":
+        return 0
+    if status.get("reason") == "NonZeroExitCode":
+        for cause in (status.get("details") or {}).get("causes") or []:
+            if cause.get("reason") == "ExitCode":
+                return int(cause.get("message"))
+    return None
+
+
+def streamExecInPod(core_v1_api: client.CoreV1Api, pod_name: str, namespace, command: list, timeout: int = None,
+                    lines: bool = False, maxBytes: int = None):
+    """
+    Executes a command in a Kubernetes pod, yielding the standard output as it arrives rather than
+    buffering all of it in memory, see execInPod for the access required.
+
+    Args:
+      core_v1_api (client.CoreV1Api): The Kubernetes API client.
+      pod_name (str): The name of the pod to execute the command in.
+      namespace (str): The namespace of the pod.
+      command (list): The command to execute in the pod.
+      timeout (int, optional): The timeout in seconds for the command execution. Defaults to no timeout.
+      lines (bool, optional): Yield complete lines (including the line terminator) instead of chunks. Defaults to False.
+      maxBytes (int, optional): The maximum number of bytes the command may write to stdout. Defaults to no limit.
+
+    Yields:
+      str: Chunks (or lines) of the standard output of the command.
+
+    Raises:
+      PodExecError: If the command fails, exitCode is set if it ran to completion with a non-zero exit code
+      PodExecTimeoutError: If the command does not finish within the timeout
+      PodExecOutputLimitError: If the command writes more than maxBytes to stdout
+    """
+    logger.debug(f"Streaming command {command} on pod {pod_name} in {namespace}")
+    req = stream(
+        core_v1_api.connect_get_namespaced_pod_exec,
+        pod_name,
+        namespace,
+        command=command,
+        stderr=True,
+        stdin=False,
+        stdout=True,
+        tty=False,
+        _preload_content=False,
+    )
+    deadline = None if timeout is None else monotonic() + timeout
+    stdoutBytes = 0
+    stderr = ""
+    partialLine = ""
+    try:
+        while True:
+            isOpen = req.is_open()
+            if isOpen:
+                remaining = _remainingTime(deadline)
+                if remaining is not None and remaining <= 0:
+                    raise PodExecTimeoutError(f"Command {command} on {pod_name} in namespace {namespace} did not complete within {timeout} seconds")
+                req.update(timeout=EXEC_UPDATE_INTERVAL if remaining is None else min(EXEC_UPDATE_INTERVAL, remaining))
+
+            # Only take what update has already buffered, without a timeout the reads block until the command
+            # writes to the channel (or exits), so a silent command would never be timed out
+            stderr = (stderr + req.read_stderr(timeout=0))[-EXEC_STDERR_LIMIT:]
+            chunk = req.read_stdout(timeout=0)
+            if chunk:
+                stdoutBytes += len(chunk.encode("utf-8"))
+                if maxBytes is not None and stdoutBytes > maxBytes:
+                    raise PodExecOutputLimitError(f"Command {command} on {pod_name} in namespace {namespace} wrote more than {maxBytes} bytes to stdout")
+                if lines:
+                    partialLine += chunk
+                    lineEnd = partialLine.rfind("\n") + 1
+                    if lineEnd:
+                        yield from (line + "\n" for line in partialLine[:lineEnd - 1].split("\n"))
+                        partialLine = partialLine[lineEnd:]
+                else:
+                    yield chunk
+
+            if not isOpen:
+                break
+
+        if partialLine:
+            yield partialLine
+
+        errorChannel = req.read_channel(ERROR_CHANNEL)
+    finally:
+        req.close()
+
+    status = yaml.safe_load(errorChannel) if errorChannel else None
+    if not isinstance(status, dict):
+        raise PodExecError(f"Failed to execute {command} on {pod_name} in namespace {namespace}: connection closed before the command reported its status. stderr: {stderr}", stderr=stderr)
+    if status.get("status") == "Failure":
+        exitCode = execExitCode(status)
+        raise PodExecError(
+            f"Failed to execute {command} on {pod_name} in namespace {namespace}: {status.get('message')}. stderr: {stderr}",
+            exitCode=exitCode,
+            stderr=stderr,
+            status=status
+        )
+
+
+def execInPodToFile(core_v1_api: client.CoreV1Api, pod_name: str, namespace, command: list, fileName: str,
+                    timeout: int = None, maxBytes: int = None) -> int:
+    """
+    Executes a command in a Kubernetes pod, writing the standard output to a file as it arrives.
+
+    Returns:
+      int: The number of characters written to the file.
+
+    Raises:
+      PodExecError, PodExecTimeoutError, PodExecOutputLimitError: See streamExecInPod
+    """
+    written = 0
+    with open(fileName, "w") as outputFile:
+        for chunk in streamExecInPod(core_v1_api, pod_name, namespace, command, timeout=timeout, maxBytes=maxBytes):
+            written += outputFile.write(chunk)
+    return written
 
 # Assisted by WCA@IBM
 # Latest GenAI contribution: ibm/granite-8b-code-instruct
 
 
-def execInPod(core_v1_api: client.CoreV1Api, pod_name: str, namespace, command: list, timeout: int = 60) -> str:
+def execInPod(core_v1_api: client.CoreV1Api, pod_name: str, namespace, command: list, timeout: int = 60, maxBytes: int = None) -> str:
     """
     Executes a command in a Kubernetes pod and returns the standard output.
     If running this function from inside a pod (i.e. config.load_incluster_config()),
@@ -193,38 +781,42 @@ def execInPod(core_v1_api: client.CoreV1Api, pod_name: str, namespace, command:
           - get
           - list
 
+    For commands with large output use streamExecInPod or execInPodToFile instead.
+
     Args:
       core_v1_api (client.CoreV1Api): The Kubernetes API client.
       pod_name (str): The name of the pod to execute the command in.
       namespace (str): The namespace of the pod.
       command (list): The command to execute in the pod.
-      timeout (int, optional): The timeout in seconds for the command execution. Defaults to 60.
+      timeout (int, optional): The timeout in seconds for the command execution. Defaults to 60, None for no timeout.
+      maxBytes (int, optional): The maximum number of bytes the command may write to stdout. Defaults to no limit.
 
     Returns:
       str: The standard output of the command.
 
     Raises:
-      Exception: If the command execution fails or times out.
+      PodExecError: If the command execution fails, exitCode is set if the command returned a non-zero exit code
+      PodExecTimeoutError: If the command does not finish within the timeout
+      PodExecOutputLimitError: If the command writes more than maxBytes to stdout
     """
     logger.debug(f"Executing command {command} on pod {pod_name} in {namespace}")
-    req = stream(
-        core_v1_api.connect_get_namespaced_pod_exec,
-        pod_name,
-        namespace,
-        command=command,
-        stderr=True,
-        stdin=False,
-        stdout=True,
-        tty=False,
-        _preload_content=False,
-    )
-    req.run_forever(timeout)
-    stdout = req.read_stdout()
-    stderr = req.read_stderr()
-
-    err = yaml.load(req.read_channel(ERROR_CHANNEL), Loader=yaml.FullLoader)
-    if err.get("status") == "Failure":
-        raise Exception(f"Failed to execute {command} on {pod_name} in namespace {namespace}: {err.get('message')}. stdout: {stdout}, stderr: {stderr}")
+    chunks = []
+    try:
+        for chunk in streamExecInPod(core_v1_api, pod_name, namespace, command, timeout=timeout, maxBytes=maxBytes):
+            chunks.append(chunk)
+    except PodExecError as e:
+        if e.status.get("message") is not None:
+            message = f"Failed to execute {command} on {pod_name} in namespace {namespace}: {e.status['message']}. stdout: {''.join(chunks)}, stderr: {e.stderr}"
+        else:
+            # No reason was reported on the error channel (e.g. the connection closed early), so keep the original message
+            message = f"{e} stdout: {''.join(chunks)}"
+        raise PodExecError(
+            message,
+            exitCode=e.exitCode,
+            stderr=e.stderr,
+            status=e.status
+        ) from None
+    stdout = "".join(chunks)
 
     logger.debug(f"stdout: \n----------------------------------------------------------------\n{stdout}\n----------------------------------------------------------------\n")
 
@@ -0,0 +1,348 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+"""
+Build MAS PipelineRuns directly as Python objects.
+
+Each PipelineRun is described by a list of parameters, mirroring the corresponding pipelinerun-*.yml.j2 template
+(which remains available as a compatibility path, see tekton.renderPipelineRun).  A parameter is taken from the
+params dict passed in, and is converted to a string in exactly the same way as Jinja's {{ value }} would: missing
+values become "".  Conditional groups of parameters reproduce the conditions used in the templates, including
+their quirks, so that both paths produce identical objects.
+"""
+
+import copy
+
+
+class Param:
+    """
+    A PipelineRun parameter, taking its value from params[source] (source defaults to the parameter name), or a fixed value
+    """
+
+    def __init__(self, name: str, source: str = None, value: str = None):
+        self.name = name
+        self.source = source if source is not None else name
+        self.value = value
+
+    def build(self, params: dict) -> list:
+        if self.value is not None:
+            return [dict(name=self.name, value=self.value)]
+        return [dict(name=self.name, value=str(params[self.source]) if self.source in params else "")]
+
+
+class When:
+    """
+    A group of parameters that is only included when condition(params) is true
+    """
+
+    def __init__(self, condition, entries: list):
+        self.condition = condition
+        self.entries = entries
+
+    def build(self, params: dict) -> list:
+        return buildParams(self.entries, params) if self.condition(params) else []
+
+
+def isSet(name: str):
+    """
+    The equivalent of {% if name is defined and name != "" %}
+    """
+    return lambda params: name in params and params[name] != ""
+
+
+def notEmpty(name: str):
+    """
+    The equivalent of {% if name != "" %}, which is also true when name is not defined
+    """
+    return lambda params: name not in params or params[name] != ""
+
+
+def isDefined(name: str):
+    return lambda params: name in params
+
+
+def equals(name: str, value: str):
+    return lambda params: name in params and params[name] == value
+
+
+def IfSet(name: str, entries: list) -> When:
+    return When(isSet(name), entries)
+
+
+def buildParams(entries: list, params: dict) -> list:
+    """
+    Build the spec.params list for a PipelineRun from a list of entries (parameter names, Param or When)
+    """
+    result = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = Param(entry)
+        result.extend(entry.build(params))
+    return result
+
+
+def buildPipelineRun(pipelineName: str, runName: str, params: list, workspaces: list = None) -> dict:
+    """
+    Build a PipelineRun for the named pipeline, run by the "pipeline" service account without a timeout
+    """
+    spec = dict(
+        pipelineRef=dict(name=pipelineName),
+        serviceAccountName="pipeline",
+        timeouts=dict(pipeline="0"),
+        params=params
+    )
+    if workspaces is not None:
+        spec["workspaces"] = workspaces
+    return dict(
+        apiVersion="tekton.dev/v1beta1",
+        kind="PipelineRun",
+        metadata=dict(name=runName, labels={"tekton.dev/pipeline": pipelineName}),
+        spec=spec
+    )
+
+
+INSTALL_PARAMS = [
+    # IBM Entitlement Key
+    "ibm_entitlement_key",
+    IfSet("skip_pre_check", ["skip_pre_check"]),
+    IfSet("image_pull_policy", ["image_pull_policy"]),
+    IfSet("ocp_ingress_tls_secret_name", ["ocp_ingress_tls_secret_name"]),
+    IfSet("artifactory_username", ["artifactory_username", "artifactory_token"]),
+    When(lambda params: isDefined("ibmcloud_apikey")(params) and notEmpty("ibmcloud_resourcegroup")(params), [
+        "ibmcloud_apikey", "ibmcloud_resourcegroup"
+    ]),
+    # Storage Classes
+    "storage_class_rwx", "storage_class_rwo",
+    # Dependencies - ECK
+    IfSet("eck_action", [
+        "eck_action", "eck_enable_elasticsearch", "eck_enable_kibana", "eck_enable_logstash", "eck_enable_filebeat",
+        IfSet("eck_remote_es_hosts", ["eck_remote_es_hosts", "eck_remote_es_username", "eck_remote_es_password"]),
+    ]),
+    # Dependencies - Turbonomic
+    IfSet("turbonomic_server_url", [
+        "turbonomic_server_url", "turbonomic_server_version", "turbonomic_target_name", "turbonomic_username", "turbonomic_password"
+    ]),
+    # Dependencies - Db2
+    When(lambda params: equals("db2_action_system", "install")(params) or equals("db2_action_manage", "install")(params), [
+        "db2_action_system", "db2_action_manage",
+        "db2_namespace", "db2_channel", "db2_type", "db2_timezone",
+        IfSet("db2_meta_storage_accessmode", [
+            "db2_meta_storage_accessmode", "db2_backup_storage_accessmode", "db2_logs_storage_accessmode",
+            "db2_temp_storage_accessmode", "db2_data_storage_accessmode"
+        ]),
+        IfSet("db2_affinity_key", ["db2_affinity_key", "db2_affinity_value", "db2_tolerate_key", "db2_tolerate_value", "db2_tolerate_effect"]),
+        IfSet("db2_cpu_requests", ["db2_cpu_requests", "db2_cpu_limits", "db2_memory_requests", "db2_memory_limits"]),
+        IfSet("db2_meta_storage_size", [
+            "db2_meta_storage_size", "db2_backup_storage_size", "db2_logs_storage_size", "db2_temp_storage_size", "db2_data_storage_size"
+        ]),
+    ]),
+    # Dependencies - MongoDb
+    IfSet("mongodb_action", [
+        "mongodb_action", "mongodb_namespace", "mongodb_replicas", "mongodb_cpu_requests", "mongodb_provider", "mongodb_version",
+        When(equals("mongodb_provider", "ibm"), ["ibm_mongo_name", "ibm_mongo_resourcegroup", "ibm_mongo_region", "ibm_mongo_admin_password"]),
+    ]),
+    # Dependencies - Kafka
+    When(equals("kafka_action_system", "install"), [
+        "kafka_action_system", "kafka_provider", "kafka_namespace", "kafka_version",
+        When(equals("kafka_provider", "aws"), [
+            "vpc_id", "aws_kafka_user_name", "aws_kafka_user_password", "aws_msk_instance_type", "aws_msk_instance_number",
+            "aws_msk_volume_size", "aws_msk_cidr_az1", "aws_msk_cidr_az2", "aws_msk_cidr_az3", "aws_msk_ingress_cidr", "aws_msk_egress_cidr"
+        ]),
+        When(equals("kafka_provider", "ibm"), [
+            "eventstreams_resourcegroup", "eventstreams_name", "eventstreams_location", "eventstreams_retention",
+            "eventstreams_create_manage_jms_topics"
+        ]),
+    ]),
+    # Dependencies - CP4D
+    IfSet("cpd_product_version", ["cpd_product_version", "cpd_install_spss", "cpd_install_openscale", "cpd_install_cognos"]),
+    # Dependencies - SLS
+    Param("sls_channel", value="3.x"),
+    "sls_entitlement_file",
+    IfSet("sls_namespace", ["sls_namespace"]),
+    IfSet("sls_icr_cpopen", ["sls_icr_cpopen"]),
+    # Dependencies - UDS/DRO (Required)
+    "uds_action", "uds_contact_email", "uds_contact_firstname", "uds_contact_lastname",
+    IfSet("dro_namespace", ["dro_namespace"]),
+    # Dependencies - COS
+    IfSet("cos_type", ["cos_type", "ibmcos_resourcegroup", "ibmcos_instance_name", "cos_action"]),
+    # MAS Catalog
+    "mas_channel", "mas_catalog_version",
+    IfSet("mas_catalog_digest", ["mas_catalog_digest"]),
+    # Dependencies - Certificate Manager
+    "cert_manager_provider", "cert_manager_action",
+    # MAS DNS Integrations
+    IfSet("dns_provider", [
+        "dns_provider",
+        "cloudflare_email", "cloudflare_apitoken", "cloudflare_zone", "cloudflare_subdomain",
+        "cis_email", "cis_apikey", "cis_crn", "cis_subdomain",
+        "cis_service_name", "cis_enhanced_security", "override_edge_certs", "cis_proxy"
+    ]),
+    IfSet("aws_access_key_id", ["aws_access_key_id", "aws_secret_access_key", "aws_region"]),
+    IfSet("route53_hosted_zone_name", ["route53_hosted_zone_name", "route53_hosted_zone_region", "route53_email", "route53_subdomain"]),
+    # Data Dictionary
+    IfSet("mas_add_catalog", ["mas_add_catalog", "mas_add_channel"]),
+    # MAS Core
+    "mas_instance_id",
+    *[IfSet(name, [name]) for name in [
+        "mas_wipe_mongo_data", "mas_domain", "mas_special_characters", "mas_cluster_issuer", "idle_timeout", "idp_session_timeout",
+        "access_token_timeout", "refresh_token_timeout", "default_idp", "seamless_login", "sso_cookie_name",
+        "allow_default_sso_cookie_name", "use_only_custom_cookie_name", "disable_ldap_cookie", "allow_custom_cache_key", "mas_annotations"
+    ]],
+    "mas_icr_cp", "mas_icr_cpopen",
+    IfSet("mas_trust_default_cas", ["mas_trust_default_cas"]),
+    When(isDefined("mas_manual_cert_mgmt"), ["mas_manual_cert_mgmt"]),
+    IfSet("enable_ipv6", ["enable_ipv6"]),
+    IfSet("mas_superuser_username", ["mas_superuser_username", "mas_superuser_password"]),
+    IfSet("mas_enable_walkme", ["mas_enable_walkme"]),
+    # MAS Workspace
+    "mas_workspace_id", "mas_workspace_name",
+    # IoT Application
+    IfSet("mas_app_channel_iot", [
+        "mas_app_channel_iot",
+        IfSet("mas_app_settings_iot_deployment_size", ["mas_app_settings_iot_deployment_size"]),
+        "mas_app_settings_iot_fpl_pvc_storage_class", "mas_app_settings_iot_mqttbroker_pvc_storage_class"
+    ]),
+    # IBM Maximo Location Services for Esri (arcgis)
+    IfSet("install_arcgis", ["install_arcgis", "mas_arcgis_channel"]),
+    # Manage Application
+    IfSet("mas_app_channel_manage", [
+        "mas_app_channel_manage", "mas_appws_components",
+        IfSet("mas_appws_bindings_health_wsl_flag", ["mas_appws_bindings_health_wsl_flag"]),
+        IfSet("mas_app_settings_aio_flag", ["mas_app_settings_aio_flag"]),
+        IfSet("mas_app_settings_demodata", ["mas_app_settings_demodata"]),
+        IfSet("mas_appws_bindings_jdbc_manage", ["mas_appws_bindings_jdbc_manage"]),
+        IfSet("mas_app_settings_persistent_volumes_flag", ["mas_app_settings_persistent_volumes_flag"]),
+        IfSet("mas_app_settings_jms_queue_pvc_storage_class", ["mas_app_settings_jms_queue_pvc_storage_class", "mas_app_settings_jms_queue_pvc_accessmode"]),
+        IfSet("mas_app_settings_bim_pvc_storage_class", ["mas_app_settings_bim_pvc_storage_class", "mas_app_settings_bim_pvc_accessmode"]),
+        # The template tests "is defined or != ''", which is always true
+        "mas_app_settings_doclinks_pvc_storage_class", "mas_app_settings_doclinks_pvc_accessmode",
+        IfSet("mas_app_settings_server_bundles_size", ["mas_app_settings_server_bundles_size"]),
+        IfSet("mas_app_settings_base_lang", ["mas_app_settings_base_lang", "mas_app_settings_secondary_langs"]),
+        IfSet("mas_app_settings_server_timezone", ["mas_app_settings_server_timezone"]),
+        IfSet("mas_app_settings_tablespace", ["mas_app_settings_tablespace", "mas_app_settings_indexspace", "mas_app_settings_db2_schema"]),
+        IfSet("mas_app_settings_customization_archive_url", [
+            "mas_app_settings_customization_archive_url", "mas_app_settings_customization_archive_name",
+            IfSet("mas_app_settings_customization_archive_username", [
+                "mas_app_settings_customization_archive_username", "mas_app_settings_customization_archive_password"
+            ]),
+        ]),
+        IfSet("mas_app_settings_crypto_key", [
+            "mas_app_settings_crypto_key", "mas_app_settings_cryptox_key", "mas_app_settings_old_crypto_key", "mas_app_settings_old_cryptox_key"
+        ]),
+        IfSet("mas_app_settings_override_encryption_secrets_flag", ["mas_app_settings_override_encryption_secrets_flag"]),
+        IfSet("mas_app_settings_default_jms", ["mas_app_settings_default_jms"]),
+    ]),
+    # Other Applications
+    IfSet("mas_app_channel_monitor", ["mas_app_channel_monitor"]),
+    IfSet("mas_app_channel_optimizer", ["mas_app_channel_optimizer", "mas_app_plan_optimizer"]),
+    IfSet("mas_app_channel_predict", ["mas_app_channel_predict"]),
+    IfSet("mas_app_channel_assist", ["mas_app_channel_assist"]),
+    IfSet("mas_app_channel_visualinspection", ["mas_app_channel_visualinspection"]),
+    # Grafana
+    IfSet("grafana_action", ["grafana_action", "grafana_v5_namespace", "grafana_instance_storage_size"]),
+    # AI Broker
+    IfSet("mas_app_channel_aibroker", ["mas_app_channel_aibroker"]),
+    IfSet("mas_aibroker_storage_provider", [
+        "mas_aibroker_storage_provider", "mas_aibroker_storage_accesskey", "mas_aibroker_storage_secretkey", "mas_aibroker_storage_host",
+        "mas_aibroker_storage_port", "mas_aibroker_storage_ssl", "mas_aibroker_storage_region", "mas_aibroker_storage_pipelines_bucket",
+        "mas_aibroker_storage_tenants_bucket", "mas_aibroker_storage_templates_bucket", "mas_aibroker_tenant_name"
+    ]),
+    IfSet("mas_aibroker_controller_tag", [
+        "mas_aibroker_controller_tag", "mas_aibroker_store_tag", "mas_aibroker_watcher_tag", "mas_aibroker_connector_tag",
+        "mas_aibroker_pipeline_steps_tag"
+    ]),
+    IfSet("mas_aibroker_watsonxai_apikey", [
+        "mas_aibroker_watsonxai_apikey", "mas_aibroker_watsonxai_url", "mas_aibroker_watsonxai_project_id", "mas_aibroker_watsonx_action"
+    ]),
+    IfSet("mas_aibroker_s3_action", ["mas_aibroker_s3_action", "mas_aibroker_apikey_action"]),
+    IfSet("mas_aibroker_db_host", [
+        "mas_aibroker_db_host", "mas_aibroker_db_port", "mas_aibroker_db_user", "mas_aibroker_db_database",
+        "mas_aibroker_db_secret_name", "mas_aibroker_db_secret_key", "mas_aibroker_db_secret_value"
+    ]),
+]
+
+INSTALL_WORKSPACES = [
+    dict(name="shared-configs", persistentVolumeClaim=dict(claimName="config-pvc")),
+    dict(name="shared-additional-configs", secret=dict(secretName="pipeline-additional-configs")),
+    dict(name="shared-entitlement", secret=dict(secretName="pipeline-sls-entitlement")),
+    dict(name="shared-pod-templates", secret=dict(secretName="pipeline-pod-templates")),
+    dict(name="shared-certificates", secret=dict(secretName="pipeline-certificates")),
+]
+
+UPDATE_PARAMS = [
+    "mas_catalog_version",
+    IfSet("ibm_entitlement_key", ["ibm_entitlement_key"]),
+    IfSet("artifactory_username", ["artifactory_username", "artifactory_token"]),
+    IfSet("skip_pre_check", ["skip_pre_check"]),
+    IfSet("db2_namespace", ["db2_namespace"]),
+    IfSet("mongodb_namespace", [
+        "mongodb_namespace", "mongodb_version", "mongodb_replicas",
+        IfSet("mongodb_v5_upgrade", ["mongodb_v5_upgrade"]),
+        IfSet("mongodb_v6_upgrade", ["mongodb_v6_upgrade"]),
+    ]),
+    IfSet("kafka_namespace", ["kafka_namespace", "kafka_provider"]),
+    IfSet("cert_manager_action", ["cert_manager_provider", "cert_manager_action"]),
+    IfSet("dro_migration", ["dro_migration", Param("uds_storage_class", source="dro_storage_class"), "uds_action", "dro_namespace"]),
+    IfSet("grafana_v5_upgrade", ["grafana_v5_upgrade"]),
+    IfSet("cpd_product_version", [
+        "cpd_product_version", "cp4d_update", "cp4d_update_ws", "cp4d_update_wml", "cp4d_update_wos", "cp4d_update_spark",
+        "cp4d_update_spss", "cp4d_update_cognos", "storage_class_rwx", "storage_class_rwo", "skip_entitlement_key_flag"
+    ]),
+]
+
+UPGRADE_PARAMS = [
+    "mas_instance_id", "mas_channel",
+    IfSet("skip_pre_check", ["skip_pre_check"]),
+]
+
+UNINSTALL_PARAMS = [
+    "mas_instance_id", "grafana_action", "cert_manager_provider", "cert_manager_action", "common_services_action",
+    "ibm_catalogs_action", "mongodb_action", "sls_action", "uds_action", "dro_namespace"
+]
+
+
+def buildInstallPipelineRun(params: dict, timestamp: str) -> dict:
+    """
+    Build the mas-install PipelineRun (the equivalent of pipelinerun-install.yml.j2)
+    """
+    runName = f"{params.get('mas_instance_id', '')}-install-{timestamp}"
+    return buildPipelineRun("mas-install", runName, buildParams(INSTALL_PARAMS, params), workspaces=copy.deepcopy(INSTALL_WORKSPACES))
+
+
+def buildUpdatePipelineRun(params: dict, timestamp: str) -> dict:
+    """
+    Build the mas-update PipelineRun (the equivalent of pipelinerun-update.yml.j2)
+    """
+    return buildPipelineRun("mas-update", f"mas-update-{timestamp}", buildParams(UPDATE_PARAMS, params))
+
+
+def buildUpgradePipelineRun(params: dict, timestamp: str) -> dict:
+    """
+    Build the mas-upgrade PipelineRun (the equivalent of pipelinerun-upgrade.yml.j2)
+    """
+    runName = f"{params.get('mas_instance_id', '')}-upgrade-{timestamp}"
+    return buildPipelineRun("mas-upgrade", runName, buildParams(UPGRADE_PARAMS, params))
+
+
+def buildUninstallPipelineRun(params: dict, timestamp: str) -> dict:
+    """
+    Build the mas-uninstall PipelineRun (the equivalent of pipelinerun-uninstall.yml.j2, for string parameters)
+    """
+    runName = f"{params.get('mas_instance_id', '')}-uninstall-{timestamp}"
+    return buildPipelineRun("mas-uninstall", runName, buildParams(UNINSTALL_PARAMS, params))
+
+
+# The builder for each PipelineRun template
+PIPELINERUN_BUILDERS = {
+    "pipelinerun-install": buildInstallPipelineRun,
+    "pipelinerun-update": buildUpdatePipelineRun,
+    "pipelinerun-upgrade": buildUpgradePipelineRun,
+    "pipelinerun-uninstall": buildUninstallPipelineRun,
+}
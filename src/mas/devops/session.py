@@ -0,0 +1,146 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+from __future__ import annotations
+
+import logging
+import socket
+import threading
+
+from urllib3.connection import HTTPConnection
+
+from kubernetes import client, config
+from kubernetes.config.config_exception import ConfigException
+from openshift.dynamic import DynamicClient
+
+from .discovery import createDynamicClient
+
+logger = logging.getLogger(__name__)
+
+# The number of connections to the API server that are kept open for re-use, this should be at least the number of
+# threads that will use a session concurrently (e.g. the maxWorkers passed to launchPipelineRuns)
+SESSION_POOL_SIZE = 16
+
+# Idle connections are probed after this many seconds so that they are not silently dropped by proxies/load balancers
+SESSION_KEEPALIVE_IDLE = 30
+
+
+def keepAliveSocketOptions(idle: int = SESSION_KEEPALIVE_IDLE) -> list:
+    """
+    Socket options that enable TCP keep-alive (where the platform supports it) on top of urllib3's defaults
+    """
+    options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+    elif hasattr(socket, "TCP_KEEPALIVE"):
+        # macOS
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, idle))
+    return options
+
+
+def loadConfiguration(server: str = None, token: str = None, skipVerify: bool = False, caCertFile: str = None,
+                      context: str = None) -> client.Configuration:
+    """
+    Build the configuration for a cluster without modifying the global default configuration or the kubeconfig file.
+
+    If server and token are provided they are used directly, otherwise the in-cluster configuration is used if we are
+    running in a pod, falling back to the kubeconfig file (optionally using a specific context).
+    """
+    configuration = client.Configuration()
+    if server is not None and token is not None:
+        configuration.host = server
+        configuration.api_key = {"authorization": token}
+        configuration.api_key_prefix = {"authorization": "Bearer"}
+        configuration.verify_ssl = not skipVerify
+        configuration.ssl_ca_cert = caCertFile
+    elif server is not None or token is not None:
+        raise ValueError("Both server and token must be provided to connect using a token")
+    else:
+        try:
+            config.load_incluster_config(client_configuration=configuration)
+            logger.debug("Loaded in-cluster configuration")
+        except ConfigException:
+            config.load_kube_config(context=context, client_configuration=configuration)
+            logger.debug(f"Loaded kubeconfig file (context={context})")
+    return configuration
+
+
+class ClusterSession:
+    """
+    A connection to a cluster, holding a single ApiClient (and so a single pool of keep-alive connections to the API
+    server) from which DynamicClient, CoreV1Api and CustomObjectsApi views are handed out.  Credentials are
+    configured in-process, so creating a session never modifies the kubeconfig file or runs kubectl, and many
+    sessions (e.g. one per cluster) can be held at once.
+
+    The session can be used as a context manager, closing the connection pool on exit.
+
+    Note: kubernetes.stream patches the ApiClient it is given for the duration of each exec, so commands that run
+    concurrently in different threads must each use a separate ApiClient (see mas.devops.db2.isolated_core_v1_api).
+    """
+
+    def __init__(self, server: str = None, token: str = None, skipVerify: bool = False, caCertFile: str = None,
+                 context: str = None, configuration: client.Configuration = None, poolSize: int = SESSION_POOL_SIZE):
+        if configuration is None:
+            configuration = loadConfiguration(server, token, skipVerify=skipVerify, caCertFile=caCertFile, context=context)
+        configuration.connection_pool_maxsize = poolSize
+        if configuration.socket_options is None:
+            configuration.socket_options = keepAliveSocketOptions()
+        self.configuration = configuration
+        self.apiClient = client.ApiClient(configuration=configuration)
+        self._lock = threading.Lock()
+        self._dynClient = None
+        self._coreV1Api = None
+        self._customObjectsApi = None
+        logger.debug(f"Created session for {configuration.host} (poolSize={poolSize})")
+
+    @property
+    def host(self) -> str:
+        return self.configuration.host
+
+    @property
+    def dynClient(self) -> DynamicClient:
+        """
+        An OpenShift client using the session's connection pool, created (running discovery) the first time it is used
+        """
+        with self._lock:
+            if self._dynClient is None:
+                self._dynClient = createDynamicClient(self.apiClient)
+            return self._dynClient
+
+    @property
+    def coreV1Api(self) -> client.CoreV1Api:
+        with self._lock:
+            if self._coreV1Api is None:
+                self._coreV1Api = client.CoreV1Api(self.apiClient)
+            return self._coreV1Api
+
+    @property
+    def customObjectsApi(self) -> client.CustomObjectsApi:
+        with self._lock:
+            if self._customObjectsApi is None:
+                self._customObjectsApi = client.CustomObjectsApi(self.apiClient)
+            return self._customObjectsApi
+
+    def close(self) -> None:
+        """
+        Close all pooled connections to the API server
+        """
+        self.apiClient.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return f"ClusterSession(host={self.host})"
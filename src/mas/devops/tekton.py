@@ -8,31 +8,125 @@
 #
 # *****************************************************************************
 
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
 import logging
+import queue
+import threading
 import yaml
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from os import path
+from time import monotonic
+from typing import TYPE_CHECKING
 
-from time import sleep
-
-from kubeconfig import kubectl
 from openshift.dynamic import DynamicClient
 from openshift.dynamic.exceptions import NotFoundError, UnprocessibleEntityError
+from kubernetes.client import ApiClient
+from kubernetes.client.rest import ApiException
 
-from jinja2 import Environment, FileSystemLoader
+from .discovery import createDynamicClient, getCacheDir, getResourceAPI
+from .pipelinerun import PIPELINERUN_BUILDERS
+from .session import loadConfiguration
+from .clusterfacts import getClusterFacts
+from .ocp import buildFileSecret, createNamespaces, createResources, syncSecrets, waitForCRD, waitForDeployment, waitForPVC, waitForPVCs, crdExists
 
-from .ocp import getConsoleURL, waitForCRD, waitForDeployment, crdExists
+if TYPE_CHECKING:
+    from jinja2 import Environment
 
 logger = logging.getLogger(__name__)
 
+# Use the much faster libyaml based loader when PyYAML was built with it
+SAFE_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+TEMPLATE_DIR = path.join(path.abspath(path.dirname(__file__)), "templates")
+
+_templateEnv = None
+_templateEnvLock = threading.Lock()
+
+
+_templateBytecodeCacheClass = None
+
+
+def _getTemplateBytecodeCacheClass() -> type:
+    # jinja2 is only imported once a template is needed, rather than whenever this module is imported
+    global _templateBytecodeCacheClass
+    if _templateBytecodeCacheClass is None:
+        from jinja2 import FileSystemBytecodeCache
+
+        class TemplateBytecodeCache(FileSystemBytecodeCache):
+            """
+            A bytecode cache that never stops a template from rendering just because the compiled template could not
+            be saved
+            """
+
+            def dump_bytecode(self, bucket) -> None:
+                try:
+                    super().dump_bytecode(bucket)
+                except OSError as e:
+                    logger.debug(f"Unable to save compiled template to the bytecode cache: {e}")
+
+        _templateBytecodeCacheClass = TemplateBytecodeCache
+    return _templateBytecodeCacheClass
+
+
+def __getattr__(name: str):
+    if name == "TemplateBytecodeCache":
+        return _getTemplateBytecodeCacheClass()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def getTemplateEnvironment() -> Environment:
+    """
+    Get the Jinja environment used to render the templates shipped with this package.
+
+    The environment is created once per process and holds every template it has loaded, already compiled, in memory.
+    Compiled templates are also saved in a bytecode cache (in the "jinja" directory under getCacheDir), so that later
+    processes skip parsing and compiling them.  Jinja invalidates cache entries when the template source, Jinja or
+    Python version changes.
+    """
+    global _templateEnv
+    with _templateEnvLock:
+        if _templateEnv is None:
+            from jinja2 import Environment, FileSystemLoader
+            try:
+                bytecodeCache = _getTemplateBytecodeCacheClass()(directory=getCacheDir("jinja"))
+            except OSError as e:
+                logger.debug(f"Template bytecode cache is not available: {e}")
+                bytecodeCache = None
+            _templateEnv = Environment(
+                loader=FileSystemLoader(searchpath=TEMPLATE_DIR),
+                bytecode_cache=bytecodeCache,
+                # The templates are package data, so there's no need to check whether they have changed on every use
+                auto_reload=False
+            )
+        return _templateEnv
+
+
+def precompileTemplates() -> list:
+    """
+    Load every template so that its compiled form is saved in the bytecode cache (e.g. while building a container image)
+
+    Returns:
+      list: The names of the templates that were compiled
+    """
+    env = getTemplateEnvironment()
+    templateNames = env.list_templates(extensions=["j2"])
+    for templateName in templateNames:
+        env.get_template(templateName)
+    return templateNames
+
 
 def installOpenShiftPipelines(dynClient: DynamicClient) -> bool:
     """
     Install the OpenShift Pipelines Operator and wait for it to be ready to use
     """
-    packagemanifestAPI = dynClient.resources.get(api_version="packages.operators.coreos.com/v1", kind="PackageManifest")
-    subscriptionsAPI = dynClient.resources.get(api_version="operators.coreos.com/v1alpha1", kind="Subscription")
+    packagemanifestAPI = getResourceAPI(dynClient, "packages.operators.coreos.com/v1", "PackageManifest")
+    subscriptionsAPI = getResourceAPI(dynClient, "operators.coreos.com/v1alpha1", "Subscription")
 
     # Create the Operator Subscription
     try:
@@ -44,17 +138,14 @@ def installOpenShiftPipelines(dynClient: DynamicClient) -> bool:
 
             logger.info(f"OpenShift Pipelines Operator Details: {catalogSourceNamespace}/{catalogSource}@{defaultChannel}")
 
-            templateDir = path.join(path.abspath(path.dirname(__file__)), "templates")
-            env = Environment(
-                loader=FileSystemLoader(searchpath=templateDir)
-            )
+            env = getTemplateEnvironment()
             template = env.get_template("subscription.yml.j2")
             renderedTemplate = template.render(
                 pipelines_channel=defaultChannel,
                 pipelines_source=catalogSource,
                 pipelines_source_namespace=catalogSourceNamespace
             )
-            subscription = yaml.safe_load(renderedTemplate)
+            subscription = yaml.load(renderedTemplate, Loader=SAFE_LOADER)
             subscriptionsAPI.apply(body=subscription, namespace="openshift-operators")
 
     except NotFoundError:
@@ -82,29 +173,114 @@ def installOpenShiftPipelines(dynClient: DynamicClient) -> bool:
         return False
 
 
-def updateTektonDefinitions(namespace: str, yamlFile: str) -> None:
+# Annotation recording the hash of the definition we last applied to a resource, see updateTektonDefinitions
+DEFINITION_HASH_ANNOTATION = "devops.mas.ibm.com/applied-hash"
+FIELD_MANAGER = "mas-devops"
+
+
+def updateTektonDefinitions(namespace: str, yamlFile: str, dynClient: DynamicClient = None, maxWorkers: int = 8, prune: bool = False) -> dict:
     """
     Install/update the MAS tekton pipeline and task definitions
 
-    Unfortunately there's no API equivalent of what the kubectl CLI gives
-    us with the ability to just apply a file containing a mix of resource types
+    The documents in yamlFile are streamed and grouped by kind.  Before each group is applied the existing resources of
+    that kind (e.g. tasks.tekton.dev) are fetched with a single LIST call, and only the definitions whose hash differs
+    from the one stamped on the existing resource are applied, using server-side apply with at most maxWorkers
+    concurrent requests.
+
+    Parameters:
+      namespace (str): The namespace to install the definitions into
+      yamlFile (str): A multi-document YAML file containing the definitions (e.g. ibm-mas-tekton.yaml)
+      dynClient (DynamicClient, optional): The OpenShift client.  Defaults to a client using the in-cluster
+                                           configuration, or the kubeconfig file when not running in a pod.
+      maxWorkers (int, optional): The maximum number of resources to apply concurrently. Defaults to 8.
+      prune (bool, optional): Delete resources that we applied previously (i.e. that carry our hash annotation), of
+                              the kinds in yamlFile, that are no longer in yamlFile. Defaults to False.
 
-    https://github.com/gtaylor/kubeconfig-python/
+    Returns:
+      dict: The number of resources that were "applied", were "unchanged" and were "pruned"
 
     Throws:
-    - kubeconfig.exceptions.KubectlCommandError
+    - Exception if any of the definitions could not be applied or pruned, after attempting all of them
     """
-    result = kubectl.run(subcmd_args=['apply', '-n', namespace, '-f', yamlFile])
-    for line in result.split("\n"):
-        logger.debug(line)
+    if dynClient is None:
+        dynClient = createDynamicClient(ApiClient(configuration=loadConfiguration()))
+
+    definitions = {}
+    with open(yamlFile, "r") as f:
+        for definition in yaml.load_all(f, Loader=SAFE_LOADER):
+            if definition is not None:
+                definitions.setdefault((definition["apiVersion"], definition["kind"]), []).append(definition)
+
+    counts = dict(applied=0, unchanged=0, pruned=0)
+    failures = []
+    with ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="tekton-apply") as executor:
+        for (apiVersion, kind), group in definitions.items():
+            resourceAPI = getResourceAPI(dynClient, apiVersion, kind)
+            groupNamespace = namespace if resourceAPI.namespaced else None
+
+            # Pre-flight: find the hash we last applied to every existing resource of this kind in one call
+            existingHashes = {}
+            for item in resourceAPI.get(namespace=groupNamespace).items:
+                existingHashes[item.metadata.name] = (item.metadata.annotations or {}).get(DEFINITION_HASH_ANNOTATION)
+
+            changes = []
+            for definition in group:
+                name = definition["metadata"]["name"]
+                definitionHash = _definitionHash(definition)
+                if existingHashes.get(name) == definitionHash:
+                    logger.debug(f"{kind} {name} unchanged")
+                    counts["unchanged"] += 1
+                else:
+                    changes.append(("applied", name, executor.submit(_applyDefinition, resourceAPI, groupNamespace, definition, definitionHash)))
+
+            if prune:
+                definedNames = set(definition["metadata"]["name"] for definition in group)
+                for name, existingHash in existingHashes.items():
+                    if existingHash is not None and name not in definedNames:
+                        changes.append(("pruned", name, executor.submit(_pruneDefinition, resourceAPI, groupNamespace, name)))
+
+            for change, name, future in changes:
+                try:
+                    future.result()
+                    counts[change] += 1
+                except Exception as e:
+                    logger.error(f"Unable to {'apply' if change == 'applied' else 'prune'} {kind} {name}: {e}")
+                    failures.append(f"{kind}/{name}")
+
+    logger.info(f"Tekton definitions in {namespace}: {counts['applied']} applied, {counts['unchanged']} unchanged, {counts['pruned']} pruned")
+    if len(failures) > 0:
+        raise Exception(f"Failed to update {len(failures)} tekton definitions in {namespace}: {', '.join(failures)}")
+    return counts
+
+
+def _definitionHash(definition: dict) -> str:
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _applyDefinition(resourceAPI, namespace: str, definition: dict, definitionHash: str) -> None:
+    body = copy.deepcopy(definition)
+    if namespace is not None:
+        body["metadata"]["namespace"] = namespace
+    body["metadata"].setdefault("annotations", {})[DEFINITION_HASH_ANNOTATION] = definitionHash
+    resourceAPI.server_side_apply(body=body, namespace=namespace, field_manager=FIELD_MANAGER, force_conflicts=True)
+    logger.debug(f"{resourceAPI.kind} {definition['metadata']['name']} applied")
+
+
+def _pruneDefinition(resourceAPI, namespace: str, name: str) -> None:
+    try:
+        resourceAPI.delete(name=name, namespace=namespace)
+        logger.debug(f"{resourceAPI.kind} {name} pruned")
+    except NotFoundError:
+        pass
 
 
-def preparePipelinesNamespace(dynClient: DynamicClient, instanceId: str = None, storageClass: str = None, accessMode: str = None, waitForBind: bool = True):
-    templateDir = path.join(path.abspath(path.dirname(__file__)), "templates")
-    env = Environment(
-        loader=FileSystemLoader(searchpath=templateDir)
-    )
+def _pipelinesNamespaceResources(env: Environment, instanceId: str = None, storageClass: str = None, accessMode: str = None) -> tuple:
+    """
+    Render the ClusterRoleBinding and (for an instance namespace only) the PVC for a pipelines namespace
 
+    Returns:
+      tuple: (namespace, ClusterRoleBinding, PVC or None)
+    """
     if instanceId is None:
         namespace = "mas-pipelines"
         template = env.get_template("pipelines-rbac-cluster.yml.j2")
@@ -112,14 +288,11 @@ def preparePipelinesNamespace(dynClient: DynamicClient, instanceId: str = None,
         namespace = f"mas-{instanceId}-pipelines"
         template = env.get_template("pipelines-rbac.yml.j2")
 
-    # Create RBAC
     renderedTemplate = template.render(mas_instance_id=instanceId)
     logger.debug(renderedTemplate)
-    crb = yaml.safe_load(renderedTemplate)
-    clusterRoleBindingAPI = dynClient.resources.get(api_version="rbac.authorization.k8s.io/v1", kind="ClusterRoleBinding")
-    clusterRoleBindingAPI.apply(body=crb, namespace=namespace)
+    crb = yaml.load(renderedTemplate, Loader=SAFE_LOADER)
 
-    # Create PVC (instanceId namespace only)
+    pvc = None
     if instanceId is not None:
         template = env.get_template("pipelines-pvc.yml.j2")
         renderedTemplate = template.render(
@@ -128,95 +301,99 @@ def preparePipelinesNamespace(dynClient: DynamicClient, instanceId: str = None,
             pipeline_storage_accessmode=accessMode
         )
         logger.debug(renderedTemplate)
-        pvc = yaml.safe_load(renderedTemplate)
-        pvcAPI = dynClient.resources.get(api_version="v1", kind="PersistentVolumeClaim")
-        pvcAPI.apply(body=pvc, namespace=namespace)
-
-    if instanceId is not None and waitForBind:
-        logger.debug("Waiting for PVC to be bound")
-        pvcIsBound = False
-        while not pvcIsBound:
-            configPVC = pvcAPI.get(name="config-pvc", namespace=namespace)
-            if configPVC.status.phase == "Bound":
-                pvcIsBound = True
-            else:
-                logger.debug("Waiting 15s before checking status of PVC again")
-                logger.debug(configPVC)
-                sleep(15)
+        pvc = yaml.load(renderedTemplate, Loader=SAFE_LOADER)
+    return namespace, crb, pvc
 
 
-def prepareInstallSecrets(dynClient: DynamicClient, instanceId: str, slsLicenseFile: str, additionalConfigs: dict = None, certs: str = None, podTemplates: str = None) -> None:
-    namespace = f"mas-{instanceId}-pipelines"
-    secretsAPI = dynClient.resources.get(api_version="v1", kind="Secret")
+def preparePipelinesNamespace(dynClient: DynamicClient, instanceId: str = None, storageClass: str = None, accessMode: str = None, waitForBind: bool = True):
+    namespace, crb, pvc = _pipelinesNamespaceResources(getTemplateEnvironment(), instanceId, storageClass, accessMode)
 
-    # 1. Secret/pipeline-additional-configs
-    # -------------------------------------------------------------------------
-    # Must exist, but can be empty
-    try:
-        secretsAPI.delete(name="pipeline-additional-configs", namespace=namespace)
-    except NotFoundError:
-        pass
+    # Create RBAC
+    clusterRoleBindingAPI = getResourceAPI(dynClient, "rbac.authorization.k8s.io/v1", "ClusterRoleBinding")
+    clusterRoleBindingAPI.apply(body=crb, namespace=namespace)
 
-    if additionalConfigs is None:
-        additionalConfigs = {
-            "apiVersion": "v1",
-            "kind": "Secret",
-            "type": "Opaque",
-            "metadata": {
-                "name": "pipeline-additional-configs"
-            }
-        }
-    secretsAPI.create(body=additionalConfigs, namespace=namespace)
+    # Create PVC (instanceId namespace only)
+    if pvc is not None:
+        pvcAPI = getResourceAPI(dynClient, "v1", "PersistentVolumeClaim")
+        pvcAPI.apply(body=pvc, namespace=namespace)
 
-    # 2. Secret/pipeline-sls-entitlement
-    # -------------------------------------------------------------------------
-    try:
-        secretsAPI.delete(name="pipeline-sls-entitlement", namespace=namespace)
-    except NotFoundError:
-        pass
+    if instanceId is not None and waitForBind:
+        logger.debug("Waiting for PVC to be bound")
+        waitForPVC(dynClient, namespace=namespace, pvcName="config-pvc")
 
-    # TODO: Convert this to using secretsAPI.create()
-    result = kubectl.run(subcmd_args=['-n', namespace, 'create', 'secret', 'generic', 'pipeline-sls-entitlement', '--from-file', slsLicenseFile])
-    for line in result.split("\n"):
-        logger.debug(line)
 
-    # 3. Secret/pipeline-certificates
-    # -------------------------------------------------------------------------
-    # Must exist. It could be an empty secret at the first place before customer configure it
-    try:
-        secretsAPI.delete(name="pipeline-certificates", namespace=namespace)
-    except NotFoundError:
-        pass
+def preparePipelinesNamespaces(dynClient: DynamicClient, instanceIds: list, storageClass: str = None, accessMode: str = None,
+                               waitForBind: bool = True, timeout: int = None, maxWorkers: int = 8) -> list:
+    """
+    Prepare the pipelines namespaces for many MAS instances at once.  All the namespaces are created concurrently,
+    followed by every ClusterRoleBinding and PVC; anything that already exists is left as it is.  The PVCs are then
+    waited for together, using a single watch.
+
+    Parameters:
+      dynClient (DynamicClient): The OpenShift client
+      instanceIds (list): The MAS instance IDs
+      storageClass (str, optional): The storage class for the PVCs
+      accessMode (str, optional): The access mode for the PVCs
+      waitForBind (bool, optional): Wait for the PVCs to be bound. Defaults to True.
+      timeout (int, optional): How long to wait for the PVCs to be bound, None to wait indefinitely. Defaults to None.
+      maxWorkers (int, optional): The maximum number of resources to create concurrently. Defaults to 8.
+
+    Returns:
+      list: The pipelines namespaces whose PVC was not bound before the timeout (always empty if waitForBind is False)
+    """
+    env = getTemplateEnvironment()
+    namespaces = []
+    resources = []
+    for instanceId in instanceIds:
+        namespace, crb, pvc = _pipelinesNamespaceResources(env, instanceId, storageClass, accessMode)
+        namespaces.append(namespace)
+        resources.extend([crb, pvc])
+
+    created = createNamespaces(dynClient, namespaces, maxWorkers=maxWorkers)
+    logger.info(f"Created {len(created['created'])} pipelines namespaces ({len(created['existing'])} already existed)")
+    created = createResources(dynClient, resources, maxWorkers=maxWorkers)
+    logger.info(f"Created {len(created['created'])} pipelines ClusterRoleBindings and PVCs ({len(created['existing'])} already existed)")
+
+    if not waitForBind:
+        return []
+    unbound = waitForPVCs(dynClient, [(namespace, "config-pvc") for namespace in namespaces], timeout=timeout)
+    if len(unbound) > 0:
+        logger.warning(f"{len(unbound)} pipelines PVCs were not bound within {timeout}s")
+    return [namespace for namespace, name in unbound]
 
-    if certs is None:
-        certs = {
-            "apiVersion": "v1",
-            "kind": "Secret",
-            "type": "Opaque",
-            "metadata": {
-                "name": "pipeline-certificates"
-            }
-        }
-    secretsAPI.create(body=certs, namespace=namespace)
 
-    # 4. Secret/pipeline-pod-templates
-    # -------------------------------------------------------------------------
-    # Must exist, but can be empty
-    try:
-        secretsAPI.delete(name="pipeline-pod-templates", namespace=namespace)
-    except NotFoundError:
-        pass
+def prepareInstallSecrets(dynClient: DynamicClient, instanceId: str, slsLicenseFile: str, additionalConfigs: dict = None, certs: str = None, podTemplates: str = None) -> None:
+    """
+    Create or update the secrets used by the install pipeline.  Each secret is only written if its content has changed,
+    and the secrets are written concurrently.
+    """
+    namespace = f"mas-{instanceId}-pipelines"
 
-    if podTemplates is None:
-        podTemplates = {
+    def emptySecret(name: str) -> dict:
+        return {
             "apiVersion": "v1",
             "kind": "Secret",
             "type": "Opaque",
             "metadata": {
-                "name": "pipeline-pod-templates"
+                "name": name
             }
         }
-    secretsAPI.create(body=podTemplates, namespace=namespace)
+
+    secrets = [
+        # 1. Secret/pipeline-additional-configs
+        # Must exist, but can be empty
+        additionalConfigs if additionalConfigs is not None else emptySecret("pipeline-additional-configs"),
+        # 2. Secret/pipeline-sls-entitlement
+        buildFileSecret("pipeline-sls-entitlement", [slsLicenseFile]),
+        # 3. Secret/pipeline-certificates
+        # Must exist. It could be an empty secret at the first place before customer configure it
+        certs if certs is not None else emptySecret("pipeline-certificates"),
+        # 4. Secret/pipeline-pod-templates
+        # Must exist, but can be empty
+        podTemplates if podTemplates is not None else emptySecret("pipeline-pod-templates"),
+    ]
+    counts = syncSecrets(dynClient, namespace, secrets)
+    logger.debug(f"Install secrets in {namespace}: {counts['created']} created, {counts['updated']} updated, {counts['unchanged']} unchanged")
 
 
 def testCLI() -> None:
@@ -252,6 +429,44 @@ def testCLI() -> None:
     # fi
 
 
+def upgradePipelineParams(instanceId: str, skipPreCheck: bool = False, masChannel: str = "") -> dict:
+    """
+    The parameters of the PipelineRun created by launchUpgradePipeline
+    """
+    return dict(
+        mas_instance_id=instanceId,
+        skip_pre_check=skipPreCheck,
+        mas_channel=masChannel
+    )
+
+
+def uninstallPipelineParams(instanceId: str,
+                            droNamespace: str,
+                            certManagerProvider: str = "redhat",
+                            uninstallCertManager: bool = False,
+                            uninstallGrafana: bool = False,
+                            uninstallCatalog: bool = False,
+                            uninstallCommonServices: bool = False,
+                            uninstallUDS: bool = False,
+                            uninstallMongoDb: bool = False,
+                            uninstallSLS: bool = False) -> dict:
+    """
+    The parameters of the PipelineRun created by launchUninstallPipeline
+    """
+    return dict(
+        mas_instance_id=instanceId,
+        grafana_action="uninstall" if uninstallGrafana else "none",
+        cert_manager_provider=certManagerProvider,
+        cert_manager_action="uninstall" if uninstallCertManager else "none",
+        common_services_action="uninstall" if uninstallCommonServices else "none",
+        ibm_catalogs_action="uninstall" if uninstallCatalog else "none",
+        mongodb_action="uninstall" if uninstallMongoDb else "none",
+        sls_action="uninstall" if uninstallSLS else "none",
+        uds_action="uninstall" if uninstallUDS else "none",
+        dro_namespace=droNamespace
+    )
+
+
 def launchUpgradePipeline(dynClient: DynamicClient,
                           instanceId: str,
                           skipPreCheck: bool = False,
@@ -259,26 +474,14 @@ def launchUpgradePipeline(dynClient: DynamicClient,
     """
     Create a PipelineRun to upgrade the chosen MAS instance
     """
-    pipelineRunsAPI = dynClient.resources.get(api_version="tekton.dev/v1beta1", kind="PipelineRun")
+    pipelineRunsAPI = getResourceAPI(dynClient, "tekton.dev/v1beta1", "PipelineRun")
     namespace = f"mas-{instanceId}-pipelines"
     timestamp = datetime.now().strftime("%y%m%d-%H%M")
     # Create the PipelineRun
-    templateDir = path.join(path.abspath(path.dirname(__file__)), "templates")
-    env = Environment(
-        loader=FileSystemLoader(searchpath=templateDir)
-    )
-    template = env.get_template("pipelinerun-upgrade.yml.j2")
-    renderedTemplate = template.render(
-        timestamp=timestamp,
-        mas_instance_id=instanceId,
-        skip_pre_check=skipPreCheck,
-        mas_channel=masChannel
-    )
-    logger.debug(renderedTemplate)
-    pipelineRun = yaml.safe_load(renderedTemplate)
+    pipelineRun = buildPipelineRun("pipelinerun-upgrade", upgradePipelineParams(instanceId, skipPreCheck, masChannel), timestamp)
     pipelineRunsAPI.apply(body=pipelineRun, namespace=namespace)
 
-    pipelineURL = f"{getConsoleURL(dynClient)}/k8s/ns/mas-{instanceId}-pipelines/tekton.dev~v1beta1~PipelineRun/{instanceId}-upgrade-{timestamp}"
+    pipelineURL = f"{getClusterFacts(dynClient).consoleURL()}/k8s/ns/mas-{instanceId}-pipelines/tekton.dev~v1beta1~PipelineRun/{instanceId}-upgrade-{timestamp}"
     return pipelineURL
 
 
@@ -296,63 +499,51 @@ def launchUninstallPipeline(dynClient: DynamicClient,
     """
     Create a PipelineRun to uninstall the chosen MAS instance (and selected dependencies)
     """
-    pipelineRunsAPI = dynClient.resources.get(api_version="tekton.dev/v1beta1", kind="PipelineRun")
+    pipelineRunsAPI = getResourceAPI(dynClient, "tekton.dev/v1beta1", "PipelineRun")
     namespace = f"mas-{instanceId}-pipelines"
     timestamp = datetime.now().strftime("%y%m%d-%H%M")
     # Create the PipelineRun
-    templateDir = path.join(path.abspath(path.dirname(__file__)), "templates")
-    env = Environment(
-        loader=FileSystemLoader(searchpath=templateDir)
-    )
-    template = env.get_template("pipelinerun-uninstall.yml.j2")
+    pipelineRun = buildPipelineRun("pipelinerun-uninstall", uninstallPipelineParams(
+        instanceId, droNamespace, certManagerProvider, uninstallCertManager, uninstallGrafana, uninstallCatalog,
+        uninstallCommonServices, uninstallUDS, uninstallMongoDb, uninstallSLS
+    ), timestamp)
+    pipelineRunsAPI.apply(body=pipelineRun, namespace=namespace)
+
+    pipelineURL = f"{getClusterFacts(dynClient).consoleURL()}/k8s/ns/mas-{instanceId}-pipelines/tekton.dev~v1beta1~PipelineRun/{instanceId}-uninstall-{timestamp}"
+    return pipelineURL
 
-    grafanaAction = "uninstall" if uninstallGrafana else "none"
-    certManagerAction = "uninstall" if uninstallCertManager else "none"
-    commonServicesAction = "uninstall" if uninstallCommonServices else "none"
-    ibmCatalogAction = "uninstall" if uninstallCatalog else "none"
-    mongoDbAction = "uninstall" if uninstallMongoDb else "none"
-    slsAction = "uninstall" if uninstallSLS else "none"
-    udsAction = "uninstall" if uninstallUDS else "none"
 
-    # Render the pipelineRun
+def renderPipelineRun(templateName: str, params: dict, timestamp: str) -> dict:
+    """
+    Create a PipelineRun by rendering its template and parsing the resulting YAML (the compatibility path for buildPipelineRun)
+    """
+    template = getTemplateEnvironment().get_template(f"{templateName}.yml.j2")
     renderedTemplate = template.render(
         timestamp=timestamp,
-        mas_instance_id=instanceId,
-        grafana_action=grafanaAction,
-        cert_manager_provider=certManagerProvider,
-        cert_manager_action=certManagerAction,
-        common_services_action=commonServicesAction,
-        ibm_catalogs_action=ibmCatalogAction,
-        mongodb_action=mongoDbAction,
-        sls_action=slsAction,
-        uds_action=udsAction,
-        dro_namespace=droNamespace
+        **params
     )
     logger.debug(renderedTemplate)
-    pipelineRun = yaml.safe_load(renderedTemplate)
-    pipelineRunsAPI.apply(body=pipelineRun, namespace=namespace)
+    return yaml.load(renderedTemplate, Loader=SAFE_LOADER)
 
-    pipelineURL = f"{getConsoleURL(dynClient)}/k8s/ns/mas-{instanceId}-pipelines/tekton.dev~v1beta1~PipelineRun/{instanceId}-uninstall-{timestamp}"
-    return pipelineURL
+
+def buildPipelineRun(templateName: str, params: dict, timestamp: str, useTemplate: bool = False) -> dict:
+    """
+    Create a PipelineRun, building the object directly (see pipelinerun.py) unless useTemplate is set or there is
+    no builder for templateName, in which case the template is rendered instead
+    """
+    builder = PIPELINERUN_BUILDERS.get(templateName)
+    if useTemplate or builder is None:
+        return renderPipelineRun(templateName, params, timestamp)
+    pipelineRun = builder(params, timestamp)
+    logger.debug(pipelineRun)
+    return pipelineRun
 
 
-def launchPipelineRun(dynClient: DynamicClient, namespace: str, templateName: str, params: dict) -> str:
-    pipelineRunsAPI = dynClient.resources.get(api_version="tekton.dev/v1beta1", kind="PipelineRun")
+def launchPipelineRun(dynClient: DynamicClient, namespace: str, templateName: str, params: dict, useTemplate: bool = False) -> str:
+    pipelineRunsAPI = getResourceAPI(dynClient, "tekton.dev/v1beta1", "PipelineRun")
     timestamp = datetime.now().strftime("%y%m%d-%H%M")
     # Create the PipelineRun
-    templateDir = path.join(path.abspath(path.dirname(__file__)), "templates")
-    env = Environment(
-        loader=FileSystemLoader(searchpath=templateDir)
-    )
-    template = env.get_template(f"{templateName}.yml.j2")
-
-    # Render the pipelineRun
-    renderedTemplate = template.render(
-        timestamp=timestamp,
-        **params
-    )
-    logger.debug(renderedTemplate)
-    pipelineRun = yaml.safe_load(renderedTemplate)
+    pipelineRun = buildPipelineRun(templateName, params, timestamp, useTemplate=useTemplate)
     pipelineRunsAPI.apply(body=pipelineRun, namespace=namespace)
     return timestamp
 
@@ -365,7 +556,7 @@ def launchInstallPipeline(dynClient: DynamicClient, params: dict) -> str:
     namespace = f"mas-{instanceId}-pipelines"
     timestamp = launchPipelineRun(dynClient, namespace, "pipelinerun-install", params)
 
-    pipelineURL = f"{getConsoleURL(dynClient)}/k8s/ns/mas-{instanceId}-pipelines/tekton.dev~v1beta1~PipelineRun/{instanceId}-install-{timestamp}"
+    pipelineURL = f"{getClusterFacts(dynClient).consoleURL()}/k8s/ns/mas-{instanceId}-pipelines/tekton.dev~v1beta1~PipelineRun/{instanceId}-install-{timestamp}"
     return pipelineURL
 
 
@@ -376,5 +567,268 @@ def launchUpdatePipeline(dynClient: DynamicClient, params: dict) -> str:
     namespace = "mas-pipelines"
     timestamp = launchPipelineRun(dynClient, namespace, "pipelinerun-update", params)
 
-    pipelineURL = f"{getConsoleURL(dynClient)}/k8s/ns/mas-pipelines/tekton.dev~v1beta1~PipelineRun/mas-update-{timestamp}"
+    pipelineURL = f"{getClusterFacts(dynClient).consoleURL()}/k8s/ns/mas-pipelines/tekton.dev~v1beta1~PipelineRun/mas-update-{timestamp}"
     return pipelineURL
+
+
+def launchPipelineRuns(dynClient: DynamicClient, pipeline: str, paramSets: list, maxWorkers: int = 8) -> list:
+    """
+    Create PipelineRuns for many MAS instances at once, e.g. to upgrade a fleet of instances.
+
+    Every PipelineRun is built up front (sharing a single timestamp), then they are applied concurrently, using at most
+    maxWorkers threads.  The PipelineRun API and the console URL are only looked up once for the whole batch.
+
+    Parameters:
+      dynClient (DynamicClient): The OpenShift client
+      pipeline (str): The pipeline to run, "install", "upgrade" or "uninstall"
+      paramSets (list): The parameters for each PipelineRun, as used in the pipelinerun-{pipeline}.yml.j2 template
+                        (e.g. mas_instance_id, mas_channel and skip_pre_check for "upgrade").  Every parameter set
+                        must include mas_instance_id.
+      maxWorkers (int, optional): The maximum number of PipelineRuns to create concurrently. Defaults to 8.
+
+    Returns:
+      list: {"instanceId", "namespace", "pipelineRun", "url", "error"} for each parameter set, in the same order.
+            If the PipelineRun could not be created, error describes the problem.  The url is None if the PipelineRun
+            was not created, or if the console URL could not be looked up.
+    """
+    if pipeline not in ["install", "upgrade", "uninstall"]:
+        raise ValueError(f"Unsupported pipeline: {pipeline}")
+
+    pipelineRunsAPI = getResourceAPI(dynClient, "tekton.dev/v1beta1", "PipelineRun")
+    timestamp = datetime.now().strftime("%y%m%d-%H%M")
+
+    results = []
+    pipelineRuns = []
+    for params in paramSets:
+        instanceId = params.get("mas_instance_id")
+        result = dict(instanceId=instanceId, namespace=None, pipelineRun=None, url=None, error=None)
+        results.append(result)
+        if instanceId is None or instanceId == "":
+            result["error"] = "mas_instance_id is required"
+            continue
+        result["namespace"] = f"mas-{instanceId}-pipelines"
+        try:
+            pipelineRun = buildPipelineRun(f"pipelinerun-{pipeline}", params, timestamp)
+        except Exception as e:
+            result["error"] = f"Unable to build PipelineRun: {e}"
+            continue
+        result["pipelineRun"] = pipelineRun["metadata"]["name"]
+        pipelineRuns.append((result, pipelineRun))
+
+    if len(pipelineRuns) == 0:
+        return results
+
+    try:
+        consoleURL = getClusterFacts(dynClient).consoleURL()
+    except Exception as e:
+        # The PipelineRuns are still worth creating, even if we can't link to them
+        logger.warning(f"Unable to look up the OpenShift console URL: {e}")
+        consoleURL = None
+
+    def apply(result, pipelineRun):
+        try:
+            pipelineRunsAPI.apply(body=pipelineRun, namespace=result["namespace"])
+            if consoleURL is not None:
+                result["url"] = f"{consoleURL}/k8s/ns/{result['namespace']}/tekton.dev~v1beta1~PipelineRun/{result['pipelineRun']}"
+            logger.info(f"Created PipelineRun {result['namespace']}/{result['pipelineRun']}")
+        except Exception as e:
+            logger.error(f"Unable to create PipelineRun {result['namespace']}/{result['pipelineRun']}: {e}")
+            result["error"] = str(e)
+
+    with ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="pipelinerun-launch") as executor:
+        for future in [executor.submit(apply, result, pipelineRun) for result, pipelineRun in pipelineRuns]:
+            future.result()
+
+    return results
+
+
+# Progress events reported by trackPipelineRun
+PIPELINERUN_STARTED = "PipelineRunStarted"
+PIPELINERUN_SUCCEEDED = "PipelineRunSucceeded"
+PIPELINERUN_FAILED = "PipelineRunFailed"
+TASK_STARTED = "TaskStarted"
+TASK_SUCCEEDED = "TaskSucceeded"
+TASK_FAILED = "TaskFailed"
+
+# The longest we hold a single watch request open while tracking a PipelineRun, this also bounds how long the watch
+# threads outlive the tracker once it has finished
+TRACK_WATCH_TIMEOUT = 60
+
+
+def trackPipelineRun(dynClient: DynamicClient, namespace: str, pipelineRunName: str, timeout: int = None):
+    """
+    Follow the progress of a PipelineRun, yielding an event each time the PipelineRun or one of its tasks starts or
+    finishes.
+
+    The PipelineRun and its TaskRuns are watched (from background threads) rather than polled, so events are reported
+    as soon as the API server sees the change.  The PipelineRun does not need to exist yet, and tracking a PipelineRun
+    that has already made progress starts by reporting everything that has happened so far.  Every task event is
+    reported before the PipelineRun's own outcome, which is always the last event.
+
+    Parameters:
+      dynClient (DynamicClient): The OpenShift client
+      namespace (str): The namespace of the PipelineRun (e.g. mas-inst1-pipelines)
+      pipelineRunName (str): The name of the PipelineRun (e.g. inst1-upgrade-240501-1000)
+      timeout (int, optional): Stop tracking after this many seconds, None to track until the PipelineRun finishes.
+                               Defaults to None.
+
+    Yields:
+      dict: {"type", "pipelineRun", "task", "taskRun", "reason", "message", "startTime", "completionTime", "duration"}
+            where type is one of PIPELINERUN_STARTED, PIPELINERUN_SUCCEEDED, PIPELINERUN_FAILED, TASK_STARTED,
+            TASK_SUCCEEDED or TASK_FAILED, task and taskRun are None for PipelineRun events, and duration is the run
+            time in seconds once the run has finished.  If the deadline passes first the generator simply stops, so
+            the last event will not be PIPELINERUN_SUCCEEDED or PIPELINERUN_FAILED.
+    """
+    pipelineRunsAPI = getResourceAPI(dynClient, "tekton.dev/v1beta1", "PipelineRun")
+    taskRunsAPI = getResourceAPI(dynClient, "tekton.dev/v1beta1", "TaskRun")
+    taskRunSelector = f"tekton.dev/pipelineRun={pipelineRunName}"
+    deadline = None if timeout is None else monotonic() + timeout
+
+    runs = queue.Queue()
+    stop = threading.Event()
+    for resourceAPI, selectors in [
+        (pipelineRunsAPI, dict(field_selector=f"metadata.name={pipelineRunName}")),
+        (taskRunsAPI, dict(label_selector=taskRunSelector))
+    ]:
+        threading.Thread(
+            target=_watchRuns,
+            args=(resourceAPI, namespace, selectors, runs, stop),
+            name=f"pipelinerun-track-{resourceAPI.kind}",
+            daemon=True
+        ).start()
+
+    reported = {}
+    try:
+        while True:
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                return
+            try:
+                kind, run = runs.get(timeout=remaining)
+            except queue.Empty:
+                return
+            if kind is None:
+                raise run
+
+            events = _runProgress(kind, run, reported)
+            if kind == "PipelineRun" and len(events) > 0 and events[-1]["type"] in [PIPELINERUN_SUCCEEDED, PIPELINERUN_FAILED]:
+                # The two watches are independent, so the final update to the last TaskRun may still be on its way
+                yield from events[:-1]
+                for taskRun in taskRunsAPI.get(namespace=namespace, label_selector=taskRunSelector).items:
+                    yield from _runProgress("TaskRun", taskRun.to_dict(), reported)
+                yield events[-1]
+                return
+            yield from events
+    finally:
+        stop.set()
+
+
+def waitForPipelineRun(dynClient: DynamicClient, namespace: str, pipelineRunName: str, timeout: int = None) -> dict:
+    """
+    Wait for a PipelineRun to finish, logging the progress of each task as it happens.
+
+    Parameters:
+      dynClient (DynamicClient): The OpenShift client
+      namespace (str): The namespace of the PipelineRun (e.g. mas-inst1-pipelines)
+      pipelineRunName (str): The name of the PipelineRun (e.g. inst1-upgrade-240501-1000)
+      timeout (int, optional): Overall deadline in seconds, None to wait indefinitely. Defaults to None.
+
+    Returns:
+      dict: {"pipelineRun", "namespace", "succeeded", "reason", "message", "duration", "tasks"} where succeeded is None
+            if the PipelineRun did not finish before the deadline, and tasks lists
+            {"task", "taskRun", "succeeded", "reason", "message", "duration"} for every task that started, in the
+            order they started
+    """
+    result = dict(pipelineRun=pipelineRunName, namespace=namespace, succeeded=None, reason=None, message=None, duration=None, tasks=[])
+    tasks = {}
+    for event in trackPipelineRun(dynClient, namespace, pipelineRunName, timeout=timeout):
+        if event["taskRun"] is not None:
+            task = tasks.setdefault(event["taskRun"], dict(task=event["task"], taskRun=event["taskRun"], succeeded=None, reason=None, message=None, duration=None))
+            if event["type"] == TASK_STARTED:
+                logger.info(f"PipelineRun {namespace}/{pipelineRunName} started task {event['task']}")
+            else:
+                task.update(succeeded=event["type"] == TASK_SUCCEEDED, reason=event["reason"], message=event["message"], duration=event["duration"])
+                logger.info(f"PipelineRun {namespace}/{pipelineRunName} task {event['task']} finished in {event['duration']}s: {event['reason']}")
+        elif event["type"] != PIPELINERUN_STARTED:
+            result.update(succeeded=event["type"] == PIPELINERUN_SUCCEEDED, reason=event["reason"], message=event["message"], duration=event["duration"])
+            logger.info(f"PipelineRun {namespace}/{pipelineRunName} finished in {event['duration']}s: {event['reason']}")
+
+    if result["succeeded"] is None:
+        logger.warning(f"PipelineRun {namespace}/{pipelineRunName} did not finish within {timeout}s")
+    result["tasks"] = list(tasks.values())
+    return result
+
+
+def _watchRuns(resourceAPI, namespace: str, selectors: dict, runs: queue.Queue, stop: threading.Event) -> None:
+    """
+    List and then watch PipelineRuns or TaskRuns, putting (kind, run) on the runs queue for every version we see.  If
+    the watch fails (kind, run) is (None, exception).
+    """
+    resourceVersion = None
+    try:
+        while not stop.is_set():
+            if resourceVersion is None:
+                # (Re)establish the current state and the resourceVersion to watch from
+                current = resourceAPI.get(namespace=namespace, **selectors)
+                for item in current.items:
+                    runs.put((resourceAPI.kind, item.to_dict()))
+                resourceVersion = current.metadata.resourceVersion
+
+            try:
+                for event in resourceAPI.watch(namespace=namespace, resource_version=resourceVersion, timeout=TRACK_WATCH_TIMEOUT, **selectors):
+                    if stop.is_set():
+                        return
+                    resourceVersion = event["raw_object"]["metadata"]["resourceVersion"]
+                    if event["type"] in ["ADDED", "MODIFIED"]:
+                        runs.put((resourceAPI.kind, event["raw_object"]))
+            except ApiException as e:
+                if e.status != 410:
+                    raise
+                # The resourceVersion we were watching from is too old, we need to list again
+                logger.debug(f"Watch of {resourceAPI.kind}s in {namespace} expired, listing again")
+                resourceVersion = None
+    except Exception as e:
+        runs.put((None, e))
+
+
+def _runProgress(kind: str, run: dict, reported: dict) -> list:
+    """
+    Work out which progress events a new version of a PipelineRun or TaskRun represents, given the events already
+    reported for each run
+    """
+    metadata = run["metadata"]
+    status = run.get("status") or {}
+    condition = next((c for c in status.get("conditions") or [] if c.get("type") == "Succeeded"), {})
+    labels = metadata.get("labels") or {}
+
+    event = dict(
+        type=None,
+        pipelineRun=metadata["name"] if kind == "PipelineRun" else labels.get("tekton.dev/pipelineRun"),
+        task=labels.get("tekton.dev/pipelineTask") if kind == "TaskRun" else None,
+        taskRun=metadata["name"] if kind == "TaskRun" else None,
+        reason=condition.get("reason"),
+        message=condition.get("message"),
+        startTime=status.get("startTime"),
+        completionTime=status.get("completionTime"),
+        duration=None
+    )
+    if kind == "PipelineRun":
+        startedType, succeededType, failedType = PIPELINERUN_STARTED, PIPELINERUN_SUCCEEDED, PIPELINERUN_FAILED
+    else:
+        startedType, succeededType, failedType = TASK_STARTED, TASK_SUCCEEDED, TASK_FAILED
+
+    events = []
+    runReported = reported.setdefault((kind, metadata["name"]), set())
+    if event["startTime"] is not None and startedType not in runReported:
+        runReported.add(startedType)
+        events.append(dict(event, type=startedType))
+    if condition.get("status") in ["True", "False"] and succeededType not in runReported:
+        runReported.update([startedType, succeededType])
+        if event["startTime"] is not None and event["completionTime"] is not None:
+            event["duration"] = (_parseTime(event["completionTime"]) - _parseTime(event["startTime"])).total_seconds()
+        events.append(dict(event, type=succeededType if condition["status"] == "True" else failedType))
+    return events
+
+
+def _parseTime(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
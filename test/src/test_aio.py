@@ -0,0 +1,262 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import asyncio
+import gc
+import json
+import os
+import weakref
+
+import pytest
+import yaml
+
+pytest.importorskip("kubernetes_asyncio")
+
+from kubernetes_asyncio.client.rest import ApiException  # noqa: E402
+from kubernetes_asyncio.dynamic.exceptions import ForbiddenError, NotFoundError  # noqa: E402
+from kubernetes_asyncio.dynamic.resource import ResourceInstance  # noqa: E402
+
+from mas.devops import db2  # noqa: E402
+from mas.devops.aio import db2 as aiodb2, discovery as aiodiscovery, ocp as aioocp, tekton as aiotekton  # noqa: E402
+
+TEST_CASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test_cases", "manage_fail")
+
+
+def _deployment(readyReplicas: int = None, resourceVersion: str = "2") -> ResourceInstance:
+    return ResourceInstance(None, dict(
+        kind="Deployment",
+        metadata=dict(name="webhook", resourceVersion=resourceVersion),
+        status=dict(readyReplicas=readyReplicas) if readyReplicas is not None else dict()
+    ))
+
+
+def _list(items: list, resourceVersion: str = "1") -> ResourceInstance:
+    return ResourceInstance(None, dict(kind="DeploymentList", apiVersion="apps/v1", metadata=dict(resourceVersion=resourceVersion), items=items))
+
+
+def _watch(*batches):
+    """
+    A mock watch that yields each batch of events from successive watch requests, a batch may also be an exception
+    """
+    calls = []
+
+    def watch(**kwargs):
+        calls.append(kwargs)
+        batch = batches[len(calls) - 1]
+
+        async def events():
+            if isinstance(batch, Exception):
+                raise batch
+            for event in batch:
+                yield event
+        return events()
+    watch.calls = calls
+    return watch
+
+
+@pytest.fixture
+def mockResourceAPI(mocker):
+    resourceAPI = mocker.MagicMock(kind="Deployment")
+    resourceAPI.get = mocker.AsyncMock()
+    mocker.patch("mas.devops.aio.ocp.getResourceAPI", mocker.AsyncMock(return_value=resourceAPI))
+    return resourceAPI
+
+
+def _discoveringClient(mocker):
+    dynClient = mocker.MagicMock()
+    # Like a real resource handle, the one returned by discovery refers back to the client
+    dynClient.resources.get = mocker.AsyncMock(side_effect=lambda **kwargs: mocker.NonCallableMagicMock(client=dynClient))
+    return dynClient
+
+
+def test_getResourceAPI_cached(mocker):
+    dynClient = _discoveringClient(mocker)
+    resource = asyncio.run(aiodiscovery.getResourceAPI(dynClient, "v1", "Secret"))
+    assert asyncio.run(aiodiscovery.getResourceAPI(dynClient, "v1", "Secret")) is resource
+    assert dynClient.resources.get.await_count == 1
+
+    clientRef = weakref.ref(dynClient)
+    del dynClient, resource
+    gc.collect()
+    assert clientRef() is None
+
+
+def test_createDynamicClient_unwritable_cache(mocker, tmp_path):
+    mock_DynamicClient = mocker.patch("mas.devops.aio.discovery.DynamicClient", mocker.AsyncMock())
+    k8s_client = mocker.MagicMock()
+    k8s_client.configuration.host = "https://api.cluster.example.com:6443"
+    notADirectory = tmp_path / "file"
+    notADirectory.write_text("")
+    mocker.patch.dict("os.environ", {"MAS_DEVOPS_CACHE_DIR": str(notADirectory / "cache")})
+
+    asyncio.run(aiodiscovery.createDynamicClient(k8s_client))
+    assert mock_DynamicClient.call_args.kwargs["cache_file"] is None
+
+
+def test_waitForDeployment_watch(mockResourceAPI):
+    mockResourceAPI.get.side_effect = [_list([], resourceVersion="100"), _list([], resourceVersion="200")]
+    mockResourceAPI.watch.side_effect = _watch(
+        [dict(type="ADDED", object=_deployment(resourceVersion="101"))],
+        ApiException(status=410, reason="Gone"),
+        [dict(type="MODIFIED", object=_deployment(readyReplicas=1, resourceVersion="201"))],
+    )
+
+    assert asyncio.run(aioocp.waitForDeployment(None, "ns", "webhook")) is True
+    # The watch resumes from the last resourceVersion we saw, and we only list again once it has expired
+    assert [c["resource_version"] for c in mockResourceAPI.watch.side_effect.calls] == ["100", "101", "200"]
+    assert mockResourceAPI.get.call_count == 2
+
+
+def test_waitForDeployment_timeout(mockResourceAPI):
+    mockResourceAPI.get.return_value = _list([], resourceVersion="100")
+
+    assert asyncio.run(aioocp.waitForDeployment(None, "ns", "webhook", timeout=0)) is False
+    mockResourceAPI.watch.assert_not_called()
+
+
+def test_waitForCRD_poll_fallback(mocker, mockResourceAPI):
+    mockSleep = mocker.patch("asyncio.sleep", mocker.AsyncMock())
+    established = ResourceInstance(None, dict(kind="CustomResourceDefinition", status=dict(conditions=[dict(type="Established", status="True")])))
+    notEstablished = ResourceInstance(None, dict(kind="CustomResourceDefinition", status=dict(conditions=[dict(type="Established", status="False")])))
+    mockResourceAPI.get.side_effect = [ForbiddenError(ApiException(status=403, reason="Forbidden")), notEstablished, notEstablished, established]
+
+    assert asyncio.run(aioocp.waitForCRD(None, "tasks.tekton.dev")) is True
+    assert [c.args[0] for c in mockSleep.call_args_list] == [1, 2]
+
+
+class MockMessage:
+    def __init__(self, channel: int, data: str):
+        self.data = (chr(channel) + data).encode("utf-8")
+
+
+class MockWebSocket:
+    def __init__(self, messages: list):
+        self.messages = messages
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for message in self.messages:
+            yield message
+
+
+def test_execInPod(mocker):
+    coreV1Api = mocker.MagicMock()
+    coreV1Api.connect_get_namespaced_pod_exec = mocker.AsyncMock(return_value=MockWebSocket([
+        MockMessage(1, "line 1\n"), MockMessage(2, "warning\n"), MockMessage(1, "line 2\n"), MockMessage(3, json.dumps(dict(status="Success")))
+    ]))
+    assert asyncio.run(aioocp.execInPod(coreV1Api, "pod", "ns", ["ls"])) == "line 1\nline 2\n"
+
+    coreV1Api.connect_get_namespaced_pod_exec.return_value = MockWebSocket([
+        MockMessage(2, "oops"), MockMessage(3, json.dumps(dict(status="Failure", message="command terminated with non-zero exit code")))
+    ])
+    with pytest.raises(Exception, match="command terminated with non-zero exit code"):
+        asyncio.run(aioocp.execInPod(coreV1Api, "pod", "ns", ["ls"]))
+
+
+def _read(file_name: str) -> str:
+    with open(os.path.join(TEST_CASE_DIR, file_name), "r") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("batch", [True, False])
+def test_run_db2_config_validation(mocker, batch):
+    mocker.patch("mas.devops.aio.db2.client.CustomObjectsApi").return_value.get_namespaced_custom_object = mocker.AsyncMock(
+        return_value=yaml.safe_load(_read("db2uinstance.yaml"))
+    )
+    mocker.patch("mas.devops.aio.db2.WsApiClient")
+    outputs = {"db2 get dbm cfg": _read("db2getdbmcfg.txt"), "db2set": _read("db2set.txt"), "db2 get db cfg for BLUDB": _read("db2getdbcfg.txt")}
+
+    async def execInPod(core_v1_api, pod_name, namespace, command):
+        assert (pod_name, namespace) == ("c-db2wh-inst1-manage-db2u-0", "db2u-inst1")
+        if command[2] in outputs:
+            return outputs[command[2]]
+        sections = db2.db2_batched_cfg_commands(["BLUDB"])
+        return "".join(
+            f"{db2.BATCH_SECTION_MARKER} BEGIN {section}\n{outputs[command]}\n{db2.BATCH_SECTION_MARKER} END {section} 0\n"
+            for section, command in sections.items()
+        )
+    mockExecInPod = mocker.patch("mas.devops.aio.db2.execInPod", side_effect=execInPod)
+
+    result = asyncio.run(aiodb2.run_db2_config_validation(mocker.MagicMock(), "inst1", "manage", batch=batch))
+
+    assert mockExecInPod.call_count == (1 if batch else 3)
+    assert result["status"] == "failed"
+    assert "[registry cfg] DB2AUTH: WRONG != OSAUTHDB" in result["failures"]
+    assert {c["section"] for c in result["checks"]} == {"db cfg", "dbm cfg", "registry cfg"}
+
+
+def test_validate_db2_configs(mocker):
+    async def validate(k8s_client, mas_instance_id, mas_app_id, batch):
+        if mas_instance_id == "broken":
+            raise Exception("pod not found")
+        result = db2.new_db2_validation_result(mas_instance_id, mas_app_id)
+        result["status"] = "passed"
+        return result
+    mocker.patch("mas.devops.aio.db2.run_db2_config_validation", side_effect=validate)
+
+    report = asyncio.run(aiodb2.validate_db2_configs(None, targets=[("inst1", "manage"), ("broken", "manage")], max_concurrency=1))
+
+    assert report["summary"] == dict(total=2, passed=1, failed=0, error=1)
+    assert [r["error"] for r in report["results"]] == [None, "pod not found"]
+
+
+def test_launchUpgradePipeline(mocker):
+    pipelineRunsAPI = mocker.MagicMock(create=mocker.AsyncMock(), patch=mocker.AsyncMock())
+    pipelineRunsAPI.get = mocker.AsyncMock(side_effect=NotFoundError(ApiException(status=404, reason="Not Found")))
+    mocker.patch("mas.devops.aio.tekton.getResourceAPI", mocker.AsyncMock(return_value=pipelineRunsAPI))
+    mockGetConsoleURL = mocker.patch("mas.devops.aio.tekton.getConsoleURL", mocker.AsyncMock(return_value="https://console"))
+    facts = mocker.MagicMock()
+    facts.cached.return_value = None
+    mocker.patch("mas.devops.aio.tekton.getClusterFacts", return_value=facts)
+
+    url = asyncio.run(aiotekton.launchUpgradePipeline(None, "inst1", masChannel="9.0.x"))
+
+    # Like the synchronous launch, the PipelineRun is created with a client-side apply
+    body = pipelineRunsAPI.create.call_args.kwargs["body"]
+    assert url == f"https://console/k8s/ns/mas-inst1-pipelines/tekton.dev~v1beta1~PipelineRun/{body['metadata']['name']}"
+    assert body["metadata"]["name"].startswith("inst1-upgrade-")
+    assert body["metadata"]["namespace"] == "mas-inst1-pipelines"
+    assert "kubectl.kubernetes.io/last-applied-configuration" in body["metadata"]["annotations"]
+    assert pipelineRunsAPI.create.call_args.kwargs["namespace"] == "mas-inst1-pipelines"
+    assert {"name": "mas_channel", "value": "9.0.x"} in body["spec"]["params"]
+    facts.remember.assert_called_once_with("consoleURL", "https://console")
+
+    # The console URL is looked up once, then taken from the cluster facts
+    facts.cached.return_value = "https://console"
+    asyncio.run(aiotekton.launchUpgradePipeline(None, "inst1"))
+    assert mockGetConsoleURL.await_count == 1
+
+
+def test_apply_existing(mocker):
+    resourceAPI = mocker.MagicMock(create=mocker.AsyncMock(), patch=mocker.AsyncMock())
+    body = dict(apiVersion="tekton.dev/v1beta1", kind="PipelineRun", metadata=dict(name="inst1-upgrade-240101-1200"), spec=dict(timeout="0"))
+    applied = dict(body, metadata=dict(body["metadata"], namespace="mas-inst1-pipelines"))
+    actual = dict(applied, metadata=dict(applied["metadata"], annotations={
+        "kubectl.kubernetes.io/last-applied-configuration": json.dumps(applied, separators=(",", ":"), sort_keys=True)
+    }))
+    resourceAPI.get = mocker.AsyncMock(return_value=ResourceInstance(None, actual))
+
+    # Nothing has changed since the last apply, so the resource is left alone
+    asyncio.run(aiotekton._apply(resourceAPI, body, "mas-inst1-pipelines"))
+    resourceAPI.create.assert_not_called()
+    resourceAPI.patch.assert_not_called()
+
+    # Otherwise only the changes are patched
+    asyncio.run(aiotekton._apply(resourceAPI, dict(body, spec=dict(timeout="1h")), "mas-inst1-pipelines"))
+    assert resourceAPI.patch.call_args.kwargs["body"]["spec"] == dict(timeout="1h")
+    assert resourceAPI.patch.call_args.kwargs["content_type"] == "application/merge-patch+json"
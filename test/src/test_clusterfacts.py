@@ -0,0 +1,114 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import gc
+import pytest
+import weakref
+
+from mas.devops import clusterfacts
+
+
+@pytest.fixture
+def mockFacts(mocker):
+    mocks = {fact: mocker.MagicMock() for fact in clusterfacts.FACTS}
+    mocks["consoleURL"].return_value = "https://console-openshift-console.apps.cluster.example.com"
+    mocks["isSNO"].return_value = False
+    mocks["ocpVersion"].return_value = "4.15.10"
+    mocker.patch.dict(clusterfacts.FACTS, mocks)
+    return mocks
+
+
+@pytest.fixture
+def dynClient(mocker):
+    dynClient = mocker.MagicMock()
+    dynClient.client.configuration.host = "https://api.cluster.example.com:6443"
+    return dynClient
+
+
+def test_clusterFacts_memoized(mocker, mockFacts, dynClient, tmp_path):
+    mockTime = mocker.patch("mas.devops.clusterfacts.time", return_value=1000)
+    facts = clusterfacts.ClusterFacts(dynClient, ttl=60, cacheFile=None)
+
+    assert facts.consoleURL() == "https://console-openshift-console.apps.cluster.example.com"
+    assert facts.consoleURL() == "https://console-openshift-console.apps.cluster.example.com"
+    assert facts.isSNO() is False
+    assert mockFacts["consoleURL"].call_count == 1
+    assert mockFacts["isSNO"].call_count == 1
+    assert mockFacts["ocpVersion"].call_count == 0
+
+    # Facts are looked up again once they expire, or are invalidated
+    mockTime.return_value = 1060
+    facts.consoleURL()
+    assert mockFacts["consoleURL"].call_count == 2
+    facts.invalidate("consoleURL")
+    facts.consoleURL()
+    facts.isSNO()
+    assert mockFacts["consoleURL"].call_count == 3
+    assert mockFacts["isSNO"].call_count == 2
+
+    with pytest.raises(KeyError):
+        facts.get("unknown")
+
+
+def test_clusterFacts_persisted(mockFacts, dynClient, tmp_path, monkeypatch):
+    monkeypatch.setenv("MAS_DEVOPS_CACHE_DIR", str(tmp_path))
+    facts = clusterfacts.ClusterFacts(dynClient)
+    assert facts.cacheFile == clusterfacts.getClusterFactsFile("https://api.cluster.example.com:6443", str(tmp_path))
+    assert facts.ocpVersion() == "4.15.10"
+
+    # A new process talking to the same cluster starts with the facts already known
+    facts = clusterfacts.ClusterFacts(dynClient)
+    assert facts.ocpVersion() == "4.15.10"
+    assert mockFacts["ocpVersion"].call_count == 1
+
+    # An unreadable cache file is ignored
+    with open(facts.cacheFile, "w") as f:
+        f.write("{")
+    assert clusterfacts.ClusterFacts(dynClient).ocpVersion() == "4.15.10"
+    assert mockFacts["ocpVersion"].call_count == 2
+
+
+def test_getClusterFacts_shared(mockFacts, dynClient, tmp_path, monkeypatch):
+    monkeypatch.setenv("MAS_DEVOPS_CACHE_DIR", str(tmp_path))
+    assert clusterfacts.getClusterFacts(dynClient) is clusterfacts.getClusterFacts(dynClient)
+
+
+def test_getClusterFacts_releases_client(mocker, mockFacts, tmp_path, monkeypatch):
+    monkeypatch.setenv("MAS_DEVOPS_CACHE_DIR", str(tmp_path))
+    dynClient = mocker.MagicMock()
+    dynClient.client.configuration.host = "https://api.cluster.example.com:6443"
+    clusterfacts.getClusterFacts(dynClient)
+    clientRef = weakref.ref(dynClient)
+    del dynClient
+    gc.collect()
+    assert clientRef() is None
+
+
+def test_clusterFacts_unwritable_cache(mockFacts, dynClient, tmp_path, monkeypatch):
+    # The cache directory can't be created (e.g. a read-only HOME), so the facts are only kept in memory
+    notADirectory = tmp_path / "file"
+    notADirectory.write_text("")
+    monkeypatch.setenv("MAS_DEVOPS_CACHE_DIR", str(notADirectory / "cache"))
+    facts = clusterfacts.getClusterFacts(dynClient)
+    assert facts.cacheFile is None
+    assert facts.ocpVersion() == "4.15.10"
+    assert facts.ocpVersion() == "4.15.10"
+    assert mockFacts["ocpVersion"].call_count == 1
+
+
+def test_clusterFacts_remember(mockFacts, dynClient):
+    facts = clusterfacts.ClusterFacts(dynClient, ttl=60, cacheFile=None)
+    assert facts.cached("consoleURL") is None
+    facts.remember("consoleURL", "https://console")
+    assert facts.cached("consoleURL") == "https://console"
+    assert facts.consoleURL() == "https://console"
+    mockFacts["consoleURL"].assert_not_called()
+    with pytest.raises(KeyError):
+        facts.cached("unknown")
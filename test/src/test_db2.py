@@ -8,13 +8,19 @@
 #
 # *****************************************************************************
 
+import json
 import os
 import pytest
 import yaml
 
 
+from xml.etree import ElementTree
 from mas.devops import db2
 
+# kubernetes.client loads its API classes on first use, load them before any test patches ApiClient so that they are
+# not bound to the mock for the rest of the session
+from kubernetes.client import CoreV1Api, CustomObjectsApi  # noqa: F401
+
 
 @pytest.mark.parametrize("cr_k,cr_v,pod_v,expected", [
     ("MIRRORLOGPATH", "/mnt/backup/MIRRORLOGPATH", "/mnt/backup/MIRRORLOGPATH/NODE0000/LOGSTREAM0000/", True),
@@ -40,6 +46,57 @@ def test_cr_pod_v_matches(cr_k, cr_v, pod_v, expected):
     assert (db2.cr_pod_v_matches(cr_k, cr_v, pod_v) is expected)
 
 
+def test_parse_db2_cfg():
+    index = db2.parse_db2_cfg("\n".join([
+        "       Database Configuration for Database BLUDB",
+        "",
+        " Database territory                                      = US",
+        " Alternate collating sequence              (ALT_COLLATE) = ",
+        " Default application heap (4KB)             (APPLHEAPSZ) = AUTOMATIC(8192)",
+        " Changed pages threshold                (CHNGPGS_THRESH) = 80",
+        " Changed pages threshold                (CHNGPGS_THRESH) = 40",
+    ]))
+
+    assert index == {
+        "ALT_COLLATE": dict(description="Alternate collating sequence", param="ALT_COLLATE", value=""),
+        "APPLHEAPSZ": dict(description="Default application heap (4KB)", param="APPLHEAPSZ", value="AUTOMATIC(8192)"),
+        "CHNGPGS_THRESH": dict(description="Changed pages threshold", param="CHNGPGS_THRESH", value="80"),
+    }
+
+
+def test_parse_db2set():
+    index = db2.parse_db2set('''
+    DB2AUTH=OSAUTHDB,ALLOW_LOCAL_FALLBACK,PLUGIN_AUTO_RELOAD
+    DB2_FMP_COMM_HEAPSZ=65536 [O]
+    DB2_USE_ALTERNATE_PAGE_CLEANING=ON [DB2_WORKLOAD]
+    DB2FODC=DUMPSHM=ON CORESHM=OFF
+''')
+
+    assert index == {
+        "DB2AUTH": dict(description=None, param="DB2AUTH", value="OSAUTHDB,ALLOW_LOCAL_FALLBACK,PLUGIN_AUTO_RELOAD", overridden=False),
+        "DB2_FMP_COMM_HEAPSZ": dict(description=None, param="DB2_FMP_COMM_HEAPSZ", value="65536", overridden=True),
+        "DB2_USE_ALTERNATE_PAGE_CLEANING": dict(description=None, param="DB2_USE_ALTERNATE_PAGE_CLEANING", value="ON [DB2_WORKLOAD]", overridden=False),
+        "DB2FODC": dict(description=None, param="DB2FODC", value="DUMPSHM=ON CORESHM=OFF", overridden=False),
+    }
+
+
+def test_check_dbm_cfg_regex_metacharacters(mocker):
+    '''
+    CR keys are looked up literally, they are not interpreted as regular expressions
+    '''
+    mock_db2_pod_exec_db2_get_dbm_cfg = mocker.patch("mas.devops.db2.db2_pod_exec_db2_get_dbm_cfg")
+    mock_db2_pod_exec_db2_get_dbm_cfg.return_value = '''
+    Agent stack size                       (AGENT_STACK_SZ) = 1024
+  '''
+
+    db2_instance_cr = dict(spec=dict(environment=dict(instance=dict(dbmConfig={"AGENT.*": "1024", "(": "1"}))))
+
+    assert db2.check_dbm_cfg(db2_instance_cr, None, None, None) == [
+        "[dbm cfg] AGENT.* not found in output of db2 get dbm cfg command",
+        "[dbm cfg] ( not found in output of db2 get dbm cfg command"
+    ]
+
+
 def test_check_db_cfgs_no_spec():
     with pytest.raises(Exception, match="spec.environment.databases not found or empty"):
         db2.check_db_cfgs(
@@ -101,8 +158,8 @@ def test_check_db_cfgs(mocker):
     )
 
     assert mock_check_db_cfg.call_args_list == [
-        mocker.call(dict(name="a"), mock_core_v1_api, "mas_instance_id", "mas_app_id"),
-        mocker.call(dict(name="b"), mock_core_v1_api, "mas_instance_id", "mas_app_id")
+        mocker.call(dict(name="a"), mock_core_v1_api, "mas_instance_id", "mas_app_id", result=None),
+        mocker.call(dict(name="b"), mock_core_v1_api, "mas_instance_id", "mas_app_id", result=None)
     ]
 
 
@@ -274,6 +331,35 @@ def test_check_reg_cfg(mocker):
     ])
 
 
+def mock_test_case(test_case_name, mocker):
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+
+    mock_get_db2u_instance_cr = mocker.patch("mas.devops.db2.get_db2u_instance_cr")
+    with open(os.path.join(current_dir, "..", "test_cases", test_case_name, "db2uinstance.yaml"), "r") as f:
+        mock_get_db2u_instance_cr.return_value = yaml.load(f, Loader=yaml.FullLoader)
+
+    mock_db2_pod_exec_db2_get_db_cfg = mocker.patch("mas.devops.db2.db2_pod_exec_db2_get_db_cfg")
+    try:
+        with open(os.path.join(current_dir, "..", "test_cases", test_case_name, "db2getdbcfg.txt"), "r") as f:
+            mock_db2_pod_exec_db2_get_db_cfg.return_value = f.read()
+    except FileNotFoundError:
+        mock_db2_pod_exec_db2_get_db_cfg.return_value = None
+
+    mock_db2_pod_exec_db2_get_dbm_cfg = mocker.patch("mas.devops.db2.db2_pod_exec_db2_get_dbm_cfg")
+    try:
+        with open(os.path.join(current_dir, "..", "test_cases", test_case_name, "db2getdbmcfg.txt"), "r") as f:
+            mock_db2_pod_exec_db2_get_dbm_cfg.return_value = f.read()
+    except FileNotFoundError:
+        mock_db2_pod_exec_db2_get_dbm_cfg.return_value = None
+
+    mock_db2_pod_exec_db2set = mocker.patch("mas.devops.db2.db2_pod_exec_db2set")
+    try:
+        with open(os.path.join(current_dir, "..", "test_cases", test_case_name, "db2set.txt"), "r") as f:
+            mock_db2_pod_exec_db2set.return_value = f.read()
+    except FileNotFoundError:
+        mock_db2_pod_exec_db2set.return_value = None
+
+
 @pytest.mark.parametrize("test_case_name, expected_failures", [
     # This test case simulates what will happen when we run the validate_db2_config using the IoT Db2uInstance CR
     # as we have it today in fvtsaas after the CR settings have been applied successfully to DB2
@@ -332,50 +418,376 @@ def test_check_reg_cfg(mocker):
         "[registry cfg] DB2_WORKLOAD: MAXIMO != ANALYTICS",
     ]),
 ])
-def test_validate_db2_config(test_case_name, expected_failures, mocker):
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_validate_db2_config(test_case_name, expected_failures, max_workers, mocker):
     '''
     Each test case corresponds to a folder under test/test_cases.
     Each folder must contain a file db2uinstance.yaml and optionally db2getdbcfg.txt, db2getdbmcfg.txt and db2set.txt.
     '''
 
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-
-    mock_get_db2u_instance_cr = mocker.patch("mas.devops.db2.get_db2u_instance_cr")
-    with open(os.path.join(current_dir, "..", "test_cases", test_case_name, "db2uinstance.yaml"), "r") as f:
-        mock_get_db2u_instance_cr.return_value = yaml.load(f, Loader=yaml.FullLoader)
-
-    mock_db2_pod_exec_db2_get_db_cfg = mocker.patch("mas.devops.db2.db2_pod_exec_db2_get_db_cfg")
-    try:
-        with open(os.path.join(current_dir, "..", "test_cases", test_case_name, "db2getdbcfg.txt"), "r") as f:
-            mock_db2_pod_exec_db2_get_db_cfg.return_value = f.read()
-    except FileNotFoundError:
-        mock_db2_pod_exec_db2_get_db_cfg.return_value = None
-
-    mock_db2_pod_exec_db2_get_dbm_cfg = mocker.patch("mas.devops.db2.db2_pod_exec_db2_get_dbm_cfg")
-    try:
-        with open(os.path.join(current_dir, "..", "test_cases", test_case_name, "db2getdbmcfg.txt"), "r") as f:
-            mock_db2_pod_exec_db2_get_dbm_cfg.return_value = f.read()
-    except FileNotFoundError:
-        mock_db2_pod_exec_db2_get_dbm_cfg.return_value = None
-
-    mock_db2_pod_exec_db2set = mocker.patch("mas.devops.db2.db2_pod_exec_db2set")
-    try:
-        with open(os.path.join(current_dir, "..", "test_cases", test_case_name, "db2set.txt"), "r") as f:
-            mock_db2_pod_exec_db2set.return_value = f.read()
-    except FileNotFoundError:
-        mock_db2_pod_exec_db2set.return_value = None
+    mock_test_case(test_case_name, mocker)
 
     mock_ApiClient = mocker.patch("kubernetes.client.api_client.ApiClient")
     mock_k8s_client = mock_ApiClient.return_value
+    # Concurrent checks each create an ApiClient of their own
+    mocker.patch("kubernetes.client.ApiClient")
 
     mas_instance_id = "unittest"
     mas_app_id = test_case_name
 
     if len(expected_failures) == 0:
-        db2.validate_db2_config(mock_k8s_client, mas_instance_id, mas_app_id)
+        db2.validate_db2_config(mock_k8s_client, mas_instance_id, mas_app_id, max_workers=max_workers)
     else:
         with pytest.raises(Exception) as ex:
-            db2.validate_db2_config(mock_k8s_client, mas_instance_id, mas_app_id)
+            db2.validate_db2_config(mock_k8s_client, mas_instance_id, mas_app_id, max_workers=max_workers)
 
         assert ex.value.args[0]["message"] == f"{len(expected_failures)} checks failed"
         assert set(ex.value.args[0]["details"]) == set(expected_failures)
+
+
+def test_validate_db2_config_parallel_order(mocker):
+    '''
+    Verifies that running the checks concurrently reports the failures in exactly the same order as a serial run
+    '''
+    mock_test_case("manage_fail", mocker)
+    mock_k8s_client = mocker.patch("kubernetes.client.api_client.ApiClient").return_value
+    mocker.patch("kubernetes.client.ApiClient")
+
+    with pytest.raises(Exception) as serial:
+        db2.validate_db2_config(mock_k8s_client, "unittest", "manage_fail")
+    with pytest.raises(Exception) as parallel:
+        db2.validate_db2_config(mock_k8s_client, "unittest", "manage_fail", max_workers=4)
+
+    assert parallel.value.args[0] == serial.value.args[0]
+
+
+def test_check_db_cfgs_parallel(mocker):
+    mock_CoreV1Api = mocker.patch('kubernetes.client.CoreV1Api')
+    mocker.patch('kubernetes.client.ApiClient')
+
+    mock_check_db_cfg = mocker.patch("mas.devops.db2.check_db_cfg")
+    mock_check_db_cfg.side_effect = lambda cr_db, *args, **kwargs: [f"failure in {cr_db['name']}"]
+
+    failures = db2.check_db_cfgs(
+        dict(
+            spec=dict(
+                environment=dict(
+                    databases=[
+                        dict(name="a"), dict(name="b"), dict(name="c")
+                    ]
+                )
+            )
+        ), mock_CoreV1Api.return_value, "mas_instance_id", "mas_app_id", max_workers=3
+    )
+
+    assert failures == ["failure in a", "failure in b", "failure in c"]
+
+
+def batched_output(test_case_name: str, db_names: list) -> str:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    output = ""
+    for section, file_name in [("dbm", "db2getdbmcfg.txt"), ("registry", "db2set.txt"), *[(f"db {db_name}", "db2getdbcfg.txt") for db_name in db_names]]:
+        with open(os.path.join(current_dir, "..", "test_cases", test_case_name, file_name), "r") as f:
+            output += f"{db2.BATCH_SECTION_MARKER} BEGIN {section}\n{f.read()}\n{db2.BATCH_SECTION_MARKER} END {section} 0\n"
+    return output
+
+
+def test_db2_pod_exec_batched_cfg(mocker):
+    mock_db2_pod_exec = mocker.patch("mas.devops.db2.db2_pod_exec")
+    mock_db2_pod_exec.return_value = "\n".join([
+        f"{db2.BATCH_SECTION_MARKER} BEGIN dbm",
+        " Agent stack size                       (AGENT_STACK_SZ) = 1024",
+        f"{db2.BATCH_SECTION_MARKER} END dbm 0",
+        f"{db2.BATCH_SECTION_MARKER} BEGIN registry",
+        # Output that does not end in a newline
+        f"DB2AUTH=OSAUTHDB{db2.BATCH_SECTION_MARKER} END registry 0",
+        f"{db2.BATCH_SECTION_MARKER} BEGIN db A",
+        " Log file size (4KB)                         (LOGFILSIZ) = 50000",
+        f"{db2.BATCH_SECTION_MARKER} END db A 0",
+        f"{db2.BATCH_SECTION_MARKER} BEGIN db B",
+        " Log file size (4KB)                         (LOGFILSIZ) = 1024",
+        f"{db2.BATCH_SECTION_MARKER} END db B 0",
+    ])
+
+    cfg_pod = db2.db2_pod_exec_batched_cfg(None, "mas_instance_id", "mas_app_id", ["A", "B"])
+
+    assert cfg_pod == dict(
+        dbm=" Agent stack size                       (AGENT_STACK_SZ) = 1024\n",
+        registry="DB2AUTH=OSAUTHDB",
+        db=dict(
+            A=" Log file size (4KB)                         (LOGFILSIZ) = 50000\n",
+            B=" Log file size (4KB)                         (LOGFILSIZ) = 1024\n",
+        )
+    )
+
+    # Everything is captured using a single exec
+    assert mock_db2_pod_exec.call_count == 1
+    command = mock_db2_pod_exec.call_args.args[3]
+    assert command[0:2] == ["su", "-lc"] and command[3] == "db2inst1"
+    assert "db2 get dbm cfg" in command[2]
+    assert "db2set" in command[2]
+    assert "db2 get db cfg for A" in command[2]
+    assert "db2 get db cfg for B" in command[2]
+
+
+def test_db2_pod_exec_batched_cfg_command_failed(mocker):
+    mock_db2_pod_exec = mocker.patch("mas.devops.db2.db2_pod_exec")
+    mock_db2_pod_exec.return_value = "\n".join([
+        f"{db2.BATCH_SECTION_MARKER} BEGIN dbm",
+        f"{db2.BATCH_SECTION_MARKER} END dbm 0",
+        f"{db2.BATCH_SECTION_MARKER} BEGIN registry",
+        f"{db2.BATCH_SECTION_MARKER} END registry 0",
+        f"{db2.BATCH_SECTION_MARKER} BEGIN db A",
+        "SQL1013N  The database alias name or database name \"A\" could not be found.",
+        f"{db2.BATCH_SECTION_MARKER} END db A 4",
+    ])
+
+    with pytest.raises(Exception, match=r"Failed to execute db2 get db cfg for A \(rc=4\)"):
+        db2.db2_pod_exec_batched_cfg(None, "mas_instance_id", "mas_app_id", ["A"])
+
+
+def test_validate_db2_config_batch(mocker):
+    '''
+    Verifies that capturing the configuration in a single exec reports exactly the same failures as running each command separately
+    '''
+    mock_test_case("manage_fail", mocker)
+    mock_k8s_client = mocker.patch("kubernetes.client.api_client.ApiClient").return_value
+
+    with pytest.raises(Exception) as serial:
+        db2.validate_db2_config(mock_k8s_client, "unittest", "manage_fail")
+
+    mock_db2_pod_exec = mocker.patch("mas.devops.db2.db2_pod_exec")
+    mock_db2_pod_exec.return_value = batched_output("manage_fail", ["BLUDB"])
+    with pytest.raises(Exception) as batch:
+        db2.validate_db2_config(mock_k8s_client, "unittest", "manage_fail", batch=True)
+
+    assert mock_db2_pod_exec.call_count == 1
+    assert batch.value.args[0] == serial.value.args[0]
+
+
+def test_list_db2u_instances(mocker):
+    mock_custom_objects_api = mocker.MagicMock()
+    mock_custom_objects_api.list_cluster_custom_object.return_value = dict(items=[
+        dict(metadata=dict(name="db2wh-inst2-manage", namespace="db2u-inst2")),
+        dict(metadata=dict(name="db2wh-inst-1-iot", namespace="db2u-inst-1")),
+        dict(metadata=dict(name="db2wh-inst-1-manage", namespace="db2u-inst-1")),
+        dict(metadata=dict(name="mydb", namespace="db2u-inst-1")),
+        dict(metadata=dict(name="db2wh-other-manage", namespace="other")),
+    ])
+
+    assert db2.list_db2u_instances(mock_custom_objects_api) == [
+        ("inst-1", "iot"),
+        ("inst-1", "manage"),
+        ("inst2", "manage"),
+    ]
+
+
+def test_validate_db2_configs(mocker):
+    mock_ApiClient = mocker.patch("kubernetes.client.ApiClient")
+    mock_k8s_client = mocker.patch("kubernetes.client.api_client.ApiClient").return_value
+
+    def run_db2_config_validation(k8s_client, mas_instance_id, mas_app_id, max_workers=1, batch=False):
+        if mas_instance_id == "broken":
+            raise Exception("pod not found")
+        result = db2.new_db2_validation_result(mas_instance_id, mas_app_id)
+        result["status"] = "passed"
+        if mas_app_id == "manage":
+            result["status"] = "failed"
+            result["failures"] = ["[db cfg for BLUDB] LOGSECOND: 156 != 30", "[registry cfg] DB2AUTH: WRONG != OSAUTHDB"]
+        return result
+    mocker.patch("mas.devops.db2.run_db2_config_validation", side_effect=run_db2_config_validation)
+
+    report = db2.validate_db2_configs(mock_k8s_client, targets=[("inst1", "manage"), ("inst1", "iot"), ("broken", "manage")])
+
+    assert report["summary"] == dict(total=3, passed=1, failed=1, error=1)
+    assert [(r["mas_instance_id"], r["mas_app_id"], r["status"], r["error"], r["failures"]) for r in report["results"]] == [
+        ("inst1", "manage", "failed", None, ["[db cfg for BLUDB] LOGSECOND: 156 != 30", "[registry cfg] DB2AUTH: WRONG != OSAUTHDB"]),
+        ("inst1", "iot", "passed", None, []),
+        ("broken", "manage", "error", "pod not found", []),
+    ]
+    # The ApiClient used for each target is closed, even if its validation failed
+    assert mock_ApiClient.call_count == 3
+    assert mock_ApiClient.return_value.__exit__.call_count == 3
+
+
+def test_compare_cfg():
+    checks = db2.compare_cfg(
+        "db cfg",
+        dict(LOGSECOND="156", APPLHEAPSZ="8192 AUTOMATIC", MISSING="1"),
+        db2.parse_db2_cfg("\n".join([
+            " Number of secondary log files                (LOGSECOND) = 30",
+            " Default application heap (4KB)             (APPLHEAPSZ) = AUTOMATIC(8192)",
+        ])),
+        "db2 get db cfg",
+        database="BLUDB"
+    )
+    assert [(c["parameter"], c["expected"], c["actual"], c["status"], c["message"]) for c in checks] == [
+        ("LOGSECOND", "156", "30", "failed", "[db cfg for BLUDB] LOGSECOND: 156 != 30"),
+        ("APPLHEAPSZ", "8192 AUTOMATIC", "AUTOMATIC(8192)", "passed", None),
+        ("MISSING", "1", None, "missing", "[db cfg for BLUDB] MISSING not found in output of db2 get db cfg command"),
+    ]
+    assert all(c["section"] == "db cfg" and c["database"] == "BLUDB" for c in checks)
+
+
+@pytest.mark.parametrize("max_workers, batch", [(1, False), (4, False), (1, True)])
+def test_run_db2_config_validation(mocker, max_workers, batch):
+    test_case_name = "manage_fail"
+    mock_test_case(test_case_name, mocker)
+    mocker.patch("kubernetes.client.ApiClient")
+    mocker.patch("mas.devops.db2.db2_pod_exec").return_value = batched_output(test_case_name, ["BLUDB"])
+
+    with pytest.raises(Exception) as expected:
+        db2.validate_db2_config(None, None, None)
+
+    result = db2.run_db2_config_validation(None, None, None, max_workers=max_workers, batch=batch)
+
+    assert result["status"] == "failed"
+    assert result["failures"] == expected.value.args[0]["details"]
+    assert len(result["failures"]) == len([c for c in result["checks"] if c["status"] != "passed"])
+    assert {c["section"] for c in result["checks"]} == {"db cfg", "dbm cfg", "registry cfg"}
+    assert {t["phase"] for t in result["timings"]} == {"get", "exec", "parse", "compare"}
+    assert result["duration"] >= 0
+
+
+def test_format_db2_validation_report():
+    passed = db2.new_db2_validation_result("inst1", "iot")
+    passed.update(status="passed", duration=0.5, timings=[dict(phase="exec", target="db2set", seconds=0.25)], checks=[
+        dict(section="registry cfg", database=None, parameter="DB2AUTH", expected="OSAUTHDB", actual="OSAUTHDB", status="passed", message=None)
+    ])
+    failed = db2.new_db2_validation_result("inst1", "manage")
+    failed.update(status="failed", duration=1.5, failures=["[db cfg for BLUDB] LOGSECOND: 156 != 30"], checks=[
+        dict(section="db cfg", database="BLUDB", parameter="LOGSECOND", expected="156", actual="30", status="failed",
+             message="[db cfg for BLUDB] LOGSECOND: 156 != 30")
+    ])
+    errored = db2.new_db2_validation_result("broken", "manage")
+    errored.update(status="error", error="pod not found")
+    # e.g. nothing changed since the baseline, so there was nothing to check
+    unchecked = db2.new_db2_validation_result("inst2", "manage")
+    unchecked.update(status="passed", duration=0.1)
+    report = db2.summarize_db2_validation_results([passed, failed, errored, unchecked])
+
+    assert report["summary"] == dict(total=4, passed=2, failed=1, error=1)
+    assert json.loads(db2.format_db2_validation_report(report, "json")) == report
+    assert yaml.safe_load(db2.format_db2_validation_report(report, "yaml")) == report
+
+    junit = ElementTree.fromstring(db2.format_db2_validation_report(report, "junit"))
+    assert junit.attrib["tests"] == "4"
+    assert junit.attrib["failures"] == "1"
+    assert junit.attrib["errors"] == "1"
+    suites = junit.findall("testsuite")
+    assert [s.attrib["name"] for s in suites] == ["inst1/iot", "inst1/manage", "broken/manage", "inst2/manage"]
+    # Every testcase counted is present in the report
+    assert [s.attrib["tests"] for s in suites] == [str(len(s.findall("testcase"))) for s in suites] == ["1", "1", "1", "1"]
+    assert suites[3].find("testcase").attrib == dict(classname="inst2/manage", name="validate")
+    assert suites[0].find("properties/property").attrib == dict(name="exec: db2set", value="0.25")
+    assert suites[1].find("testcase").attrib == dict(classname="inst1/manage.db cfg.BLUDB", name="LOGSECOND")
+    assert suites[1].find("testcase/failure").attrib["message"] == "[db cfg for BLUDB] LOGSECOND: 156 != 30"
+    assert suites[2].find("testcase/error").attrib["message"] == "pod not found"
+
+    with pytest.raises(ValueError):
+        db2.format_db2_validation_report(report, "csv")
+
+
+def mock_drift_test_case(test_case_name, mocker):
+    mock_test_case(test_case_name, mocker)
+    mocker.patch("kubernetes.client.CoreV1Api")
+    mocker.patch("kubernetes.client.CustomObjectsApi")
+    db2.get_db2u_instance_cr.return_value["metadata"]["generation"] = 1
+    mock_get_db2_pod_fingerprint = mocker.patch("mas.devops.db2.get_db2_pod_fingerprint")
+    mock_get_db2_pod_fingerprint.return_value = dict(uid="pod-1", restarts=0)
+    mock_db2_pod_exec = mocker.patch("mas.devops.db2.db2_pod_exec")
+    mock_db2_pod_exec.return_value = batched_output(test_case_name, ["BLUDB"])
+    return mock_get_db2_pod_fingerprint, mock_db2_pod_exec
+
+
+def test_run_db2_config_drift_check(mocker):
+    mock_get_db2_pod_fingerprint, mock_db2_pod_exec = mock_drift_test_case("manage_fail", mocker)
+
+    # First run captures everything and records the baseline
+    first, baseline = db2.run_db2_config_drift_check(None, "unittest", "manage_fail")
+    assert mock_db2_pod_exec.call_count == 1
+    assert first["drift"] == dict(captured=True, reason="no baseline", changes=[])
+    assert baseline["cr"] == dict(generation=1, resourceVersion=None)
+    assert baseline["pod"] == dict(uid="pod-1", restarts=0)
+
+    # Nothing has changed, so the exec is skipped and the same result reported
+    second, second_baseline = db2.run_db2_config_drift_check(None, "unittest", "manage_fail", baseline=baseline)
+    assert mock_db2_pod_exec.call_count == 1
+    assert second["drift"] == dict(captured=False, reason="unchanged", changes=[])
+    assert second["failures"] == first["failures"]
+    assert second_baseline is baseline
+
+    # The pod restarted, but the configuration is the same
+    mock_get_db2_pod_fingerprint.return_value = dict(uid="pod-1", restarts=1)
+    third, baseline = db2.run_db2_config_drift_check(None, "unittest", "manage_fail", baseline=baseline)
+    assert mock_db2_pod_exec.call_count == 2
+    assert third["drift"] == dict(captured=True, reason="Db2 pod restarted", changes=[])
+    assert third["failures"] == first["failures"]
+
+    # The CR changed, only the deltas are reported
+    db2.get_db2u_instance_cr.return_value["metadata"]["generation"] = 2
+    db2.get_db2u_instance_cr.return_value["spec"]["environment"]["instance"]["registry"]["DB2AUTH"] = "OSAUTHDB"
+    fourth, baseline = db2.run_db2_config_drift_check(None, "unittest", "manage_fail", baseline=baseline)
+    assert mock_db2_pod_exec.call_count == 3
+    assert fourth["drift"]["reason"] == "Db2uInstance CR changed"
+    assert fourth["drift"]["changes"] == [dict(
+        section="registry cfg", database=None, parameter="DB2AUTH", change="changed",
+        previous=dict(status="failed", expected="WRONG", actual="OSAUTHDB"),
+        current=dict(status="passed", expected="OSAUTHDB", actual="OSAUTHDB")
+    )]
+    assert len(fourth["failures"]) == len(first["failures"]) - 1
+
+
+def test_run_db2_config_drift_check_max_age(mocker):
+    mock_get_db2_pod_fingerprint, mock_db2_pod_exec = mock_drift_test_case("manage_pass", mocker)
+
+    result, baseline = db2.run_db2_config_drift_check(None, "unittest", "manage_pass")
+    baseline["capturedAt"] -= 120
+    result, baseline = db2.run_db2_config_drift_check(None, "unittest", "manage_pass", baseline=baseline, max_age=60)
+
+    assert mock_db2_pod_exec.call_count == 2
+    assert result["drift"] == dict(captured=True, reason="baseline expired", changes=[])
+    assert result["status"] == "passed"
+
+
+def test_diff_db2_checks():
+    def check(parameter, status="passed", actual="1"):
+        return dict(section="dbm cfg", database=None, parameter=parameter, expected="1", actual=actual, status=status, message=None)
+
+    changes = db2.diff_db2_checks([check("A"), check("B"), check("C")], [check("A"), check("B", "failed", "2"), check("D")])
+    assert [(c["parameter"], c["change"]) for c in changes] == [("B", "changed"), ("D", "added"), ("C", "removed")]
+    assert changes[1]["previous"] is None
+    assert changes[2]["current"] is None
+
+
+def test_db2_baselines(tmp_path):
+    baseline_file = str(tmp_path / "baselines" / "db2.json")
+    assert db2.load_db2_baselines(baseline_file) == {}
+
+    db2.save_db2_baselines(baseline_file, {"inst1/manage": dict(outputsHash="abc")})
+    assert db2.load_db2_baselines(baseline_file) == {"inst1/manage": dict(outputsHash="abc")}
+    assert os.listdir(tmp_path / "baselines") == ["db2.json"]
+
+    with open(baseline_file, "w") as f:
+        json.dump(dict(version=0, baselines={"inst1/manage": {}}), f)
+    assert db2.load_db2_baselines(baseline_file) == {}
+
+    with open(baseline_file, "w") as f:
+        f.write("{not json")
+    assert db2.load_db2_baselines(baseline_file) == {}
+
+
+def test_validate_db2_configs_baseline(mocker, tmp_path):
+    mocker.patch("kubernetes.client.ApiClient")
+    mock_k8s_client = mocker.patch("kubernetes.client.api_client.ApiClient").return_value
+    mock_get_db2_pod_fingerprint, mock_db2_pod_exec = mock_drift_test_case("manage_fail", mocker)
+    baseline_file = str(tmp_path / "db2.json")
+
+    first = db2.validate_db2_configs(mock_k8s_client, targets=[("unittest", "manage_fail")], baseline_file=baseline_file)
+    second = db2.validate_db2_configs(mock_k8s_client, targets=[("unittest", "manage_fail")], baseline_file=baseline_file)
+
+    assert mock_db2_pod_exec.call_count == 1
+    assert list(db2.load_db2_baselines(baseline_file).keys()) == ["unittest/manage_fail"]
+    assert first["results"][0]["drift"]["captured"] is True
+    assert second["results"][0]["drift"]["captured"] is False
+    assert second["results"][0]["failures"] == first["results"][0]["failures"]
@@ -0,0 +1,302 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import copy
+import os
+import urllib.error
+import urllib.request
+
+import pytest
+import yaml
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+from mas.devops import db2watch
+
+TEST_CASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test_cases", "manage_fail")
+
+
+def _read(file_name):
+    with open(os.path.join(TEST_CASE_DIR, file_name), "r") as f:
+        return f.read()
+
+
+def _cr():
+    cr = yaml.safe_load(_read("db2uinstance.yaml"))
+    cr["metadata"].update(name="db2wh-inst1-manage", namespace="db2u-inst1")
+    return cr
+
+
+def _pod(uid="pod-1", restarts=0, ready=True):
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(name="c-db2wh-inst1-manage-db2u-0", namespace="db2u-inst1", uid=uid),
+        status=client.V1PodStatus(container_statuses=[
+            client.V1ContainerStatus(name="db2u", image="db2u", image_id="db2u", ready=ready, restart_count=restarts)
+        ])
+    )
+
+
+@pytest.fixture
+def mock_exec(mocker):
+    mocker.patch("kubernetes.client.CoreV1Api")
+    return dict(
+        batched=mocker.patch("mas.devops.db2.db2_pod_exec_batched_cfg", return_value=dict(
+            dbm=_read("db2getdbmcfg.txt"), registry=_read("db2set.txt"), db=dict(BLUDB=_read("db2getdbcfg.txt"))
+        )),
+        db=mocker.patch("mas.devops.db2.db2_pod_exec_db2_get_db_cfg", return_value=_read("db2getdbcfg.txt")),
+        dbm=mocker.patch("mas.devops.db2.db2_pod_exec_db2_get_dbm_cfg", return_value=_read("db2getdbmcfg.txt")),
+        registry=mocker.patch("mas.devops.db2.db2_pod_exec_db2set", return_value=_read("db2set.txt")),
+    )
+
+
+def test_changed_db2_cfg_sections():
+    previous = _cr()
+    current = copy.deepcopy(previous)
+    current["metadata"]["resourceVersion"] = "2"
+    current["status"] = dict(state="Ready")
+    assert db2watch.changed_db2_cfg_sections(previous, current) == set()
+
+    current["spec"]["environment"]["instance"]["registry"]["DB2AUTH"] = "OSAUTHDB"
+    current["spec"]["environment"]["databases"].append(dict(name="NEWDB", dbConfig=dict(LOGSECOND="10")))
+    assert db2watch.changed_db2_cfg_sections(previous, current) == {("registry cfg", None), ("db cfg", "NEWDB")}
+
+
+def test_watcher_cr_events(mock_exec):
+    watcher = db2watch.Db2ConfigWatcher(client.ApiClient())
+    target = ("inst1", "manage")
+
+    # A new Db2uInstance gets a full check using a single exec
+    cr = _cr()
+    watcher.handle_cr_event("ADDED", cr)
+    watcher.run_pending()
+    assert mock_exec["batched"].call_count == 1
+    state = watcher.metrics.get_state(target)
+    assert state["status"] == "failed"
+    assert "[registry cfg] DB2AUTH: WRONG != OSAUTHDB" in state["failures"]
+    failures = len(state["failures"])
+
+    # A status-only update does not trigger any checks
+    status_update = copy.deepcopy(cr)
+    status_update["status"] = dict(state="Ready")
+    watcher.handle_cr_event("MODIFIED", status_update)
+    watcher.run_pending()
+    assert mock_exec["batched"].call_count == 1
+    assert mock_exec["registry"].call_count == 0
+
+    # Only the section of configuration that changed is checked again
+    spec_update = copy.deepcopy(status_update)
+    spec_update["spec"]["environment"]["instance"]["registry"]["DB2AUTH"] = "OSAUTHDB"
+    watcher.handle_cr_event("MODIFIED", spec_update)
+    watcher.run_pending()
+    assert mock_exec["batched"].call_count == 1
+    assert mock_exec["registry"].call_count == 1
+    assert mock_exec["db"].call_count == 0
+    assert mock_exec["dbm"].call_count == 0
+    state = watcher.metrics.get_state(target)
+    assert "[registry cfg] DB2AUTH: WRONG != OSAUTHDB" not in state["failures"]
+    assert len(state["failures"]) == failures - 1
+
+    # Deleting the Db2uInstance removes it from the metrics
+    watcher.handle_cr_event("DELETED", spec_update)
+    assert watcher.metrics.get_state(target) is None
+    assert "inst1" not in watcher.metrics.render()
+
+
+def test_watcher_ignores_non_mas_resources(mock_exec):
+    watcher = db2watch.Db2ConfigWatcher(client.ApiClient())
+    cr = _cr()
+    cr["metadata"]["name"] = "mydb"
+    watcher.handle_cr_event("ADDED", cr)
+    pod = _pod()
+    pod.metadata.name = "c-mydb-db2u-0"
+    watcher.handle_pod_event("ADDED", pod)
+    watcher.run_pending()
+    assert mock_exec["batched"].call_count == 0
+
+
+def test_watcher_pod_events(mocker):
+    watcher = db2watch.Db2ConfigWatcher(client.ApiClient())
+    mock_schedule = mocker.patch.object(watcher, "schedule")
+
+    watcher.handle_pod_event("ADDED", _pod())
+    watcher.handle_pod_event("MODIFIED", _pod())
+    assert mock_schedule.call_count == 0
+
+    watcher.handle_pod_event("MODIFIED", _pod(restarts=1))
+    watcher.handle_pod_event("MODIFIED", _pod(uid="pod-2", restarts=0, ready=False))
+    watcher.handle_pod_event("MODIFIED", _pod(uid="pod-2", restarts=0, ready=True))
+    watcher.handle_pod_event("DELETED", _pod(uid="pod-2"))
+    watcher.handle_pod_event("ADDED", _pod(uid="pod-3"))
+    assert mock_schedule.call_args_list == [
+        mocker.call(("inst1", "manage"), db2watch.ALL_SECTIONS, "pod-restarted"),
+        mocker.call(("inst1", "manage"), db2watch.ALL_SECTIONS, "pod-ready"),
+    ]
+
+
+def test_watcher_schedule_merges(mocker):
+    watcher = db2watch.Db2ConfigWatcher(client.ApiClient())
+    mock_validate = mocker.patch.object(watcher, "validate")
+    target = ("inst1", "manage")
+
+    watcher.schedule(target, {("dbm cfg", None)}, "cr-changed")
+    watcher.schedule(target, {("registry cfg", None)}, "cr-changed")
+    watcher.run_pending()
+    watcher.schedule(target, {("dbm cfg", None)}, "cr-changed")
+    watcher.schedule(target, db2watch.ALL_SECTIONS, "pod-restarted")
+    watcher.run_pending()
+
+    assert mock_validate.call_args_list == [
+        mocker.call(target, {("dbm cfg", None), ("registry cfg", None)}, "cr-changed"),
+        mocker.call(target, db2watch.ALL_SECTIONS, "pod-restarted"),
+    ]
+
+
+def test_watcher_resync(mock_exec, mocker):
+    mock_monotonic = mocker.patch("mas.devops.db2watch.monotonic", return_value=1000)
+    watcher = db2watch.Db2ConfigWatcher(client.ApiClient(), max_age=60)
+    watcher.handle_cr_event("ADDED", _cr())
+    watcher.run_pending()
+
+    mock_monotonic.return_value = 1030
+    watcher.schedule_expired()
+    watcher.run_pending()
+    assert mock_exec["batched"].call_count == 1
+
+    mock_monotonic.return_value = 1060
+    watcher.schedule_expired()
+    watcher.run_pending()
+    assert mock_exec["batched"].call_count == 2
+    assert 'mas_db2_config_validations_total{mas_instance_id="inst1",mas_app_id="manage",trigger="resync"} 1' in watcher.metrics.render()
+
+
+def test_watcher_validation_error(mock_exec):
+    mock_exec["batched"].side_effect = Exception("pod not ready")
+    watcher = db2watch.Db2ConfigWatcher(client.ApiClient())
+    watcher.handle_cr_event("ADDED", _cr())
+    watcher.run_pending()
+
+    assert watcher.metrics.get_state(("inst1", "manage")) == dict(status="error", failures=[], error="pod not ready")
+    assert 'mas_db2_config_validation_error{mas_instance_id="inst1",mas_app_id="manage"} 1' in watcher.metrics.render()
+
+
+def test_watcher_validation_uses_own_api_client(mocker):
+    batched = mocker.patch("mas.devops.db2.db2_pod_exec_batched_cfg", side_effect=Exception("pod not ready"))
+    k8s_client = client.ApiClient()
+    watcher = db2watch.Db2ConfigWatcher(k8s_client)
+    watcher.handle_cr_event("ADDED", _cr())
+    watcher.run_pending()
+    watcher.schedule(("inst1", "manage"), db2watch.ALL_SECTIONS, "resync")
+    watcher.run_pending()
+
+    # Execs run on a client of their own (the same one every time) so they never patch the one used by the watches
+    exec_core_v1_apis = [c.args[0] for c in batched.call_args_list]
+    assert len(exec_core_v1_apis) == 2 and exec_core_v1_apis[0] is exec_core_v1_apis[1]
+    assert exec_core_v1_apis[0].api_client is not k8s_client
+    assert exec_core_v1_apis[0].api_client.configuration is k8s_client.configuration
+
+
+def test_metrics_render():
+    metrics = db2watch.Db2ConfigDriftMetrics()
+    metrics.update(("inst1", "manage"), {
+        ("db cfg", "BLUDB"): [
+            dict(section="db cfg", database="BLUDB", parameter="A", status="passed", message=None),
+            dict(section="db cfg", database="BLUDB", parameter="B", status="failed", message="[db cfg for BLUDB] B: 1 != 2"),
+        ],
+        ("registry cfg", None): [
+            dict(section="registry cfg", database=None, parameter="C", status="missing", message="[registry cfg] C not found"),
+        ]
+    }, 0.5, "discovered")
+    metrics.update(("inst1", "iot"), {}, 0.25, "discovered")
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE mas_db2_config_drift gauge" in lines
+    assert 'mas_db2_config_drift{mas_instance_id="inst1",mas_app_id="iot"} 0' in lines
+    assert 'mas_db2_config_drift{mas_instance_id="inst1",mas_app_id="manage"} 1' in lines
+    assert 'mas_db2_config_checks{mas_instance_id="inst1",mas_app_id="manage",section="db cfg",database="BLUDB",status="failed"} 1' in lines
+    assert 'mas_db2_config_checks{mas_instance_id="inst1",mas_app_id="manage",section="db cfg",database="BLUDB",status="passed"} 1' in lines
+    assert 'mas_db2_config_checks{mas_instance_id="inst1",mas_app_id="manage",section="registry cfg",status="missing"} 1' in lines
+    assert 'mas_db2_config_validation_duration_seconds{mas_instance_id="inst1",mas_app_id="manage"} 0.5' in lines
+    assert "# TYPE mas_db2_config_validations_total counter" in lines
+
+    assert db2watch.escape_label_value('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+
+def test_start_metrics_server():
+    metrics = db2watch.Db2ConfigDriftMetrics()
+    metrics.update(("inst1", "manage"), {}, 0.5, "discovered")
+    server = db2watch.start_metrics_server(metrics, address="127.0.0.1", port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert 'mas_db2_config_drift{mas_instance_id="inst1",mas_app_id="manage"} 0' in response.read().decode("utf-8")
+        with urllib.request.urlopen(f"{url}/healthz") as response:
+            assert response.status == 200
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(f"{url}/other")
+        assert e.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_watch_relists_after_expiry(mocker):
+    watcher = db2watch.Db2ConfigWatcher(client.ApiClient())
+    a = dict(metadata=dict(namespace="db2u-inst1", name="a", resourceVersion="1"))
+    b = dict(metadata=dict(namespace="db2u-inst1", name="b", resourceVersion="1"))
+    list_func = mocker.MagicMock(side_effect=[
+        dict(metadata=dict(resourceVersion="1"), items=[a, b]),
+        dict(metadata=dict(resourceVersion="5"), items=[a]),
+    ])
+
+    def stream(func, resource_version, **kwargs):
+        if resource_version == "1":
+            raise ApiException(status=410, reason="Expired")
+        yield dict(type="MODIFIED", object=a)
+        handle.stopped.set()
+        yield dict(type="MODIFIED", object=a)
+    mocker.patch("kubernetes.watch.Watch").return_value.stream.side_effect = stream
+
+    events = []
+    handle = db2watch._WatchHandle()
+    watcher._watch(handle, list_func, lambda event_type, item: events.append((event_type, item["metadata"]["name"])))
+
+    assert events == [("ADDED", "a"), ("ADDED", "b"), ("ADDED", "a"), ("DELETED", "b"), ("MODIFIED", "a")]
+
+
+def test_watcher_pod_watch_lifecycle(mock_exec, mocker):
+    mock_start_thread = mocker.patch.object(db2watch.Db2ConfigWatcher, "_start_thread")
+    watcher = db2watch.Db2ConfigWatcher(client.ApiClient())
+    watcher._running = True
+    manage = _cr()
+    iot = copy.deepcopy(manage)
+    iot["metadata"]["name"] = "db2wh-inst1-iot"
+
+    # One watch of only the Db2u engine pods per namespace, however many Db2uInstances are in it
+    watcher.handle_cr_event("ADDED", manage)
+    watcher.handle_cr_event("ADDED", iot)
+    assert mock_start_thread.call_count == 1
+    assert mock_start_thread.call_args.kwargs == dict(namespace="db2u-inst1", label_selector=db2watch.DB2_ENGINE_POD_LABEL_SELECTOR)
+    handle = mock_start_thread.call_args.args[2]
+
+    # The watch is stopped (interrupting the request in progress) once the last Db2uInstance in the namespace is deleted
+    handle.watch = mocker.MagicMock()
+    watcher.handle_cr_event("DELETED", manage)
+    assert not handle.stopped.is_set()
+    watcher.handle_cr_event("DELETED", iot)
+    assert handle.stopped.is_set()
+    handle.watch.stop.assert_called_once_with()
+    handle.watch._resp.connection.sock.shutdown.assert_called_once()
+
+    # and started again if a Db2uInstance is created there later
+    watcher.handle_cr_event("ADDED", manage)
+    assert mock_start_thread.call_count == 2
+    assert mock_start_thread.call_args.args[2] is not handle
@@ -0,0 +1,137 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import gc
+import json
+import pytest
+import weakref
+
+from kubernetes.client.rest import ApiException
+from openshift.dynamic.exceptions import NotFoundError
+
+from mas.devops import discovery
+
+
+def _notFound(body: dict) -> NotFoundError:
+    e = ApiException(status=404, reason="Not Found")
+    e.body = json.dumps(body)
+    return NotFoundError(e)
+
+
+def test_getResourceAPI_cached(mocker):
+    dynClient = mocker.MagicMock()
+
+    a = discovery.getResourceAPI(dynClient, "v1", "Secret")
+    b = discovery.getResourceAPI(dynClient, "v1", "Secret")
+    discovery.getResourceAPI(dynClient, "v1", "ConfigMap")
+
+    assert a is b
+    assert dynClient.resources.get.call_args_list == [
+        mocker.call(api_version="v1", kind="Secret"),
+        mocker.call(api_version="v1", kind="ConfigMap")
+    ]
+
+
+def test_getResourceAPI_per_client(mocker):
+    dynClientA = mocker.MagicMock()
+    dynClientB = mocker.MagicMock()
+
+    discovery.getResourceAPI(dynClientA, "v1", "Secret")
+    discovery.getResourceAPI(dynClientB, "v1", "Secret")
+
+    assert dynClientA.resources.get.call_count == 1
+    assert dynClientB.resources.get.call_count == 1
+
+
+def test_getResourceAPI_releases_client(mocker):
+    class Client:
+        def __init__(self):
+            # Like a real resource handle, the one returned by discovery refers back to the client
+            self.resources = mocker.MagicMock()
+            self.resources.get.side_effect = lambda **kwargs: mocker.NonCallableMagicMock(client=self)
+
+    dynClient = Client()
+    discovery.getResourceAPI(dynClient, "v1", "Secret")
+    clientRef = weakref.ref(dynClient)
+    del dynClient
+    gc.collect()
+    assert clientRef() is None
+
+
+def test_getResourceAPI_ttl(mocker):
+    dynClient = mocker.MagicMock()
+    mock_monotonic = mocker.patch("mas.devops.discovery.monotonic")
+
+    mock_monotonic.return_value = 1000
+    discovery.getResourceAPI(dynClient, "v1", "Secret")
+    mock_monotonic.return_value = 1000 + discovery.RESOURCE_CACHE_TTL - 1
+    discovery.getResourceAPI(dynClient, "v1", "Secret")
+    assert dynClient.resources.get.call_count == 1
+
+    mock_monotonic.return_value = 1000 + discovery.RESOURCE_CACHE_TTL + 1
+    discovery.getResourceAPI(dynClient, "v1", "Secret")
+    assert dynClient.resources.get.call_count == 2
+
+
+def test_getResourceAPI_object_not_found(mocker):
+    dynClient = mocker.MagicMock()
+    dynClient.resources.get.return_value.get.side_effect = _notFound(
+        {"kind": "Status", "reason": "NotFound", "details": {"name": "missing", "kind": "secrets"}}
+    )
+
+    secretsAPI = discovery.getResourceAPI(dynClient, "v1", "Secret")
+    with pytest.raises(NotFoundError):
+        secretsAPI.get(name="missing", namespace="default")
+
+    # A missing object says nothing about the resource type, so the handle is still cached
+    assert discovery.getResourceAPI(dynClient, "v1", "Secret") is secretsAPI
+
+
+def test_getResourceAPI_type_not_found(mocker):
+    dynClient = mocker.MagicMock()
+    dynClient.resources.get.return_value.get.side_effect = _notFound(
+        {"kind": "Status", "reason": "NotFound", "message": "the server could not find the requested resource", "details": {}}
+    )
+
+    suitesAPI = discovery.getResourceAPI(dynClient, "core.mas.ibm.com/v1", "Suite")
+    with pytest.raises(NotFoundError):
+        suitesAPI.get()
+
+    assert discovery.getResourceAPI(dynClient, "core.mas.ibm.com/v1", "Suite") is not suitesAPI
+    assert dynClient.resources.get.call_count == 2
+
+
+def test_createDynamicClient(mocker, tmp_path):
+    mock_DynamicClient = mocker.patch("mas.devops.discovery.DynamicClient")
+    k8s_client = mocker.MagicMock()
+    k8s_client.configuration.host = "https://api.cluster.example.com:6443"
+
+    mocker.patch.dict("os.environ", {"MAS_DEVOPS_CACHE_DIR": str(tmp_path)})
+    discovery.createDynamicClient(k8s_client)
+
+    cacheFile = mock_DynamicClient.call_args.kwargs["cache_file"]
+    assert cacheFile == discovery.getDiscoveryCacheFile(k8s_client.configuration.host)
+    assert cacheFile.startswith(str(tmp_path))
+
+
+def test_createDynamicClient_unwritable_cache(mocker, tmp_path):
+    mock_DynamicClient = mocker.patch("mas.devops.discovery.DynamicClient")
+    k8s_client = mocker.MagicMock()
+    k8s_client.configuration.host = "https://api.cluster.example.com:6443"
+
+    # The cache directory can't be created (e.g. a read-only HOME), so the client uses its default cache location
+    notADirectory = tmp_path / "file"
+    notADirectory.write_text("")
+    mocker.patch.dict("os.environ", {"MAS_DEVOPS_CACHE_DIR": str(notADirectory / "cache")})
+    with pytest.raises(OSError):
+        discovery.getCacheDir()
+    discovery.createDynamicClient(k8s_client)
+
+    assert mock_DynamicClient.call_args.kwargs["cache_file"] is None
@@ -0,0 +1,68 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import mas.devops
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(mas.devops.__file__))))
+BIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "bin")
+
+# Cumulative import time budgets in seconds, generous enough to absorb slow CI machines but tight enough to catch a
+# slow dependency being imported eagerly again (e.g. accessing kubernetes.client.CoreV1Api at import time alone used
+# to add more than a second)
+IMPORT_TIME_BUDGETS = {
+    "mas.devops": 0.05,
+    "mas.devops.ocp": 1.0,
+    "mas.devops.tekton": 1.0,
+    "mas.devops.db2": 1.0,
+}
+
+# Dependencies that are only imported when they are actually needed
+DEFERRED_MODULES = ["jinja2", "kubeconfig", "kubernetes.client.api.core_v1_api", "kubernetes.client.api.custom_objects_api"]
+
+
+def importTimes(args: list) -> dict:
+    """
+    Run python -X importtime, returning the cumulative import time in seconds of every module that was imported
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([SRC_DIR] + [p for p in os.environ.get("PYTHONPATH", "").split(os.pathsep) if p]))
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args, env=env, capture_output=True, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:"):
+            selfTime, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) / 1000000
+    return times
+
+
+@pytest.mark.parametrize("module", list(IMPORT_TIME_BUDGETS))
+def test_import_time(module):
+    times = importTimes(["-c", f"import {module}"])
+    assert times[module] < IMPORT_TIME_BUDGETS[module], f"Importing {module} took {times[module]:.3f}s"
+    for deferred in DEFERRED_MODULES:
+        assert deferred not in times, f"Importing {module} also imported {deferred}"
+
+
+def test_import_package_is_lazy():
+    times = importTimes(["-c", "import mas.devops"])
+    assert not any(name.split(".")[0] in ["kubernetes", "openshift", "yaml"] for name in times)
+
+
+@pytest.mark.parametrize("script", ["mas-devops-db2-validate-config", "mas-devops-db2-watch-config", "mas-devops-launch-pipelines"])
+def test_cli_help_is_fast(script):
+    times = importTimes([os.path.join(BIN_DIR, script), "--help"])
+    assert "argparse" in times
+    assert not any(name.startswith(("kubernetes", "openshift", "mas.devops")) for name in times)
@@ -0,0 +1,139 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import threading
+
+import pytest
+
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import ProtocolError
+from kubernetes.dynamic.resource import ResourceInstance
+from openshift.dynamic.exceptions import NotFoundError
+
+from mas.devops import informer, mas, ocp
+
+CRD = ("apiextensions.k8s.io/v1", "CustomResourceDefinition")
+
+
+def _obj(name: str, resourceVersion: str = "1", namespace: str = None) -> dict:
+    metadata = dict(name=name, resourceVersion=resourceVersion)
+    if namespace is not None:
+        metadata["namespace"] = namespace
+    return dict(metadata=metadata)
+
+
+def _page(names: list, resourceVersion: str = "10", continueToken: str = None) -> ResourceInstance:
+    return ResourceInstance(None, dict(
+        kind="CustomResourceDefinitionList",
+        apiVersion="apiextensions.k8s.io/v1",
+        metadata={"resourceVersion": resourceVersion, "continue": continueToken},
+        items=[_obj(name) for name in names]
+    ))
+
+
+@pytest.fixture
+def resourceAPI(mocker):
+    resourceAPI = mocker.MagicMock()
+    mocker.patch("mas.devops.informer.getResourceAPI", return_value=resourceAPI)
+    mocker.patch("mas.devops.ocp.getResourceAPI", return_value=resourceAPI)
+    yield resourceAPI
+    informer._informers.clear()
+
+
+def test_informer_list_and_watch(resourceAPI):
+    resourceAPI.get.side_effect = [_page(["a.mas.ibm.com"], continueToken="next"), _page(["b.mas.ibm.com"])]
+    crds = informer.Informer(None, *CRD)
+    crds._list()
+    assert crds.synced
+    assert resourceAPI.get.call_args_list[1].kwargs["_continue"] == "next"
+    assert sorted(crd.metadata.name for crd in crds.list()) == ["a.mas.ibm.com", "b.mas.ibm.com"]
+
+    resourceAPI.watch.return_value = iter([
+        dict(type="ADDED", raw_object=_obj("c.mas.ibm.com", "11")),
+        dict(type="MODIFIED", raw_object=dict(_obj("a.mas.ibm.com", "12"), spec=dict(group="mas.ibm.com"))),
+        dict(type="DELETED", raw_object=_obj("b.mas.ibm.com", "13")),
+    ])
+    crds._watch()
+    assert resourceAPI.watch.call_args.kwargs["resource_version"] == "10"
+    assert crds._resourceVersion == "13"
+    assert crds.get("a.mas.ibm.com").spec.group == "mas.ibm.com"
+    assert crds.get("b.mas.ibm.com") is None
+    assert crds.get("c.mas.ibm.com") is not None
+
+
+def test_informer_relists_after_expiry(resourceAPI):
+    resourceAPI.get.side_effect = [_page(["a.mas.ibm.com"]), _page(["b.mas.ibm.com"], resourceVersion="20")]
+    crds = informer.Informer(None, *CRD)
+    crds._list()
+
+    def watch(resource_version, timeout, watcher):
+        if resource_version == "10":
+            raise ApiException(status=410, reason="Gone")
+        crds.stop()
+        yield dict(type="ADDED", raw_object=_obj("c.mas.ibm.com", "21"))
+    resourceAPI.watch.side_effect = watch
+
+    crds._run()
+    assert [crd.metadata.name for crd in crds.list()] == ["b.mas.ibm.com"]
+
+
+def test_informer_stop_closes_watch(resourceAPI, mocker):
+    resourceAPI.get.side_effect = [_page(["a.mas.ibm.com"])]
+    crds = informer.Informer(None, *CRD)
+    crds._list()
+
+    # The watch blocks waiting for the next event until its connection is shut down
+    watching = threading.Event()
+    shutdown = threading.Event()
+
+    def watch(resource_version, timeout, watcher):
+        watcher._resp = mocker.MagicMock()
+        watcher._resp.connection.sock.shutdown.side_effect = lambda how: shutdown.set()
+        watching.set()
+        if not shutdown.wait(10):
+            yield dict(type="ADDED", raw_object=_obj("b.mas.ibm.com", "11"))
+        raise ProtocolError("Response ended prematurely")
+    resourceAPI.watch.side_effect = watch
+
+    thread = threading.Thread(target=crds._run)
+    thread.start()
+    assert watching.wait(10)
+    crds.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert shutdown.is_set()
+    assert resourceAPI.watch.call_count == 1
+
+
+def test_lookups_use_informer(resourceAPI, mocker):
+    dynClient = mocker.MagicMock()
+    resourceAPI.get.side_effect = [_page(["suites.core.mas.ibm.com"])]
+    mocker.patch.object(informer.Informer, "_run")
+
+    assert len(informer.startInformers(dynClient, kinds=[CRD])) == 1
+    assert ocp.crdExists(dynClient, "suites.core.mas.ibm.com")
+    assert not ocp.crdExists(dynClient, "missing.mas.ibm.com")
+    assert resourceAPI.get.call_count == 1
+
+    # Without the informer every lookup is a GET
+    informer.stopInformers(dynClient)
+    e = ApiException(status=404, reason="Not Found")
+    e.body = '{"details": {"name": "missing.mas.ibm.com"}}'
+    resourceAPI.get.side_effect = [NotFoundError(e)]
+    assert not ocp.crdExists(dynClient, "missing.mas.ibm.com")
+    resourceAPI.get.assert_called_with(name="missing.mas.ibm.com", namespace=None)
+
+
+def test_lookups_without_informer(mocker):
+    dynClient = mocker.MagicMock()
+    suitesAPI = mocker.MagicMock()
+    mocker.patch("mas.devops.informer.getResourceAPI", return_value=suitesAPI)
+    assert mas.verifyMasInstance(dynClient, "inst1")
+    suitesAPI.get.assert_called_once_with(name="inst1", namespace="mas-inst1-core")
@@ -0,0 +1,63 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import json
+import threading
+
+from mas.devops import multicluster
+from mas.devops.session import ClusterSession
+
+TARGETS = [
+    ("https://api.cluster1:6443", "token1"),
+    dict(name="cluster2", server="https://api.cluster2:6443", token="token2", skipVerify=True),
+    ClusterSession("https://api.cluster3:6443", "token3"),
+]
+
+
+def getHostAndToken(apiClient, suffix):
+    if "cluster2" in apiClient.configuration.host:
+        raise Exception("Forbidden")
+    return [dict(metadata=dict(name=apiClient.configuration.host + suffix)), apiClient.configuration.api_key["authorization"]]
+
+
+def test_runOnClusters():
+    results = multicluster.runOnClusters(TARGETS, getHostAndToken, "/inst1", view="apiClient", maxWorkers=3)
+    assert [result["cluster"] for result in results] == ["https://api.cluster1:6443", "cluster2", "https://api.cluster3:6443"]
+
+    # Each cluster was queried with its own client
+    assert results[0]["result"][1] == "token1"
+    assert results[1]["result"] is None
+    assert results[1]["error"] == "Forbidden"
+    assert results[2]["result"][1] == "token3"
+
+    table = multicluster.formatClusterResults(results).splitlines()
+    assert table[0].split() == ["CLUSTER", "DURATION", "RESULT"]
+    assert table[1].startswith("https://api.cluster1:6443") and table[1].endswith("https://api.cluster1:6443/inst1, token1")
+    assert table[2].endswith("ERROR: Forbidden")
+    assert json.loads(multicluster.formatClusterResults(results, "json"))[1]["error"] == "Forbidden"
+
+
+def test_streamOnClusters_timeout():
+    release = threading.Event()
+
+    def query(clusterSession):
+        if clusterSession.host == "https://api.cluster2:6443":
+            release.wait(10)
+        return clusterSession.host
+
+    try:
+        results = list(multicluster.streamOnClusters(TARGETS, query, view="session", maxWorkers=3, timeout=0.5))
+    finally:
+        release.set()
+
+    # Results are yielded as they complete, so the cluster that timed out is last
+    assert [result["cluster"] for result in results][-1] == "cluster2"
+    assert results[-1]["error"] == "Timed out after 0.5 seconds"
+    assert sorted(result["result"] for result in results[:2]) == ["https://api.cluster1:6443", "https://api.cluster3:6443"]
@@ -8,10 +8,18 @@
 #
 # *****************************************************************************
 
+import base64
+import itertools
+import os
+
 import pytest
 import yaml
 
 
+from kubernetes.client.rest import ApiException
+from kubernetes.dynamic.resource import ResourceInstance
+from openshift.dynamic.exceptions import ConflictError, ForbiddenError, NotFoundError
+
 from mas.devops import ocp
 
 
@@ -25,6 +33,7 @@ def test_execInPod_success(mocker):
 
     # Mock the response of the `stream` function
     mock_req = mock_stream.return_value
+    mock_req.is_open.return_value = False
     mock_req.run_forever.return_value = None
     mock_req.read_stdout.return_value = "mock_stdout"
     mock_req.read_stderr.return_value = "mock_stderr"
@@ -44,10 +53,402 @@ def test_execInPod_failure(mocker):
 
     # Mock the response of the `stream` function
     mock_req = mock_stream.return_value
+    mock_req.is_open.return_value = False
     mock_req.run_forever.return_value = None
     mock_req.read_stdout.return_value = "mock_stdout"
     mock_req.read_stderr.return_value = "mock_stderr"
-    mock_req.read_channel.return_value = yaml.dump({"status": "Failure"})
+    mock_req.read_channel.return_value = yaml.dump({"status": "Failure", "message": "command failed"})
 
-    with pytest.raises(Exception, match=r"Failed to execute \['command'\] on pod_name in namespace namespace: None. stdout: mock_stdout, stderr: mock_stderr"):
+    with pytest.raises(Exception, match=r"Failed to execute \['command'\] on pod_name in namespace namespace: command failed. stdout: mock_stdout, stderr: mock_stderr"):
         ocp.execInPod(mock_core_v1_api, 'pod_name', 'namespace', ['command'])
+
+
+def test_execInPod_no_status(mocker):
+    # The connection closed before the command reported its status, so there is no message from the error channel
+    mocker.patch('mas.devops.ocp.stream', return_value=_ExecResponse([("stdout", "partial"), ("stderr", "boom")]))
+    with pytest.raises(ocp.PodExecError) as e:
+        ocp.execInPod(mocker.MagicMock(), 'pod_name', 'namespace', ['command'])
+    assert str(e.value) == (
+        "Failed to execute ['command'] on pod_name in namespace namespace: connection closed before the command reported its status. "
+        "stderr: boom stdout: partial"
+    )
+
+
+class _ExecResponse:
+    """
+    Stands in for the WSClient returned by kubernetes.stream.stream, each update delivers the next frame (a frame of
+    None delivers nothing).  Once the frames run out the connection closes, unless the command is silent, in which
+    case it stays open without ever writing anything more.
+    """
+    def __init__(self, frames: list, status: dict = None, silent: bool = False):
+        self.frames = list(frames)
+        self.channels = {}
+        self.status = yaml.dump(status) if status is not None else ""
+        self.silent = silent
+        self.open = True
+        self.closed = False
+
+    def is_open(self):
+        return self.open
+
+    def update(self, timeout=0):
+        if self.frames:
+            frame = self.frames.pop(0)
+            if frame is not None:
+                channel, data = frame
+                self.channels[channel] = self.channels.get(channel, "") + data
+        self.open = len(self.frames) > 0 or self.silent
+
+    def _read(self, channel, timeout):
+        # Like WSClient.read_channel, without a timeout we keep waiting until something is written to the channel
+        if timeout is None:
+            while self.open and channel not in self.channels:
+                if not self.frames:
+                    raise AssertionError(f"Reading {channel} without a timeout would block forever")
+                self.update()
+        return self.channels.pop(channel, "")
+
+    def read_stdout(self, timeout=None):
+        return self._read("stdout", timeout)
+
+    def read_stderr(self, timeout=None):
+        return self._read("stderr", timeout)
+
+    def read_channel(self, channel):
+        return self.status
+
+    def close(self):
+        self.closed = True
+
+
+def test_streamExecInPod(mocker):
+    frames = [("stdout", "line 1\nli"), ("stderr", "warning\n"), ("stdout", "ne 2\n"), ("stdout", "line 3")]
+    response = _ExecResponse(frames, {"status": "Success"})
+    mocker.patch('mas.devops.ocp.stream', return_value=response)
+    assert list(ocp.streamExecInPod(mocker.MagicMock(), 'pod_name', 'namespace', ['command'])) == ["line 1\nli", "ne 2\n", "line 3"]
+    assert response.closed
+
+    mocker.patch('mas.devops.ocp.stream', return_value=_ExecResponse(frames, {"status": "Success"}))
+    assert list(ocp.streamExecInPod(mocker.MagicMock(), 'pod_name', 'namespace', ['command'], lines=True)) == ["line 1\n", "line 2\n", "line 3"]
+
+
+def test_streamExecInPod_exit_code(mocker):
+    status = {
+        "status": "Failure",
+        "message": "command terminated with non-zero exit code: error executing command [command], exit code 4",
+        "reason": "NonZeroExitCode",
+        "details": {"causes": [{"reason": "ExitCode", "message": "4"}]}
+    }
+    mocker.patch('mas.devops.ocp.stream', return_value=_ExecResponse([("stdout", "partial"), ("stderr", "boom")], status))
+    with pytest.raises(ocp.PodExecError, match="stdout: partial, stderr: boom") as e:
+        ocp.execInPod(mocker.MagicMock(), 'pod_name', 'namespace', ['command'])
+    assert e.value.exitCode == 4
+
+
+def test_streamExecInPod_timeout(mocker):
+    response = _ExecResponse([("stdout", "chunk")] * 10)
+    mocker.patch('mas.devops.ocp.stream', return_value=response)
+    mocker.patch('mas.devops.ocp.monotonic', side_effect=[0, 0, 1, 2, 3])
+    with pytest.raises(ocp.PodExecTimeoutError):
+        ocp.execInPod(mocker.MagicMock(), 'pod_name', 'namespace', ['command'], timeout=2)
+    assert response.closed
+
+
+def test_streamExecInPod_silent_timeout(mocker):
+    # The command writes one line, then nothing more on either channel while it keeps running
+    response = _ExecResponse([("stdout", "started\n"), None], silent=True)
+    mocker.patch('mas.devops.ocp.stream', return_value=response)
+    mocker.patch('mas.devops.ocp.monotonic', side_effect=itertools.count())
+    output = []
+    with pytest.raises(ocp.PodExecTimeoutError):
+        for chunk in ocp.streamExecInPod(mocker.MagicMock(), 'pod_name', 'namespace', ['command'], timeout=5):
+            output.append(chunk)
+    assert output == ["started\n"]
+    assert response.closed
+
+
+def test_execInPodToFile(mocker, tmp_path):
+    frames = [("stdout", "x" * 10)] * 3
+    mocker.patch('mas.devops.ocp.stream', return_value=_ExecResponse(frames, {"status": "Success"}))
+    outputFile = tmp_path / "output.txt"
+    assert ocp.execInPodToFile(mocker.MagicMock(), 'pod_name', 'namespace', ['command'], str(outputFile)) == 30
+    assert outputFile.read_text() == "x" * 30
+
+    mocker.patch('mas.devops.ocp.stream', return_value=_ExecResponse(frames, {"status": "Success"}))
+    with pytest.raises(ocp.PodExecOutputLimitError):
+        ocp.execInPodToFile(mocker.MagicMock(), 'pod_name', 'namespace', ['command'], str(outputFile), maxBytes=25)
+
+
+def _resource(obj: dict) -> ResourceInstance:
+    return ResourceInstance(None, obj)
+
+
+def _deployment(readyReplicas: int = None, resourceVersion: str = "2") -> ResourceInstance:
+    return _resource(dict(
+        kind="Deployment",
+        metadata=dict(name="webhook", resourceVersion=resourceVersion),
+        status=dict(readyReplicas=readyReplicas) if readyReplicas is not None else dict()
+    ))
+
+
+def _list(items: list, resourceVersion: str = "1") -> ResourceInstance:
+    return _resource(dict(kind="DeploymentList", apiVersion="apps/v1", metadata=dict(resourceVersion=resourceVersion), items=items))
+
+
+def test_waitForDeployment_already_ready(mocker):
+    dynClient = mocker.MagicMock()
+    deploymentAPI = dynClient.resources.get.return_value
+    deploymentAPI.get.return_value = _list([dict(metadata=dict(name="webhook"), status=dict(readyReplicas=1))])
+
+    assert ocp.waitForDeployment(dynClient, "ns", "webhook") is True
+    deploymentAPI.watch.assert_not_called()
+
+
+def test_waitForDeployment_watch(mocker):
+    dynClient = mocker.MagicMock()
+    deploymentAPI = dynClient.resources.get.return_value
+    deploymentAPI.get.return_value = _list([], resourceVersion="100")
+    deploymentAPI.watch.return_value = iter([
+        dict(type="ADDED", object=_deployment(resourceVersion="101")),
+        dict(type="MODIFIED", object=_deployment(readyReplicas=0, resourceVersion="102")),
+        dict(type="MODIFIED", object=_deployment(readyReplicas=1, resourceVersion="103")),
+    ])
+
+    assert ocp.waitForDeployment(dynClient, "ns", "webhook") is True
+    assert deploymentAPI.watch.call_args.kwargs["resource_version"] == "100"
+    assert deploymentAPI.watch.call_args.kwargs["name"] == "webhook"
+
+
+def test_waitForDeployment_watch_resumes(mocker):
+    dynClient = mocker.MagicMock()
+    deploymentAPI = dynClient.resources.get.return_value
+    deploymentAPI.get.return_value = _list([], resourceVersion="100")
+    deploymentAPI.watch.side_effect = [
+        iter([dict(type="ADDED", object=_deployment(resourceVersion="101"))]),
+        iter([dict(type="MODIFIED", object=_deployment(readyReplicas=1, resourceVersion="102"))]),
+    ]
+
+    assert ocp.waitForDeployment(dynClient, "ns", "webhook") is True
+    # We resume the watch from the last resourceVersion we saw rather than listing again
+    assert deploymentAPI.get.call_count == 1
+    assert [c.kwargs["resource_version"] for c in deploymentAPI.watch.call_args_list] == ["100", "101"]
+
+
+def test_waitForDeployment_watch_expired(mocker):
+    dynClient = mocker.MagicMock()
+    deploymentAPI = dynClient.resources.get.return_value
+    deploymentAPI.get.side_effect = [
+        _list([], resourceVersion="100"),
+        _list([dict(metadata=dict(name="webhook"), status=dict(readyReplicas=1))], resourceVersion="200"),
+    ]
+    deploymentAPI.watch.side_effect = ApiException(status=410, reason="Gone")
+
+    assert ocp.waitForDeployment(dynClient, "ns", "webhook") is True
+    assert deploymentAPI.get.call_count == 2
+
+
+def test_waitForDeployment_timeout(mocker):
+    dynClient = mocker.MagicMock()
+    deploymentAPI = dynClient.resources.get.return_value
+    deploymentAPI.get.return_value = _list([], resourceVersion="100")
+    deploymentAPI.watch.return_value = iter([])
+
+    assert ocp.waitForDeployment(dynClient, "ns", "webhook", timeout=0) is False
+    deploymentAPI.watch.assert_not_called()
+
+
+def test_waitForCRD_poll_fallback(mocker):
+    mock_sleep = mocker.patch("mas.devops.ocp.sleep")
+    dynClient = mocker.MagicMock()
+    crdAPI = dynClient.resources.get.return_value
+
+    notEstablished = _resource(dict(kind="CustomResourceDefinition", status=dict(conditions=[dict(type="Established", status="False")])))
+    established = _resource(dict(kind="CustomResourceDefinition", status=dict(conditions=[dict(type="Established", status="True")])))
+
+    crdAPI.get.side_effect = [
+        # The initial LIST is forbidden, so we fall back to polling the named CRD
+        ForbiddenError(ApiException(status=403, reason="Forbidden")),
+        NotFoundError(ApiException(status=404, reason="Not Found")),
+        notEstablished,
+        notEstablished,
+        established
+    ]
+
+    assert ocp.waitForCRD(dynClient, "tasks.tekton.dev") is True
+    # Polling backs off exponentially
+    assert [c.args[0] for c in mock_sleep.call_args_list] == [1, 2, 4]
+
+
+def _pvc(namespace: str, phase: str = "Pending", resourceVersion: str = "2") -> dict:
+    return dict(
+        kind="PersistentVolumeClaim",
+        metadata=dict(name="config-pvc", namespace=namespace, resourceVersion=resourceVersion),
+        status=dict(phase=phase)
+    )
+
+
+def test_waitForPVCs(mocker):
+    dynClient = mocker.MagicMock()
+    pvcAPI = dynClient.resources.get.return_value
+    pvcAPI.get.return_value = _resource(dict(kind="PersistentVolumeClaimList", apiVersion="v1", metadata=dict(resourceVersion="100"), items=[
+        _pvc("mas-inst1-pipelines", "Bound"), _pvc("mas-inst2-pipelines"), _pvc("other")
+    ]))
+    pvcAPI.watch.return_value = iter([
+        dict(type="MODIFIED", object=_resource(_pvc("other", "Bound", "101"))),
+        dict(type="ADDED", object=_resource(_pvc("mas-inst3-pipelines", "Pending", "102"))),
+        dict(type="MODIFIED", object=_resource(_pvc("mas-inst2-pipelines", "Bound", "103"))),
+    ])
+
+    # The deadline passes once the watch has ended
+    mocker.patch("mas.devops.ocp.monotonic", side_effect=[0, 0, 20])
+
+    pvcs = [("mas-inst1-pipelines", "config-pvc"), ("mas-inst2-pipelines", "config-pvc"), ("mas-inst3-pipelines", "config-pvc")]
+    assert ocp.waitForPVCs(dynClient, pvcs, timeout=10) == [("mas-inst3-pipelines", "config-pvc")]
+
+    # A single list and watch, across all namespaces, covers every PVC
+    assert pvcAPI.get.call_count == 1
+    assert pvcAPI.watch.call_count == 1
+    assert pvcAPI.watch.call_args.kwargs["namespace"] is None
+    assert pvcAPI.watch.call_args.kwargs["field_selector"] == "metadata.name=config-pvc"
+    assert pvcAPI.watch.call_args.kwargs["resource_version"] == "100"
+
+
+def test_createResources(mocker):
+    dynClient = mocker.MagicMock()
+    resourceAPI = dynClient.resources.get.return_value
+
+    def create(body, namespace):
+        if body["metadata"]["name"] == "existing":
+            raise ConflictError(ApiException(status=409, reason="Conflict"))
+        if body["metadata"]["name"] == "forbidden":
+            raise ForbiddenError(ApiException(status=403, reason="Forbidden"))
+    resourceAPI.create.side_effect = create
+
+    assert ocp.createNamespaces(dynClient, ["new", "existing"]) == dict(created=["Namespace/new"], existing=["Namespace/existing"])
+    assert resourceAPI.get.call_count == 0
+
+    pvc = dict(apiVersion="v1", kind="PersistentVolumeClaim", metadata=dict(name="config-pvc", namespace="new"))
+    with pytest.raises(Exception, match="Failed to create 1 resources: Namespace/forbidden"):
+        ocp.createResources(dynClient, [pvc, dict(apiVersion="v1", kind="Namespace", metadata=dict(name="forbidden"))])
+    resourceAPI.create.assert_any_call(body=pvc, namespace="new")
+
+
+def test_buildFileSecret(tmp_path):
+    licenseFile = tmp_path / "entitlement.lic"
+    content = os.urandom(ocp.SECRET_FILE_CHUNK_SIZE * 2 + 100)
+    licenseFile.write_bytes(content)
+
+    secret = ocp.buildFileSecret("pipeline-sls-entitlement", [str(licenseFile)])
+    assert secret["metadata"]["name"] == "pipeline-sls-entitlement"
+    assert secret["data"] == {"entitlement.lic": base64.b64encode(content).decode("ascii")}
+
+
+def _secret(name: str, data: dict, secretType: str = "Opaque") -> ResourceInstance:
+    return _resource(dict(kind="Secret", type=secretType, metadata=dict(name=name, resourceVersion="5"), data=data))
+
+
+def test_syncSecrets(mocker):
+    dynClient = mocker.MagicMock()
+    secretsAPI = dynClient.resources.get.return_value
+    encoded = base64.b64encode(b"value").decode("ascii")
+    existing = {
+        "unchanged": _secret("unchanged", {"key": encoded}),
+        "changed": _secret("changed", {"key": encoded, "removed": encoded}),
+        "empty": _secret("empty", None),
+    }
+
+    def get(name, namespace):
+        if name not in existing:
+            raise NotFoundError(ApiException(status=404, reason="Not Found"))
+        return existing[name]
+    secretsAPI.get.side_effect = get
+
+    counts = ocp.syncSecrets(dynClient, "mas-inst1-pipelines", [
+        dict(apiVersion="v1", kind="Secret", type="Opaque", metadata=dict(name="unchanged"), stringData={"key": "value"}),
+        dict(apiVersion="v1", kind="Secret", type="Opaque", metadata=dict(name="changed"), data={"key": encoded}),
+        dict(apiVersion="v1", kind="Secret", type="Opaque", metadata=dict(name="empty")),
+        dict(apiVersion="v1", kind="Secret", type="Opaque", metadata=dict(name="new"), data={"key": encoded}),
+    ])
+
+    assert counts == dict(created=1, updated=1, unchanged=2)
+    assert secretsAPI.delete.call_count == 0
+    assert secretsAPI.create.call_args.kwargs["body"]["metadata"] == dict(name="new", namespace="mas-inst1-pipelines")
+    # Replacing the secret drops keys that are no longer wanted, just like delete and create did
+    replaced = secretsAPI.replace.call_args.kwargs["body"]
+    assert replaced["data"] == {"key": encoded}
+    assert replaced["metadata"] == dict(name="changed", namespace="mas-inst1-pipelines", resourceVersion="5")
+
+
+def test_syncSecrets_type_changed(mocker):
+    dynClient = mocker.MagicMock()
+    secretsAPI = dynClient.resources.get.return_value
+    encoded = base64.b64encode(b"value").decode("ascii")
+    secretsAPI.get.return_value = _secret("registry", {"key": encoded})
+
+    counts = ocp.syncSecrets(dynClient, "mas-inst1-pipelines", [
+        dict(apiVersion="v1", kind="Secret", type="kubernetes.io/dockerconfigjson", metadata=dict(name="registry"), data={"key": encoded}),
+    ])
+
+    # The type of a secret can't be changed by replacing it, so it is deleted and created again
+    assert counts == dict(created=0, updated=1, unchanged=0)
+    secretsAPI.replace.assert_not_called()
+    secretsAPI.delete.assert_called_once_with(name="registry", namespace="mas-inst1-pipelines")
+    created = secretsAPI.create.call_args.kwargs["body"]
+    assert created["type"] == "kubernetes.io/dockerconfigjson"
+    assert created["metadata"] == dict(name="registry", namespace="mas-inst1-pipelines")
+
+
+def test_syncSecrets_failure(mocker):
+    dynClient = mocker.MagicMock()
+    secretsAPI = dynClient.resources.get.return_value
+    secretsAPI.get.side_effect = NotFoundError(ApiException(status=404, reason="Not Found"))
+    secretsAPI.create.side_effect = [Exception("forbidden"), None]
+
+    with pytest.raises(Exception, match="Failed to sync 1 secrets in mas-inst1-pipelines"):
+        ocp.syncSecrets(dynClient, "mas-inst1-pipelines", [
+            dict(apiVersion="v1", kind="Secret", metadata=dict(name="a")),
+            dict(apiVersion="v1", kind="Secret", metadata=dict(name="b")),
+        ])
+    assert secretsAPI.create.call_count == 2
+
+
+def _page(kind: str, names: list, continueToken: str = None) -> ResourceInstance:
+    metadata = {} if continueToken is None else {"continue": continueToken}
+    return _resource(dict(kind=f"{kind}List", apiVersion="v1", metadata=metadata, items=[dict(metadata=dict(name=name)) for name in names]))
+
+
+def test_listResources(mocker):
+    dynClient = mocker.MagicMock()
+    nodesAPI = dynClient.resources.get.return_value
+    nodesAPI.get.side_effect = [_page("Node", ["node1", "node2"], "token1"), _page("Node", ["node3"])]
+
+    nodes = ocp.listResources(dynClient, "v1", "Node", labelSelector="node-role.kubernetes.io/worker", metadataOnly=True, pageSize=2)
+    assert [node.metadata.name for node in nodes] == ["node1", "node2", "node3"]
+    assert [c.kwargs["_continue"] for c in nodesAPI.get.call_args_list] == [None, "token1"]
+    assert nodesAPI.get.call_args.kwargs["label_selector"] == "node-role.kubernetes.io/worker"
+    assert nodesAPI.get.call_args.kwargs["limit"] == 2
+    assert nodesAPI.get.call_args.kwargs["header_params"] == {"Accept": ocp.METADATA_ONLY_ACCEPT}
+
+
+def test_isSNO(mocker):
+    dynClient = mocker.MagicMock()
+    nodesAPI = dynClient.resources.get.return_value
+    nodesAPI.get.return_value = _page("Node", ["node1"])
+    assert ocp.isSNO(dynClient) is True
+    assert nodesAPI.get.call_args.kwargs["limit"] == 2
+    assert "header_params" in nodesAPI.get.call_args.kwargs
+
+    # We never need more than the first page to know there is more than one node
+    nodesAPI.get.reset_mock()
+    nodesAPI.get.return_value = _page("Node", ["node1", "node2"], "token1")
+    assert ocp.isSNO(dynClient) is False
+    assert nodesAPI.get.call_count == 1
+
+
+def test_getDefaultStorageClasses(mocker):
+    dynClient = mocker.MagicMock()
+    dynClient.resources.get.return_value.get.return_value = _resource(dict(kind="StorageClassList", apiVersion="storage.k8s.io/v1", metadata={}, items=[
+        dict(metadata=dict(name="ocs-storagecluster-ceph-rbd", annotations={"storageclass.kubernetes.io/is-default-class": "true"})),
+        dict(metadata=dict(name="ocs-storagecluster-cephfs")),
+    ]))
+    assert ocp.getDefaultStorageClasses(dynClient) == ["ocs-storagecluster-ceph-rbd"]
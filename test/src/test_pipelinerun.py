@@ -0,0 +1,109 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import random
+import pytest
+
+from jinja2 import meta
+
+from mas.devops import pipelinerun, tekton
+
+TIMESTAMP = "240101-1200"
+
+
+@pytest.fixture(autouse=True)
+def templateCacheDir(tmp_path, monkeypatch):
+    # Never write compiled templates into the real ~/.cache/mas-devops
+    monkeypatch.setenv("MAS_DEVOPS_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(tekton, "_templateEnv", None)
+
+
+def templateVariables(templateName: str) -> list:
+    env = tekton.getTemplateEnvironment()
+    source = env.loader.get_source(env, f"{templateName}.yml.j2")[0]
+    return sorted(meta.find_undeclared_variables(env.parse(source)) - {"timestamp"})
+
+
+def paramSets(templateName: str, values: list, complete: bool = False) -> list:
+    variables = templateVariables(templateName)
+    sets = [{name: f"value-{name}" for name in variables}]
+    if not complete:
+        sets.extend([{}, {name: "" for name in variables}])
+    # Every value used in a condition in the templates, for every parameter at once
+    for value in values:
+        sets.append({name: value for name in variables})
+    # And a mixture of them, for random subsets of the parameters
+    rng = random.Random(templateName)
+    for i in range(200):
+        sets.append({name: rng.choice(values + [f"value-{name}"]) for name in variables if complete or rng.random() < 0.7})
+    return sets
+
+
+@pytest.mark.parametrize("templateName, values, complete", [
+    ("pipelinerun-install", ["", "install", "ibm", "aws", True, False], False),
+    ("pipelinerun-update", ["", "x", True, False], False),
+    ("pipelinerun-upgrade", ["", "x", True, False], False),
+    # The uninstall template does not quote its values, so only produces the same objects when every parameter is
+    # a plain string (as they always are from launchUninstallPipeline)
+    ("pipelinerun-uninstall", ["none", "uninstall"], True),
+])
+def test_buildPipelineRun_golden(templateName, values, complete):
+    for params in paramSets(templateName, values, complete):
+        built = tekton.buildPipelineRun(templateName, params, TIMESTAMP)
+        rendered = tekton.buildPipelineRun(templateName, params, TIMESTAMP, useTemplate=True)
+        assert built == rendered, params
+
+
+def test_buildPipelineRun_builds_every_template_parameter():
+    for templateName in pipelinerun.PIPELINERUN_BUILDERS:
+        params = {name: f"value-{name}" for name in templateVariables(templateName)}
+        params.update(db2_action_system="install", kafka_action_system="install")
+        built = {p["value"] for p in tekton.buildPipelineRun(templateName, params, TIMESTAMP)["spec"]["params"]}
+        missing = {name for name in params if f"value-{name}" not in built and name not in ["db2_action_system", "kafka_action_system", "kafka_provider", "mongodb_provider"]}
+        # Parameters whose groups are mutually exclusive or selected by value
+        assert missing <= {
+            "vpc_id", "aws_kafka_user_name", "aws_kafka_user_password", "aws_msk_instance_type", "aws_msk_instance_number",
+            "aws_msk_volume_size", "aws_msk_cidr_az1", "aws_msk_cidr_az2", "aws_msk_cidr_az3", "aws_msk_ingress_cidr", "aws_msk_egress_cidr",
+            "eventstreams_resourcegroup", "eventstreams_name", "eventstreams_location", "eventstreams_retention",
+            "eventstreams_create_manage_jms_topics", "ibm_mongo_name", "ibm_mongo_resourcegroup", "ibm_mongo_region", "ibm_mongo_admin_password"
+        }, templateName
+
+
+def test_buildInstallPipelineRun():
+    pipelineRun = pipelinerun.buildInstallPipelineRun(dict(mas_instance_id="inst1", mas_channel="9.0.x", skip_pre_check=True), TIMESTAMP)
+    assert pipelineRun["metadata"] == dict(name="inst1-install-240101-1200", labels={"tekton.dev/pipeline": "mas-install"})
+    assert pipelineRun["spec"]["pipelineRef"] == dict(name="mas-install")
+    params = {p["name"]: p["value"] for p in pipelineRun["spec"]["params"]}
+    assert params["mas_instance_id"] == "inst1"
+    assert params["mas_channel"] == "9.0.x"
+    assert params["skip_pre_check"] == "True"
+    assert params["sls_channel"] == "3.x"
+    assert params["storage_class_rwx"] == ""
+    assert "image_pull_policy" not in params
+    assert [w["name"] for w in pipelineRun["spec"]["workspaces"]][0] == "shared-configs"
+
+    # Each PipelineRun gets its own copy of the workspaces
+    pipelineRun["spec"]["workspaces"][0]["persistentVolumeClaim"]["claimName"] = "changed"
+    assert pipelinerun.buildInstallPipelineRun({}, TIMESTAMP)["spec"]["workspaces"][0]["persistentVolumeClaim"]["claimName"] == "config-pvc"
+
+
+def test_buildPipelineRun_without_builder(mocker):
+    mockRender = mocker.patch("mas.devops.tekton.renderPipelineRun")
+    assert tekton.buildPipelineRun("pipelinerun-custom", dict(a="b"), TIMESTAMP) == mockRender.return_value
+    mockRender.assert_called_once_with("pipelinerun-custom", dict(a="b"), TIMESTAMP)
+
+
+def test_launchPipelineRun(mocker):
+    mockAPI = mocker.patch("mas.devops.tekton.getResourceAPI").return_value
+    timestamp = tekton.launchPipelineRun(mocker.MagicMock(), "mas-inst1-pipelines", "pipelinerun-install", dict(mas_instance_id="inst1"))
+
+    body = mockAPI.apply.call_args.kwargs["body"]
+    assert body["metadata"]["name"] == f"inst1-install-{timestamp}"
+    assert mockAPI.apply.call_args.kwargs["namespace"] == "mas-inst1-pipelines"
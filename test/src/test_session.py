@@ -0,0 +1,56 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import socket
+
+import pytest
+
+from kubernetes.config.config_exception import ConfigException
+
+from mas.devops import session
+
+
+def test_session_token(mocker):
+    mockCreateDynamicClient = mocker.patch("mas.devops.session.createDynamicClient")
+    mockLoadKubeConfig = mocker.patch("kubernetes.config.load_kube_config")
+
+    with session.ClusterSession("https://api.cluster1:6443", "sha256~token", skipVerify=True, poolSize=32) as clusterSession:
+        assert clusterSession.host == "https://api.cluster1:6443"
+        assert clusterSession.configuration.get_api_key_with_prefix("authorization") == "Bearer sha256~token"
+        assert clusterSession.configuration.verify_ssl is False
+        assert clusterSession.configuration.connection_pool_maxsize == 32
+        assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in clusterSession.configuration.socket_options
+
+        # Every view shares the session's ApiClient, and is only created once
+        assert clusterSession.coreV1Api.api_client is clusterSession.apiClient
+        assert clusterSession.customObjectsApi.api_client is clusterSession.apiClient
+        assert clusterSession.coreV1Api is clusterSession.coreV1Api
+        assert clusterSession.dynClient is clusterSession.dynClient
+        mockCreateDynamicClient.assert_called_once_with(clusterSession.apiClient)
+
+    mockLoadKubeConfig.assert_not_called()
+
+
+def test_session_kubeconfig(mocker):
+    mocker.patch("kubernetes.config.load_incluster_config", side_effect=ConfigException("not in a pod"))
+
+    def loadKubeConfig(context, client_configuration):
+        client_configuration.host = f"https://{context}:6443"
+    mockLoadKubeConfig = mocker.patch("kubernetes.config.load_kube_config", side_effect=loadKubeConfig)
+
+    clusterSession = session.ClusterSession(context="cluster2")
+    assert clusterSession.host == "https://cluster2:6443"
+    assert clusterSession.configuration.connection_pool_maxsize == session.SESSION_POOL_SIZE
+    mockLoadKubeConfig.assert_called_once()
+
+
+def test_session_incomplete_credentials():
+    with pytest.raises(ValueError):
+        session.ClusterSession(server="https://api.cluster1:6443")
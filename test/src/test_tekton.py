@@ -0,0 +1,370 @@
+# *****************************************************************************
+# Copyright (c) 2024 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+#
+# *****************************************************************************
+
+import os
+import threading
+import pytest
+import yaml
+
+from kubernetes.client import Configuration
+from kubernetes.dynamic.resource import ResourceInstance
+
+from mas.devops import tekton
+
+
+@pytest.fixture(autouse=True)
+def templateCacheDir(tmp_path, monkeypatch):
+    # Never write compiled templates (or any other cache) into the real ~/.cache/mas-devops
+    monkeypatch.setenv("MAS_DEVOPS_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(tekton, "_templateEnv", None)
+    return tmp_path / "jinja"
+
+
+def test_getTemplateEnvironment_cached(templateCacheDir):
+    env = tekton.getTemplateEnvironment()
+    assert tekton.getTemplateEnvironment() is env
+    assert env.get_template("pipelinerun-install.yml.j2") is env.get_template("pipelinerun-install.yml.j2")
+
+
+def test_precompileTemplates(templateCacheDir, monkeypatch):
+    templateNames = tekton.precompileTemplates()
+    assert "pipelinerun-install.yml.j2" in templateNames
+    assert len(os.listdir(templateCacheDir)) == len(templateNames)
+
+    # A new process loads the compiled templates from the bytecode cache instead of compiling them again
+    monkeypatch.setattr(tekton, "_templateEnv", None)
+    env = tekton.getTemplateEnvironment()
+    monkeypatch.setattr(env, "compile", None)
+    template = env.get_template("subscription.yml.j2")
+    assert "openshift-pipelines-operator-rh" in template.render(pipelines_channel="latest", pipelines_source="redhat-operators", pipelines_source_namespace="openshift-marketplace")
+
+
+def test_getTemplateEnvironment_unwritable_cache(templateCacheDir, mocker):
+    mocker.patch("jinja2.FileSystemBytecodeCache.dump_bytecode", side_effect=PermissionError("read-only file system"))
+    template = tekton.getTemplateEnvironment().get_template("subscription.yml.j2")
+    assert "openshift-pipelines-operator-rh" in template.render()
+
+
+def test_launchPipelineRuns(mocker):
+    mockGetResourceAPI = mocker.patch("mas.devops.tekton.getResourceAPI")
+    mockAPI = mockGetResourceAPI.return_value
+    mockConsoleURL = mocker.patch("mas.devops.tekton.getClusterFacts").return_value.consoleURL
+    mockConsoleURL.return_value = "https://console"
+
+    def apply(body, namespace):
+        if namespace == "mas-broken-pipelines":
+            raise Exception("forbidden")
+    mockAPI.apply.side_effect = apply
+
+    results = tekton.launchPipelineRuns(mocker.MagicMock(), "upgrade", [
+        dict(mas_instance_id="inst1", mas_channel="9.0.x"),
+        dict(mas_channel="9.0.x"),
+        dict(mas_instance_id="broken"),
+        dict(mas_instance_id="inst2", skip_pre_check=True),
+    ], maxWorkers=2)
+
+    timestamp = results[0]["pipelineRun"][len("inst1-upgrade-"):]
+    assert results == [
+        dict(instanceId="inst1", namespace="mas-inst1-pipelines", pipelineRun=f"inst1-upgrade-{timestamp}",
+             url=f"https://console/k8s/ns/mas-inst1-pipelines/tekton.dev~v1beta1~PipelineRun/inst1-upgrade-{timestamp}", error=None),
+        dict(instanceId=None, namespace=None, pipelineRun=None, url=None, error="mas_instance_id is required"),
+        dict(instanceId="broken", namespace="mas-broken-pipelines", pipelineRun=f"broken-upgrade-{timestamp}", url=None, error="forbidden"),
+        dict(instanceId="inst2", namespace="mas-inst2-pipelines", pipelineRun=f"inst2-upgrade-{timestamp}",
+             url=f"https://console/k8s/ns/mas-inst2-pipelines/tekton.dev~v1beta1~PipelineRun/inst2-upgrade-{timestamp}", error=None),
+    ]
+    assert mockAPI.apply.call_count == 3
+    assert mockGetResourceAPI.call_count == 1
+    assert mockConsoleURL.call_count == 1
+
+
+def test_launchPipelineRuns_without_console(mocker):
+    mockAPI = mocker.patch("mas.devops.tekton.getResourceAPI").return_value
+    mocker.patch("mas.devops.tekton.getClusterFacts").return_value.consoleURL.side_effect = Exception("route not found")
+
+    results = tekton.launchPipelineRuns(mocker.MagicMock(), "install", [dict(mas_instance_id="inst1")])
+
+    assert mockAPI.apply.call_count == 1
+    assert results[0]["error"] is None
+    assert results[0]["url"] is None
+
+
+def test_launchPipelineRuns_unsupported(mocker):
+    with pytest.raises(ValueError):
+        tekton.launchPipelineRuns(mocker.MagicMock(), "update", [dict(mas_instance_id="inst1")])
+
+
+def _run(kind: str, name: str, status: str = None, startTime: str = None, completionTime: str = None, reason: str = None, task: str = None) -> dict:
+    labels = {} if task is None else {"tekton.dev/pipelineRun": "inst1-upgrade-1", "tekton.dev/pipelineTask": task}
+    run = dict(kind=kind, metadata=dict(name=name, labels=labels, resourceVersion="2"), status=dict())
+    if startTime is not None:
+        run["status"]["startTime"] = startTime
+    if status is not None:
+        run["status"].update(completionTime=completionTime, conditions=[dict(type="Succeeded", status=status, reason=reason)])
+    return run
+
+
+def _runsAPI(mocker, kind: str, items: list, events: list):
+    """
+    A mock PipelineRun or TaskRun API that lists items, then returns events from the first watch and nothing after that
+    """
+    resourceAPI = mocker.MagicMock(kind=kind)
+    resourceAPI.get.return_value = ResourceInstance(None, dict(kind=f"{kind}List", apiVersion="tekton.dev/v1beta1", metadata=dict(resourceVersion="1"), items=items))
+    watched = threading.Event()
+
+    def watch(**kwargs):
+        if watched.is_set():
+            watched.wait(0.05)
+            return iter([])
+        watched.set()
+        return iter([dict(type=eventType, raw_object=run) for eventType, run in events])
+    resourceAPI.watch.side_effect = watch
+    return resourceAPI
+
+
+@pytest.fixture
+def mockRunsAPIs(mocker):
+    apis = {}
+    mocker.patch("mas.devops.tekton.getResourceAPI", side_effect=lambda dynClient, apiVersion, kind: apis[kind])
+    return apis
+
+
+def test_trackPipelineRun(mocker, mockRunsAPIs):
+    mockRunsAPIs["PipelineRun"] = _runsAPI(mocker, "PipelineRun", [], [
+        ("ADDED", _run("PipelineRun", "inst1-upgrade-1")),
+        ("MODIFIED", _run("PipelineRun", "inst1-upgrade-1", "Unknown", "2024-05-01T10:00:00Z", reason="Running")),
+        ("MODIFIED", _run("PipelineRun", "inst1-upgrade-1", "False", "2024-05-01T10:00:00Z", "2024-05-01T10:05:30Z", reason="Failed")),
+    ])
+    completedTaskRuns = [
+        _run("TaskRun", "inst1-upgrade-1-pre-check", "True", "2024-05-01T10:00:01Z", "2024-05-01T10:01:01Z", "Succeeded", task="pre-check"),
+        _run("TaskRun", "inst1-upgrade-1-upgrade", "False", "2024-05-01T10:01:05Z", "2024-05-01T10:05:25Z", "Failed", task="upgrade"),
+    ]
+    taskRunsAPI = _runsAPI(mocker, "TaskRun", [completedTaskRuns[0]], [
+        ("ADDED", _run("TaskRun", "inst1-upgrade-1-upgrade", "Unknown", "2024-05-01T10:01:05Z", reason="Running", task="upgrade")),
+    ])
+    # The final update to the upgrade TaskRun is only seen by listing the TaskRuns again once the PipelineRun finishes
+    taskRunsAPI.get.side_effect = [
+        ResourceInstance(None, dict(kind="TaskRunList", apiVersion="tekton.dev/v1beta1", metadata=dict(resourceVersion="1"), items=[completedTaskRuns[0]])),
+        ResourceInstance(None, dict(kind="TaskRunList", apiVersion="tekton.dev/v1beta1", metadata=dict(resourceVersion="9"), items=completedTaskRuns)),
+    ]
+    mockRunsAPIs["TaskRun"] = taskRunsAPI
+
+    events = list(tekton.trackPipelineRun(mocker.MagicMock(), "mas-inst1-pipelines", "inst1-upgrade-1", timeout=10))
+
+    assert [(e["type"], e["task"], e["duration"]) for e in events if e["task"] == "pre-check"] == [
+        (tekton.TASK_STARTED, "pre-check", None),
+        (tekton.TASK_SUCCEEDED, "pre-check", 60),
+    ]
+    assert [(e["type"], e["task"], e["duration"]) for e in events if e["task"] != "pre-check"] == [
+        (tekton.PIPELINERUN_STARTED, None, None),
+        (tekton.TASK_STARTED, "upgrade", None),
+        (tekton.TASK_FAILED, "upgrade", 260),
+        (tekton.PIPELINERUN_FAILED, None, 330),
+    ]
+    assert all(e["pipelineRun"] == "inst1-upgrade-1" for e in events)
+    assert mockRunsAPIs["PipelineRun"].get.call_args.kwargs == dict(namespace="mas-inst1-pipelines", field_selector="metadata.name=inst1-upgrade-1")
+    assert taskRunsAPI.watch.call_args_list[0].kwargs["label_selector"] == "tekton.dev/pipelineRun=inst1-upgrade-1"
+
+
+def test_waitForPipelineRun(mocker, mockRunsAPIs):
+    mockRunsAPIs["PipelineRun"] = _runsAPI(mocker, "PipelineRun", [
+        _run("PipelineRun", "inst1-upgrade-1", "True", "2024-05-01T10:00:00Z", "2024-05-01T10:02:00Z", "Succeeded"),
+    ], [])
+    mockRunsAPIs["TaskRun"] = _runsAPI(mocker, "TaskRun", [
+        _run("TaskRun", "inst1-upgrade-1-upgrade", "True", "2024-05-01T10:00:05Z", "2024-05-01T10:01:55Z", "Succeeded", task="upgrade"),
+    ], [])
+
+    assert tekton.waitForPipelineRun(mocker.MagicMock(), "mas-inst1-pipelines", "inst1-upgrade-1", timeout=10) == dict(
+        pipelineRun="inst1-upgrade-1", namespace="mas-inst1-pipelines", succeeded=True, reason="Succeeded", message=None, duration=120, tasks=[
+            dict(task="upgrade", taskRun="inst1-upgrade-1-upgrade", succeeded=True, reason="Succeeded", message=None, duration=110)
+        ]
+    )
+
+
+def test_waitForPipelineRun_timeout(mocker, mockRunsAPIs):
+    mockRunsAPIs["PipelineRun"] = _runsAPI(mocker, "PipelineRun", [
+        _run("PipelineRun", "inst1-upgrade-1", "Unknown", "2024-05-01T10:00:00Z", reason="Running"),
+    ], [])
+    mockRunsAPIs["TaskRun"] = _runsAPI(mocker, "TaskRun", [], [])
+
+    result = tekton.waitForPipelineRun(mocker.MagicMock(), "mas-inst1-pipelines", "inst1-upgrade-1", timeout=0.2)
+    assert result["succeeded"] is None
+    assert result["tasks"] == []
+
+
+def test_trackPipelineRun_watch_error(mocker, mockRunsAPIs):
+    mockRunsAPIs["PipelineRun"] = _runsAPI(mocker, "PipelineRun", [], [])
+    mockRunsAPIs["PipelineRun"].get.side_effect = Exception("forbidden")
+    mockRunsAPIs["TaskRun"] = _runsAPI(mocker, "TaskRun", [], [])
+
+    with pytest.raises(Exception, match="forbidden"):
+        list(tekton.trackPipelineRun(mocker.MagicMock(), "mas-inst1-pipelines", "inst1-upgrade-1", timeout=10))
+
+
+TEKTON_DEFINITIONS = """
+---
+apiVersion: tekton.dev/v1beta1
+kind: Task
+metadata:
+  name: mas-devops-suite-install
+spec:
+  steps:
+    - name: install
+      image: quay.io/ibmmas/cli:latest
+---
+apiVersion: tekton.dev/v1beta1
+kind: Pipeline
+metadata:
+  name: mas-install
+spec:
+  tasks:
+    - name: suite-install
+      taskRef:
+        name: mas-devops-suite-install
+---
+apiVersion: tekton.dev/v1beta1
+kind: Task
+metadata:
+  name: mas-devops-suite-upgrade
+spec:
+  steps:
+    - name: upgrade
+      image: quay.io/ibmmas/cli:latest
+"""
+
+
+@pytest.fixture
+def tektonDefinitions(tmp_path, mocker):
+    yamlFile = tmp_path / "ibm-mas-tekton.yaml"
+    yamlFile.write_text(TEKTON_DEFINITIONS)
+    apis = dict(Task=mocker.MagicMock(kind="Task", namespaced=True), Pipeline=mocker.MagicMock(kind="Pipeline", namespaced=True))
+    mockGetResourceAPI = mocker.patch("mas.devops.tekton.getResourceAPI", side_effect=lambda dynClient, apiVersion, kind: apis[kind])
+    return str(yamlFile), apis, mockGetResourceAPI
+
+
+def _existing(kind: str, items: list) -> ResourceInstance:
+    """
+    The result of listing existing resources, items being (name, definitionHash) pairs
+    """
+    return ResourceInstance(None, dict(kind=f"{kind}List", apiVersion="tekton.dev/v1beta1", metadata=dict(resourceVersion="1"), items=[
+        dict(metadata=dict(name=name, annotations={} if definitionHash is None else {tekton.DEFINITION_HASH_ANNOTATION: definitionHash}))
+        for name, definitionHash in items
+    ]))
+
+
+def test_updateTektonDefinitions(mocker, tektonDefinitions):
+    yamlFile, apis, mockGetResourceAPI = tektonDefinitions
+    suiteInstall, _, suiteUpgrade = yaml.safe_load_all(TEKTON_DEFINITIONS)
+    apis["Task"].get.return_value = _existing("Task", [
+        ("mas-devops-suite-install", tekton._definitionHash(suiteInstall)),
+        ("mas-devops-suite-upgrade", "outdated"),
+        ("mas-devops-removed", "outdated"),
+        ("user-task", None),
+    ])
+    apis["Pipeline"].get.return_value = _existing("Pipeline", [])
+
+    counts = tekton.updateTektonDefinitions("mas-pipelines", yamlFile, dynClient=mocker.MagicMock())
+
+    # Resources are grouped by kind, so each resource type is only looked up and listed once
+    assert mockGetResourceAPI.call_count == 2
+    assert apis["Task"].get.call_args_list == [mocker.call(namespace="mas-pipelines")]
+    # The unchanged Task is skipped, the outdated Task and the new Pipeline are applied, nothing is pruned by default
+    assert counts == dict(applied=2, unchanged=1, pruned=0)
+    assert apis["Task"].server_side_apply.call_count == 1
+    assert apis["Pipeline"].server_side_apply.call_count == 1
+    apis["Task"].delete.assert_not_called()
+    applied = apis["Task"].server_side_apply.call_args.kwargs
+    assert applied["body"]["metadata"] == dict(
+        name="mas-devops-suite-upgrade",
+        namespace="mas-pipelines",
+        annotations={tekton.DEFINITION_HASH_ANNOTATION: tekton._definitionHash(suiteUpgrade)}
+    )
+    assert applied["field_manager"] == "mas-devops"
+    assert applied["force_conflicts"] is True
+
+
+def test_updateTektonDefinitions_prune(mocker, tektonDefinitions):
+    yamlFile, apis, _ = tektonDefinitions
+    apis["Task"].get.return_value = _existing("Task", [
+        (definition["metadata"]["name"], tekton._definitionHash(definition))
+        for definition in yaml.safe_load_all(TEKTON_DEFINITIONS) if definition["kind"] == "Task"
+    ] + [("mas-devops-removed", "outdated"), ("user-task", None)])
+    apis["Pipeline"].get.return_value = _existing("Pipeline", [])
+
+    counts = tekton.updateTektonDefinitions("mas-pipelines", yamlFile, dynClient=mocker.MagicMock(), prune=True)
+
+    # Only resources we applied previously are pruned
+    assert counts == dict(applied=1, unchanged=2, pruned=1)
+    assert apis["Task"].delete.call_args_list == [mocker.call(name="mas-devops-removed", namespace="mas-pipelines")]
+
+
+def test_updateTektonDefinitions_failure(mocker, tektonDefinitions):
+    yamlFile, apis, _ = tektonDefinitions
+    apis["Task"].get.return_value = _existing("Task", [])
+    apis["Pipeline"].get.return_value = _existing("Pipeline", [])
+    apis["Task"].server_side_apply.side_effect = [Exception("admission webhook denied the request"), None]
+
+    with pytest.raises(Exception, match="Failed to update 1 tekton definitions in mas-pipelines"):
+        tekton.updateTektonDefinitions("mas-pipelines", yamlFile, dynClient=mocker.MagicMock())
+    # A failure does not stop the remaining definitions from being applied
+    assert apis["Task"].server_side_apply.call_count == 2
+    assert apis["Pipeline"].server_side_apply.call_count == 1
+
+
+def test_updateTektonDefinitions_default_client(mocker, tektonDefinitions):
+    yamlFile, apis, _ = tektonDefinitions
+    apis["Task"].get.return_value = _existing("Task", [])
+    apis["Pipeline"].get.return_value = _existing("Pipeline", [])
+    mockLoadConfiguration = mocker.patch("mas.devops.tekton.loadConfiguration", return_value=Configuration())
+    mockCreateDynamicClient = mocker.patch("mas.devops.tekton.createDynamicClient")
+
+    tekton.updateTektonDefinitions("mas-pipelines", yamlFile)
+
+    # Without a client we connect using the in-cluster configuration or kubeconfig, not the default Configuration
+    mockLoadConfiguration.assert_called_once_with()
+    k8s_client = mockCreateDynamicClient.call_args.args[0]
+    assert k8s_client.configuration is mockLoadConfiguration.return_value
+
+
+def test_prepareInstallSecrets(mocker, tmp_path):
+    licenseFile = tmp_path / "entitlement.lic"
+    licenseFile.write_text("license")
+    mockSyncSecrets = mocker.patch("mas.devops.tekton.syncSecrets", return_value=dict(created=4, updated=0, unchanged=0))
+    certs = dict(apiVersion="v1", kind="Secret", metadata=dict(name="pipeline-certificates"), stringData={"ca.crt": "cert"})
+
+    tekton.prepareInstallSecrets(mocker.MagicMock(), "inst1", str(licenseFile), certs=certs)
+
+    namespace, secrets = mockSyncSecrets.call_args.args[1:]
+    assert namespace == "mas-inst1-pipelines"
+    assert [secret["metadata"]["name"] for secret in secrets] == [
+        "pipeline-additional-configs", "pipeline-sls-entitlement", "pipeline-certificates", "pipeline-pod-templates"
+    ]
+    assert secrets[1]["data"] == {"entitlement.lic": "bGljZW5zZQ=="}
+    assert secrets[2] is certs
+
+
+def test_preparePipelinesNamespaces(mocker):
+    mockCreateNamespaces = mocker.patch("mas.devops.tekton.createNamespaces", return_value=dict(created=["Namespace/mas-inst1-pipelines"], existing=[]))
+    mockCreateResources = mocker.patch("mas.devops.tekton.createResources", return_value=dict(created=[], existing=[]))
+    mockWaitForPVCs = mocker.patch("mas.devops.tekton.waitForPVCs", return_value=[("mas-inst2-pipelines", "config-pvc")])
+
+    unbound = tekton.preparePipelinesNamespaces(None, ["inst1", "inst2"], storageClass="nfs", accessMode="ReadWriteMany", timeout=60)
+    assert unbound == ["mas-inst2-pipelines"]
+
+    mockCreateNamespaces.assert_called_once_with(None, ["mas-inst1-pipelines", "mas-inst2-pipelines"], maxWorkers=8)
+    resources = mockCreateResources.call_args.args[1]
+    assert [(resource["kind"], resource["metadata"]["name"]) for resource in resources] == [
+        ("ClusterRoleBinding", "ibm-mas-pipeline-inst1"),
+        ("PersistentVolumeClaim", "config-pvc"),
+        ("ClusterRoleBinding", "ibm-mas-pipeline-inst2"),
+        ("PersistentVolumeClaim", "config-pvc"),
+    ]
+    assert resources[3]["metadata"]["namespace"] == "mas-inst2-pipelines"
+    assert resources[3]["spec"]["storageClassName"] == "nfs"
+    mockWaitForPVCs.assert_called_once_with(None, [("mas-inst1-pipelines", "config-pvc"), ("mas-inst2-pipelines", "config-pvc")], timeout=60)